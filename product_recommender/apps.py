@@ -0,0 +1,9 @@
+from django.apps import AppConfig
+
+
+class ProductRecommenderConfig(AppConfig):
+    name = 'product_recommender'
+
+    def ready(self):
+        # connect the model signal handlers
+        from . import signals  # noqa: F401
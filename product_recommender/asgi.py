@@ -12,5 +12,12 @@ import os
 from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'product_recommender.settings')
+# Route the busiest views to their async versions (see ASYNC_VIEWS in settings.py)
+os.environ.setdefault('DJANGO_ASYNC_VIEWS', '1')
 
 application = get_asgi_application()
+
+# Load the offline recommendation models once per worker instead of on the first request
+from product_recommender.recommendation_engine.model_store import preload_models  # noqa: E402
+
+preload_models()
@@ -0,0 +1,2 @@
+# Batched loaders used by the populate_* management commands to write the Amazon data files to the database,
+# the set-based clean-up of products without reviews, and the columnar corpus snapshot the offline jobs read
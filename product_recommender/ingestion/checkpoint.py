@@ -0,0 +1,44 @@
+# A small JSON checkpoint file, so a long-running load can pick up where it stopped after a crash
+
+import json
+import os
+
+
+class Checkpoint:
+    """
+    Records how far a load through a source file has got.
+
+    The file is replaced atomically, so it always holds the last complete save.
+    A checkpoint saved for a different source file is ignored.
+
+    Args:
+        path: Where the checkpoint is written
+        source: The file being loaded, stored with the checkpoint
+    """
+
+    def __init__(self, path, source):
+        self.path = path
+        self.source = os.path.abspath(source)
+
+    def load(self):
+        """Returns the saved state, or None if there is no checkpoint for this source."""
+        try:
+            with open(self.path, 'r') as f:
+                state = json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+        if state.get('source') != self.source:
+            return None
+        return state
+
+    def save(self, **state):
+        state['source'] = self.source
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w') as f:
+            json.dump(state, f)
+        os.replace(temp_path, self.path)
+
+    def clear(self):
+        """Removes the checkpoint once the load has finished."""
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,105 @@
+# Set-based removal of the products that have no reviews
+# Product.objects.exclude(...).delete() makes Django's deletion collector load every product, and then every
+# related row, into memory to cascade and send signals. Here each batch is found with one anti-join
+# (NOT EXISTS on the indexed review foreign key), and the rows that refer to the batch are deleted with plain
+# DELETE statements before the products themselves, one transaction per batch. No model instances are built.
+# Nothing sends delete signals, so cached recommendations of the removed products age out with the cache TTL.
+
+import time
+
+from django.db import connection, transaction
+
+from ..models import Feedback, Product, RecommendationPerformance, Review, Summary, SummaryProgress
+
+# Products per batch - every id is a query parameter, and older SQLite builds allow 999 per statement
+DEFAULT_BATCH_SIZE = 500
+
+# (stats key, model, foreign key field) for every table with a foreign key to Product, except Review
+DEPENDENTS = [
+    ('summaries', Summary, 'product_id'),
+    ('performance', RecommendationPerformance, 'product_id'),
+    ('feedback', Feedback, 'initial_product_id'),
+    ('summary_progress', SummaryProgress, 'product_id'),
+]
+
+
+def _table(model):
+    return connection.ops.quote_name(model._meta.db_table)
+
+
+def _column(model, field):
+    return connection.ops.quote_name(model._meta.get_field(field).column)
+
+
+def _no_reviews(alias, column):
+    """SQL condition that is true when the product id in alias.column has no reviews."""
+    return (f"NOT EXISTS (SELECT 1 FROM {_table(Review)} r "
+            f"WHERE r.{_column(Review, 'product_id')} = {alias}.{column})")
+
+
+def count_products_without_reviews():
+    """Counts the products without reviews, and the rows of each dependent table that refer to them."""
+    product_pk = _column(Product, 'product_id')
+    counts = {}
+    with connection.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*) FROM {_table(Product)} p WHERE {_no_reviews('p', product_pk)}")
+        counts['products'] = cursor.fetchone()[0]
+        for key, model, field in DEPENDENTS:
+            # a dependent row can only refer to an existing product, so checking its own foreign key is enough
+            cursor.execute(f"SELECT COUNT(*) FROM {_table(model)} d WHERE {_no_reviews('d', _column(model, field))}")
+            counts[key] = cursor.fetchone()[0]
+    return counts
+
+
+def remove_products_without_reviews(batch_size=DEFAULT_BATCH_SIZE, on_batch=None):
+    """
+    Deletes every product without reviews, with its summaries, recommendation timings, feedback and
+    summary generation progress.
+
+    Args:
+        batch_size: Products deleted per batch and transaction
+        on_batch: Optional callable(stats) called after every committed batch
+
+    Returns:
+        A dict of rows deleted per table, the number of batches and the seconds taken.
+    """
+    product_pk = _column(Product, 'product_id')
+    stats = {'products': 0, **{key: 0 for key, _, _ in DEPENDENTS}, 'batches': 0}
+    start_time = time.time()
+    last_id = ''
+
+    while True:
+        with transaction.atomic(), connection.cursor() as cursor:
+            # keyset pagination, so every batch is an index range scan rather than a rescan from the start
+            cursor.execute(
+                f"SELECT p.{product_pk} FROM {_table(Product)} p "
+                f"WHERE p.{product_pk} > %s AND {_no_reviews('p', product_pk)} "
+                f"ORDER BY p.{product_pk} LIMIT %s",
+                [last_id, batch_size],
+            )
+            product_ids = [row[0] for row in cursor.fetchall()]
+            if not product_ids:
+                break
+            last_id = product_ids[-1]
+
+            placeholders = ', '.join(['%s'] * len(product_ids))
+            for key, model, field in DEPENDENTS:
+                column = _column(model, field)
+                # the anti-join is repeated so a product that got a review since the SELECT is left alone
+                cursor.execute(
+                    f"DELETE FROM {_table(model)} WHERE {column} IN ({placeholders}) "
+                    f"AND {_no_reviews(_table(model), column)}",
+                    product_ids,
+                )
+                stats[key] += cursor.rowcount
+            cursor.execute(
+                f"DELETE FROM {_table(Product)} WHERE {product_pk} IN ({placeholders}) "
+                f"AND {_no_reviews(_table(Product), product_pk)}",
+                product_ids,
+            )
+            stats['products'] += cursor.rowcount
+        stats['batches'] += 1
+        if on_batch is not None:
+            on_batch(dict(stats, seconds=time.time() - start_time))
+
+    return dict(stats, seconds=time.time() - start_time)
@@ -0,0 +1,159 @@
+# Converts the raw Amazon gzip dumps into gzip-compressed JSON Lines
+# Each line of the dumps is a Python dict literal (single quotes, True/False/None), which is not JSON.
+# Lines are converted without eval. The fast path rewrites the Python literal's quotes and True/False/None as
+# JSON and checks the result parses with json.loads. Anything that doesn't survive that (e.g. a \x escape)
+# falls back to ast.literal_eval, which accepts any Python literal but never runs code.
+# Lines are read in chunks and parsed by a pool of worker processes. Chunks are written back in the order
+# they were read, and only a few chunks are in flight at a time, so memory stays bounded on multi-GB dumps.
+
+import ast
+import gzip
+import json
+import os
+import re
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+DEFAULT_CHUNK_LINES = 20000
+# Compression level for the output - level 9 (gzip's default) costs several times the CPU for a slightly smaller file
+OUTPUT_COMPRESSLEVEL = 5
+# Parse errors kept per chunk, so a badly broken file can't fill memory with error messages
+MAX_ERRORS_PER_CHUNK = 10
+
+
+# A single- or double-quoted Python string, with backslash escapes
+_PYTHON_STRING = re.compile(r"""('[^'\\]*(?:\\.[^'\\]*)*'|"[^"\\]*(?:\\.[^"\\]*)*")""")
+
+
+def _json_constants(text):
+    # only called on the text between strings, where these can only be the Python constants
+    return text.replace('True', 'true').replace('False', 'false').replace('None', 'null')
+
+
+def python_literal_to_json(line):
+    """
+    Rewrites a Python dict literal as JSON text, without parsing it.
+    The result isn't guaranteed to be valid JSON (e.g. a \\x escape is kept), so it must still be parsed.
+    """
+    has_constants = 'True' in line or 'False' in line or 'None' in line
+    if '"' not in line and '\\' not in line:
+        # the common case - every string is single-quoted without escapes, so every ' is a string delimiter
+        parts = line.split("'")
+        if has_constants:
+            parts[0::2] = [_json_constants(part) for part in parts[0::2]]
+        return '"'.join(parts)
+
+    # odd tokens are strings and even tokens are the text between them
+    tokens = _PYTHON_STRING.split(line)
+    # inside single quotes a ' is escaped and a " isn't - JSON is the other way round
+    tokens[1::2] = [
+        token if token[0] == '"' else '"' + token[1:-1].replace("\\'", "'").replace('"', '\\"') + '"'
+        for token in tokens[1::2]
+    ]
+    if has_constants:
+        tokens[0::2] = [_json_constants(token) for token in tokens[0::2]]
+    return ''.join(tokens)
+
+
+def parse_line(line):
+    """Parses one line of a dump into a dict."""
+    try:
+        return json.loads(python_literal_to_json(line))
+    except ValueError:
+        return ast.literal_eval(line)
+
+
+def convert_line(line):
+    """Converts one line of a dump to a line of JSON."""
+    json_text = python_literal_to_json(line)
+    try:
+        # parsing checks the rewrite - it is written out as it is, as the separators already match json.dumps
+        json.loads(json_text)
+        return json_text
+    except ValueError:
+        return json.dumps(ast.literal_eval(line))
+
+
+def convert_chunk(first_line_number, lines):
+    """
+    Parses a chunk of raw lines and re-serializes them as JSON.
+
+    Returns:
+        (JSON Lines text for the chunk, number of lines that failed, the first few failures as
+        (line number, error, line) tuples)
+    """
+    output = []
+    failed = 0
+    errors = []
+    for line_number, raw_line in enumerate(lines, start=first_line_number):
+        line = raw_line.decode('utf-8').strip()
+        if not line:
+            continue
+        try:
+            output.append(convert_line(line))
+        except Exception as e:
+            failed += 1
+            if len(errors) < MAX_ERRORS_PER_CHUNK:
+                errors.append((line_number, str(e), line[:200]))
+    return ''.join(record + '\n' for record in output), failed, errors
+
+
+def _chunks(lines, chunk_lines):
+    chunk = []
+    first_line_number = 1
+    for line_number, line in enumerate(lines, start=1):
+        chunk.append(line)
+        if len(chunk) == chunk_lines:
+            yield first_line_number, chunk
+            chunk = []
+            first_line_number = line_number + 1
+    if chunk:
+        yield first_line_number, chunk
+
+
+def convert_file(input_path, output_path, workers=None, chunk_lines=DEFAULT_CHUNK_LINES, on_error=None):
+    """
+    Converts a gzip dump of Python-literal lines to gzip JSON Lines, preserving the line order.
+
+    Args:
+        input_path: The .json.gz dump
+        output_path: The .jsonl.gz file to write
+        workers: Worker processes, defaults to every core. 1 parses in this process.
+        chunk_lines: Lines sent to a worker at a time
+        on_error: Optional callable(line_number, error, line) for lines that can't be parsed
+
+    Returns:
+        A dict with the lines written, the lines that failed and the seconds taken.
+    """
+    workers = workers or os.cpu_count() or 1
+    stats = {'written': 0, 'failed': 0}
+    start_time = time.time()
+
+    def write(result):
+        text, failed, errors = result
+        f.write(text)
+        stats['written'] += text.count('\n')
+        stats['failed'] += failed
+        if on_error is not None:
+            for error in errors:
+                on_error(*error)
+
+    with gzip.open(input_path, 'rb') as g, gzip.open(output_path, 'wt', encoding='utf-8',
+                                                      compresslevel=OUTPUT_COMPRESSLEVEL) as f:
+        chunks = _chunks(g, chunk_lines)
+        if workers == 1:
+            for first_line_number, lines in chunks:
+                write(convert_chunk(first_line_number, lines))
+        else:
+            with ProcessPoolExecutor(max_workers=workers) as executor:
+                # a bounded window of chunks in flight, written back in submission order
+                pending = deque()
+                for first_line_number, lines in chunks:
+                    pending.append(executor.submit(convert_chunk, first_line_number, lines))
+                    if len(pending) >= workers * 2:
+                        write(pending.popleft().result())
+                while pending:
+                    write(pending.popleft().result())
+
+    return dict(stats, seconds=time.time() - start_time)
@@ -0,0 +1,101 @@
+# Batched product loader
+# The processed metadata file is streamed. Each record is checked against the title and
+# category filters before a Product is built, and the products are upserted in batches with
+# bulk_create(update_conflicts=True) - one INSERT ... ON CONFLICT DO UPDATE per batch instead of a
+# SELECT plus an INSERT or UPDATE per product.
+
+import time
+from itertools import islice
+
+from django.db import transaction
+
+from ..models import Product
+from .records import read_records
+
+DEFAULT_BATCH_SIZE = 2000
+CATEGORY = 'Home & Kitchen'
+UPDATE_FIELDS = ['name', 'image_url', 'price']
+
+
+def in_category(record, category=CATEGORY):
+    """True if any of the record's category paths includes the category."""
+    categories = record.get('categories')
+    return bool(categories) and any(category in sublist for sublist in categories)
+
+
+def product_from_record(record):
+    """Builds an unsaved Product from one record of the processed metadata file."""
+    if record.get('price') is None or record.get('imUrl') is None:
+        # both columns are NOT NULL - one bad row would fail the whole batch
+        raise ValueError(f"missing price or imUrl for {record.get('asin')}")
+    return Product(
+        product_id=record.get('asin'),
+        name=record.get('title'),
+        image_url=record.get('imUrl'),
+        price=record.get('price'),
+    )
+
+
+def upsert_products(products, batch_size=DEFAULT_BATCH_SIZE):
+    """Inserts the products, updating the name, image and price of any that already exist."""
+    # a row can only be upserted once per statement, so the last record for a product wins (as update_or_create did)
+    unique = list({product.product_id: product for product in products}.values())
+    with transaction.atomic():
+        Product.objects.bulk_create(
+            unique,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=['product_id'],
+            update_fields=UPDATE_FIELDS,
+        )
+    return len(unique)
+
+
+def load_products(file_path, batch_size=DEFAULT_BATCH_SIZE, on_batch=None, on_error=None):
+    """
+    Loads the processed metadata file into the Product table.
+
+    Args:
+        file_path: The file written by clean_metadata_and_write_new_file
+        batch_size: Products per upsert statement and transaction
+        on_batch: Optional callable(stats) called after every batch
+        on_error: Optional callable(record, exception) for records that can't be turned into a Product
+
+    Returns:
+        A dict of counts: records read, products upserted, skipped (no title / other category), errors, and seconds.
+    """
+    stats = {'records': 0, 'products': 0, 'skipped_title': 0, 'skipped_category': 0, 'errors': 0}
+    start_time = time.time()
+
+    def on_line_error(line_number, e, line):
+        stats['errors'] += 1
+        if on_error is not None:
+            on_error({'line': line_number, 'text': line}, e)
+
+    records = read_records(file_path, on_error=on_line_error)
+    while True:
+        chunk = list(islice(records, batch_size))
+        if not chunk:
+            break
+
+        products = []
+        for record in chunk:
+            if 'title' not in record:
+                stats['skipped_title'] += 1
+                continue
+            if not in_category(record):
+                stats['skipped_category'] += 1
+                continue
+            try:
+                products.append(product_from_record(record))
+            except Exception as e:
+                stats['errors'] += 1
+                if on_error is not None:
+                    on_error(record, e)
+
+        stats['products'] += upsert_products(products, batch_size)
+        stats['records'] += len(chunk)
+        if on_batch is not None:
+            on_batch(dict(stats, seconds=time.time() - start_time))
+
+    return dict(stats, seconds=time.time() - start_time)
@@ -0,0 +1,38 @@
+# Reading the data files - the raw Amazon dumps, or the processed files written by the clean_* commands
+
+import gzip
+import json
+
+import ijson
+
+from .convert import parse_line
+
+
+def read_records(file_path, on_error=None):
+    """
+    Streams the records of a data file, one dict at a time.
+    Reads gzip JSON Lines (.jsonl.gz), plain JSON Lines (.jsonl), a JSON array (.json) as written by earlier
+    versions of the clean_* commands, or a raw dump of Python dict literals (.json.gz) straight from the source.
+    Lines of a raw dump that can't be parsed are skipped and passed to on_error(line_number, error, line).
+    """
+    if file_path.endswith('.json.gz'):
+        with gzip.open(file_path, 'rt', encoding='utf-8') as g:
+            for line_number, line in enumerate(g, start=1):
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield parse_line(line)
+                except Exception as e:
+                    if on_error is not None:
+                        on_error(line_number, e, line[:200])
+    elif file_path.endswith('.jsonl.gz') or file_path.endswith('.jsonl'):
+        opener = gzip.open if file_path.endswith('.gz') else open
+        with opener(file_path, 'rt', encoding='utf-8') as f:
+            for line in f:
+                if line.strip():
+                    yield json.loads(line)
+    else:
+        with open(file_path, 'rb') as f:
+            # floats rather than Decimals, the same as the JSON Lines files
+            yield from ijson.items(f, 'item', use_float=True)
@@ -0,0 +1,39 @@
+# Keeps the denormalized review statistics on Product (review_count, avg_score, has_summary) up to date
+# They are recomputed from the Review and Summary tables with one UPDATE per batch of products - correlated
+# subqueries on the (product, score) index - rather than by loading any rows into Python.
+# The review loaders call this for the products of every batch they write, and signals.py for single writes.
+
+from django.db.models import Avg, Count, Exists, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from ..models import Product, Review, Summary
+
+# Product ids per UPDATE - every id is a query parameter, and older SQLite builds allow 999 per statement
+BATCH_SIZE = 500
+
+
+def product_stats():
+    """The expressions computing each denormalized field from the product's reviews and summary."""
+    reviews = Review.objects.filter(product_id=OuterRef('pk')).order_by().values('product_id')
+    return {
+        'review_count': Coalesce(Subquery(reviews.annotate(count=Count('id')).values('count')), 0),
+        'avg_score': Subquery(reviews.annotate(avg=Avg('review_score')).values('avg')),
+        'has_summary': Exists(Summary.objects.filter(product_id=OuterRef('pk'))),
+    }
+
+
+def update_product_stats(product_ids=None):
+    """
+    Recomputes review_count, avg_score and has_summary for the given products, or for every product.
+
+    Returns:
+        The number of products updated.
+    """
+    if product_ids is None:
+        return Product.objects.update(**product_stats())
+
+    product_ids = list(product_ids)
+    updated = 0
+    for start in range(0, len(product_ids), BATCH_SIZE):
+        updated += Product.objects.filter(pk__in=product_ids[start:start + BATCH_SIZE]).update(**product_stats())
+    return updated
@@ -0,0 +1,179 @@
+# Batched review loader
+# The processed reviews file is streamed, so only one batch of reviews is held in memory.
+# Reviews are matched to products by ASIN against a set of the product ids loaded once up front, and
+# built with product_id_id directly, so no Product is fetched per review. They are written with
+# bulk_create, a transaction at a time. The checkpoint is saved twice per transaction: just before the commit,
+# naming the ids the transaction wrote, and again after it. A run that dies between the commit and the second save
+# is resumed by deleting exactly those reviews and reading their records again, so no review is loaded twice and
+# reviews written by anyone else are left alone. The checkpoint also keeps the id ranges of every committed
+# transaction, so a load restarted from the beginning can first remove exactly the reviews it had written.
+# bulk_create sends no signals, so the review statistics of the products in each transaction are updated with it.
+
+import time
+from itertools import islice
+
+from django.db import NotSupportedError, connection, transaction
+
+from ..models import Product, Review
+from .records import read_records
+from .review_stats import update_product_stats
+
+DEFAULT_BATCH_SIZE = 2000
+DEFAULT_TRANSACTION_SIZE = 50000
+
+
+def review_from_record(record):
+    """Builds an unsaved Review from one record of the processed reviews file."""
+    return Review(
+        product_id_id=record.get('asin'),
+        review_id=record.get('unixReviewTime'),
+        review_title=record.get('summary'),
+        review_username=record.get('reviewerName', 'default user'),
+        review_score=int(record.get('overall', 1)),  # Default to 1 if missing
+        review_text=record.get('reviewText'),
+        created_at_unix=record.get('unixReviewTime'),
+    )
+
+
+def remove_reviews(first_id, last_id):
+    """
+    Deletes the reviews with ids from first_id to last_id with a plain DELETE - the ORM would fetch every row and
+    send a delete signal per review - then updates their products' review statistics once.
+    """
+    reviews = Review.objects.filter(id__gte=first_id, id__lte=last_id)
+    with transaction.atomic():
+        product_ids = set(reviews.values_list('product_id', flat=True).distinct())
+        with connection.cursor() as cursor:
+            cursor.execute(f"DELETE FROM {Review._meta.db_table} WHERE id BETWEEN %s AND %s", [first_id, last_id])
+            removed = cursor.rowcount
+        update_product_stats(product_ids)
+    return removed
+
+
+def discard_load(checkpoint):
+    """
+    Removes the reviews written by the interrupted load the checkpoint belongs to, then clears the checkpoint,
+    so the file can be loaded again from the start without inserting its reviews twice.
+
+    Returns:
+        The number of reviews removed.
+
+    Raises:
+        ValueError: If the checkpoint has reviews written but predates the id ranges being recorded
+    """
+    state = checkpoint.load()
+    if state is None:
+        return 0
+    if state['reviews'] and 'loaded_ids' not in state:
+        raise ValueError(f"The checkpoint for {checkpoint.source} does not record which reviews it wrote - "
+                         f"resume the load instead, or remove its {state['reviews']} reviews by hand")
+    id_ranges = list(state.get('loaded_ids', []))
+    if state.get('pending_ids'):
+        id_ranges.append(state['pending_ids'])
+    with transaction.atomic():
+        removed = sum(remove_reviews(first_id, last_id) for first_id, last_id in id_ranges)
+    checkpoint.clear()
+    return removed
+
+
+def load_reviews(file_path, checkpoint, batch_size=DEFAULT_BATCH_SIZE, transaction_size=DEFAULT_TRANSACTION_SIZE,
+                 on_commit=None, on_error=None):
+    """
+    Loads the processed reviews file into the Review table, resuming from the checkpoint if there is one.
+
+    Args:
+        file_path: The file written by clean_reviews_and_write_new_file
+        checkpoint: A Checkpoint, saved around every transaction and cleared when the file is done
+        batch_size: Reviews per bulk_create INSERT
+        transaction_size: Records read per transaction (and so between checkpoints)
+        on_commit: Optional callable(stats) called after every committed transaction
+        on_error: Optional callable(record, exception) for records that can't be turned into a Review
+
+    Returns:
+        A dict of counts across every run over the file: records read, reviews written, skipped (unknown ASIN)
+        and errors, plus the reviews written and the seconds taken by this run.
+    """
+    if not connection.features.can_return_rows_from_bulk_insert:
+        # the checkpoint names the ids each transaction wrote, which bulk_create only sets where the INSERT returns them
+        raise NotSupportedError(f"Loading reviews needs a database that returns the ids of bulk inserted rows, "
+                                f"{connection.vendor} does not")
+
+    existing_asins = set(Product.objects.values_list('product_id', flat=True))
+
+    stats = {'records': 0, 'reviews': 0, 'skipped': 0, 'errors': 0}
+    # [first id, last id] of the reviews written by each committed transaction
+    loaded_ids = []
+    state = checkpoint.load()
+    if state is not None:
+        # the last transaction may have committed after the checkpoint naming its reviews was saved - remove
+        # them, their records are read again from the file below. If it rolled back, there is nothing to remove
+        if state.get('pending_ids'):
+            remove_reviews(*state['pending_ids'])
+        stats.update({key: state[key] for key in stats})
+        loaded_ids = state.get('loaded_ids', [])
+    resumed_reviews = stats['reviews']
+
+    start_time = time.time()
+    skipping = True
+    # the current chunk's counts - only added to stats once its transaction has committed, so a checkpoint never
+    # counts records that a resumed run reads again
+    chunk_stats = {'skipped': 0, 'errors': 0}
+
+    def on_line_error(line_number, e, line):
+        # lines before the checkpoint were counted by the run that read them
+        if skipping:
+            return
+        chunk_stats['errors'] += 1
+        if on_error is not None:
+            on_error({'line': line_number, 'text': line}, e)
+
+    records = read_records(file_path, on_error=on_line_error)
+    # the reviews in records before the checkpoint are already in the database
+    for _ in islice(records, stats['records']):
+        pass
+    skipping = False
+
+    while True:
+        chunk_stats.update(skipped=0, errors=0)
+        chunk = list(islice(records, transaction_size))
+        if not chunk:
+            break
+
+        reviews = []
+        for record in chunk:
+            try:
+                if record.get('asin') not in existing_asins:
+                    chunk_stats['skipped'] += 1
+                    continue
+                reviews.append(review_from_record(record))
+            except Exception as e:
+                chunk_stats['errors'] += 1
+                if on_error is not None:
+                    on_error(record, e)
+
+        with transaction.atomic():
+            Review.objects.bulk_create(reviews, batch_size=batch_size)
+            update_product_stats({review.product_id_id for review in reviews})
+            if reviews:
+                # saved before the commit, so there is never a committed transaction the checkpoint doesn't know
+                # - with the counts from before the chunk, as a resumed run reads it again
+                review_ids = [review.pk for review in reviews]
+                pending_ids = [min(review_ids), max(review_ids)]
+                checkpoint.save(pending_ids=pending_ids, loaded_ids=loaded_ids, **stats)
+        if reviews:
+            if loaded_ids and loaded_ids[-1][1] + 1 == pending_ids[0]:
+                # usually each transaction carries on from the last one's ids
+                loaded_ids[-1][1] = pending_ids[1]
+            else:
+                loaded_ids.append(pending_ids)
+        stats['records'] += len(chunk)
+        stats['reviews'] += len(reviews)
+        stats['skipped'] += chunk_stats['skipped']
+        stats['errors'] += chunk_stats['errors']
+
+        checkpoint.save(pending_ids=None, loaded_ids=loaded_ids, **stats)
+        if on_commit is not None:
+            on_commit(dict(stats, written=stats['reviews'] - resumed_reviews, seconds=time.time() - start_time))
+
+    checkpoint.clear()
+    return dict(stats, written=stats['reviews'] - resumed_reviews, seconds=time.time() - start_time)
@@ -0,0 +1,490 @@
+# Columnar snapshot of the products, reviews and summaries for the offline jobs
+# The model builders and the summarizer read the whole corpus in product order. Reading it from a snapshot
+# instead of SQLite turns millions of row fetches into slices of memory-mapped arrays.
+#
+# A snapshot is a directory with one sub-directory per table and one file per column:
+#   <column>.npy                        numeric columns, written in chunks into a preallocated .npy
+#   <column>.bin + <column>.offsets.npy text columns - every value's UTF-8 bytes back to back, and the n + 1 offsets
+#                                       of where each value starts (value i is bin[offsets[i]:offsets[i + 1]])
+#   <column>.nulls.npy                  for nullable columns, True where the value is NULL
+# Reviews are written in (product, id) order and products/review_offsets.npy holds where each product's reviews
+# start, so a product's reviews are one contiguous slice. Every file is opened with mmap, so nothing is read
+# until it is used and the pages are shared through the OS page cache.
+#
+# meta.json records a fingerprint of the tables at export time. current_snapshot() only hands out a snapshot
+# whose fingerprint still matches the database, so the offline jobs never read stale data.
+
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import datetime, timedelta, timezone
+from decimal import Decimal
+from itertools import islice
+from pathlib import Path
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Count, Max, Q
+
+from ..models import Product, Review, Summary
+
+logger = logging.getLogger(__name__)
+
+META_FILE = 'meta.json'
+# Rows fetched from the database and written to the column files at a time
+CHUNK_ROWS = 50000
+TABLES = ('products', 'reviews', 'summaries')
+
+# (column, type, nullable) per table - 'text' columns are stored as bytes + offsets, the rest as .npy of that dtype
+PRODUCT_COLUMNS = [
+    ('product_id', 'text', False),
+    ('name', 'text', False),
+    ('image_url', 'text', False),
+    ('price', 'float64', False),
+]
+REVIEW_COLUMNS = [
+    ('id', 'int64', False),
+    ('product', 'int32', False),  # row of the product in the products table
+    ('review_id', 'int64', False),
+    ('review_title', 'text', True),
+    ('review_username', 'text', False),
+    ('review_score', 'int8', False),
+    ('review_text', 'text', True),
+    ('created_at_unix', 'int64', True),
+]
+SUMMARY_COLUMNS = [
+    ('id', 'int64', False),
+    ('product', 'int32', False),
+    ('positive_sentiment', 'text', True),
+    ('negative_sentiment', 'text', True),
+    ('source_review_count', 'int64', True),
+    ('source_max_created_at', 'int64', True),
+    ('source_hash', 'text', True),
+    ('updated_at', 'int64', True),  # microseconds since the epoch
+]
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+
+class SnapshotError(Exception):
+    pass
+
+
+def snapshot_dir():
+    """Returns the directory the offline jobs read the snapshot from."""
+    return Path(settings.CORPUS_SNAPSHOT_DIR)
+
+
+def corpus_fingerprint():
+    """A cheap fingerprint of each table, used to tell when a snapshot no longer matches the database."""
+    reviews = Review.objects.aggregate(count=Count('id'), max_id=Max('id'))
+    summaries = Summary.objects.aggregate(
+        count=Count('id'),
+        max_id=Max('id'),
+        # summaries are filled and rewritten in place, so count the complete ones and take the latest save as well
+        complete=Count('id', filter=Q(positive_sentiment__isnull=False, negative_sentiment__isnull=False)),
+        updated_at=Max('updated_at'),
+    )
+    updated_at = summaries['updated_at'].isoformat() if summaries['updated_at'] else None
+    return {
+        'products': [Product.objects.count()],
+        'reviews': [reviews['count'], reviews['max_id']],
+        'summaries': [summaries['count'], summaries['max_id'], summaries['complete'], updated_at],
+    }
+
+
+def _to_micros(value):
+    return None if value is None else (value - EPOCH) // timedelta(microseconds=1)
+
+
+def _from_micros(value):
+    return None if value is None else EPOCH + timedelta(microseconds=value)
+
+
+# Writing
+
+class _ColumnWriter:
+    """Writes one column of a table a chunk at a time, into files sized up front for num_rows values."""
+
+    def __init__(self, directory, name, kind, nullable, num_rows):
+        self.kind = kind
+        self.row = 0
+        self.nulls = None
+        if nullable:
+            self.nulls = np.lib.format.open_memmap(
+                directory / f"{name}.nulls.npy", mode='w+', dtype=np.bool_, shape=(num_rows,),
+            )
+        if kind == 'text':
+            self.file = open(directory / f"{name}.bin", 'wb')
+            self.position = 0
+            self.values = np.lib.format.open_memmap(
+                directory / f"{name}.offsets.npy", mode='w+', dtype=np.int64, shape=(num_rows + 1,),
+            )
+            self.values[0] = 0
+        else:
+            self.values = np.lib.format.open_memmap(
+                directory / f"{name}.npy", mode='w+', dtype=np.dtype(kind), shape=(num_rows,),
+            )
+
+    def extend(self, values):
+        start, end = self.row, self.row + len(values)
+        if self.nulls is not None:
+            self.nulls[start:end] = [value is None for value in values]
+        if self.kind == 'text':
+            encoded = [value.encode('utf-8') if value is not None else b'' for value in values]
+            lengths = np.fromiter(map(len, encoded), dtype=np.int64, count=len(encoded))
+            self.values[start + 1:end + 1] = self.position + np.cumsum(lengths)
+            self.file.write(b''.join(encoded))
+            self.position += int(lengths.sum())
+        else:
+            self.values[start:end] = [0 if value is None else value for value in values]
+        self.row = end
+
+    def close(self):
+        if self.kind == 'text':
+            self.file.close()
+        for array in (self.values, self.nulls):
+            if array is not None:
+                array.flush()
+
+
+def _write_table(directory, columns, rows, num_rows):
+    """Writes rows (tuples in column order) as one file per column, and returns the table's metadata."""
+    directory.mkdir()
+    writers = [_ColumnWriter(directory, name, kind, nullable, num_rows) for name, kind, nullable in columns]
+    written = 0
+    try:
+        while True:
+            chunk = list(islice(rows, CHUNK_ROWS))
+            if not chunk:
+                break
+            if written + len(chunk) > num_rows:
+                raise SnapshotError(f"{directory.name} changed while the snapshot was written")
+            for writer, values in zip(writers, zip(*chunk)):
+                writer.extend(values)
+            written += len(chunk)
+    finally:
+        for writer in writers:
+            writer.close()
+    if written != num_rows:
+        raise SnapshotError(f"{directory.name} changed while the snapshot was written")
+    return {
+        'rows': num_rows,
+        'columns': {name: {'type': kind, 'nullable': nullable} for name, kind, nullable in columns},
+    }
+
+
+def _rows_with_product(rows, product_rows):
+    """Replaces the product id in the second position of each row with the product's row number."""
+    for row in rows:
+        try:
+            yield (row[0], product_rows[row[1]], *row[2:])
+        except KeyError:
+            raise SnapshotError(f"row {row[0]} belongs to product {row[1]}, which isn't in the products table")
+
+
+def write_snapshot(path=None, on_table=None):
+    """
+    Exports the Product, Review and Summary tables to a columnar snapshot.
+    The snapshot is written next to path and moved into place once it is complete, so a job reading
+    the previous snapshot is never handed a half-written one.
+
+    Args:
+        path: The snapshot directory, defaults to CORPUS_SNAPSHOT_DIR
+        on_table: Optional callable(table name, rows) called as each table is written
+
+    Returns:
+        The snapshot's metadata.
+    """
+    path = Path(path) if path is not None else snapshot_dir()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    staging = path.with_name(f".{path.name}.tmp")
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir()
+
+    start_time = time.time()
+    tables = {}
+    # one read transaction, so the tables are consistent with each other and with the fingerprint
+    with transaction.atomic():
+        fingerprint = corpus_fingerprint()
+
+        product_ids = list(Product.objects.order_by('product_id').values_list('product_id', flat=True))
+        product_rows = {product_id: row for row, product_id in enumerate(product_ids)}
+        products = Product.objects.order_by('product_id').values_list('product_id', 'name', 'image_url', 'price')
+        tables['products'] = _write_table(
+            staging / 'products', PRODUCT_COLUMNS,
+            ((pid, name, url, float(price)) for pid, name, url, price in products.iterator(chunk_size=CHUNK_ROWS)),
+            len(product_ids),
+        )
+        if on_table is not None:
+            on_table('products', len(product_ids))
+
+        reviews = Review.objects.order_by('product_id', 'id').values_list(*[
+            'product_id' if name == 'product' else name for name, _, _ in REVIEW_COLUMNS
+        ])
+        # the id comes first, the product second
+        tables['reviews'] = _write_table(
+            staging / 'reviews', REVIEW_COLUMNS,
+            _rows_with_product(reviews.iterator(chunk_size=CHUNK_ROWS), product_rows),
+            fingerprint['reviews'][0],
+        )
+        if on_table is not None:
+            on_table('reviews', fingerprint['reviews'][0])
+
+        summaries = Summary.objects.order_by('product_id', 'id').values_list(
+            'id', 'product_id', 'positive_sentiment', 'negative_sentiment',
+            'source_review_count', 'source_max_created_at', 'source_hash', 'updated_at',
+        )
+        tables['summaries'] = _write_table(
+            staging / 'summaries', SUMMARY_COLUMNS,
+            _rows_with_product(((*row[:-1], _to_micros(row[-1]))
+                                for row in summaries.iterator(chunk_size=CHUNK_ROWS)), product_rows),
+            fingerprint['summaries'][0],
+        )
+        if on_table is not None:
+            on_table('summaries', fingerprint['summaries'][0])
+
+    # reviews are sorted by product, so each product's reviews start where the first review of a later row is
+    review_products = np.load(staging / 'reviews' / 'product.npy', mmap_mode='r')
+    review_offsets = np.searchsorted(review_products, np.arange(len(product_ids) + 1), side='left')
+    np.save(staging / 'products' / 'review_offsets.npy', review_offsets.astype(np.int64), allow_pickle=False)
+
+    meta = {
+        'created_at': time.time(),
+        'seconds': time.time() - start_time,
+        'fingerprint': fingerprint,
+        'tables': tables,
+    }
+    with open(staging / META_FILE, 'w') as f:
+        json.dump(meta, f, indent=2)
+
+    # a directory can't be replaced in one step - move the old snapshot aside first
+    old = path.with_name(f".{path.name}.old")
+    shutil.rmtree(old, ignore_errors=True)
+    if path.exists():
+        os.replace(path, old)
+    os.replace(staging, path)
+    shutil.rmtree(old, ignore_errors=True)
+    logger.info(f"Wrote corpus snapshot to {path}")
+    return meta
+
+
+# Reading
+
+class TextColumn:
+    """A memory-mapped text column. Values are decoded as they are indexed."""
+
+    def __init__(self, directory, name, nullable):
+        self.offsets = np.load(directory / f"{name}.offsets.npy", mmap_mode='r')
+        data_path = directory / f"{name}.bin"
+        # np.memmap can't map an empty file
+        self.data = np.memmap(data_path, dtype=np.uint8, mode='r') if os.path.getsize(data_path) \
+            else np.empty(0, dtype=np.uint8)
+        self.nulls = np.load(directory / f"{name}.nulls.npy", mmap_mode='r') if nullable else None
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        if self.nulls is not None and self.nulls[row]:
+            return None
+        return self.data[self.offsets[row]:self.offsets[row + 1]].tobytes().decode('utf-8')
+
+    def lengths(self):
+        """The length in bytes of every value, without reading them."""
+        return np.diff(self.offsets)
+
+    def values(self, start=0, stop=None):
+        """Decodes the values of rows start to stop."""
+        stop = len(self) if stop is None else stop
+        return [self[row] for row in range(start, stop)]
+
+
+class SnapshotTable:
+    """One table of a snapshot. Indexing it by column name returns a memory-mapped array or a TextColumn."""
+
+    def __init__(self, directory, meta):
+        self.directory = directory
+        self.meta = meta
+        self._columns = {}
+
+    def __len__(self):
+        return self.meta['rows']
+
+    def __getitem__(self, name):
+        column = self._columns.get(name)
+        if column is None:
+            spec = self.meta['columns'][name]
+            if spec['type'] == 'text':
+                column = TextColumn(self.directory, name, spec['nullable'])
+            else:
+                column = np.load(self.directory / f"{name}.npy", mmap_mode='r')
+            self._columns[name] = column
+        return column
+
+    def nulls(self, name):
+        """True where the value of a nullable numeric column is NULL, or None if the column isn't nullable."""
+        if not self.meta['columns'][name]['nullable']:
+            return None
+        return np.load(self.directory / f"{name}.nulls.npy", mmap_mode='r')
+
+
+class CorpusSnapshot:
+    """
+    A read-only, memory-mapped view of a snapshot written by write_snapshot.
+
+    Args:
+        path: The snapshot directory, defaults to CORPUS_SNAPSHOT_DIR
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path is not None else snapshot_dir()
+        with open(self.path / META_FILE) as f:
+            self.meta = json.load(f)
+        self.products = SnapshotTable(self.path / 'products', self.meta['tables']['products'])
+        self.reviews = SnapshotTable(self.path / 'reviews', self.meta['tables']['reviews'])
+        self.summaries = SnapshotTable(self.path / 'summaries', self.meta['tables']['summaries'])
+        self.review_offsets = np.load(self.path / 'products' / 'review_offsets.npy', mmap_mode='r')
+
+    def is_current(self, tables=TABLES, fingerprint=None):
+        """True if the tables haven't changed in the database since the snapshot was written."""
+        fingerprint = fingerprint or corpus_fingerprint()
+        return all(self.meta['fingerprint'][table] == fingerprint[table] for table in tables)
+
+    def product_reviews(self, product_row):
+        """The (start, stop) rows of a product's reviews in the reviews table."""
+        return int(self.review_offsets[product_row]), int(self.review_offsets[product_row + 1])
+
+    def product_review_texts(self):
+        """
+        Yields (product_id, [review text, ...]) for every product in product_id order, skipping
+        reviews without text. Products without any reviews are yielded with an empty list.
+        """
+        product_ids = self.products['product_id']
+        for product_row in range(len(self.products)):
+            yield product_ids[product_row], self.review_texts(product_row)
+
+    def review_texts(self, product_row):
+        """The text of a product's reviews, skipping reviews without text."""
+        review_text = self.reviews['review_text']
+        start, stop = self.product_reviews(product_row)
+        # empty and NULL texts both have zero length
+        has_text = review_text.offsets[start + 1:stop + 1] > review_text.offsets[start:stop]
+        return [review_text[row] for row, keep in zip(range(start, stop), has_text) if keep]
+
+    def scored_reviews(self, product_row):
+        """(text or None, review score, created_at_unix or None) of every review of a product, in id order."""
+        review_text = self.reviews['review_text']
+        scores = self.reviews['review_score']
+        created_at = self.reviews['created_at_unix']
+        created_at_nulls = self.reviews.nulls('created_at_unix')
+        return [
+            (review_text[row], int(scores[row]), None if created_at_nulls[row] else int(created_at[row]))
+            for row in range(*self.product_reviews(product_row))
+        ]
+
+    def complete_summaries(self):
+        """Yields (product_id, positive, negative) for every summary with both sentiments, in product order."""
+        product_ids = self.products['product_id']
+        products = self.summaries['product']
+        positive = self.summaries['positive_sentiment']
+        negative = self.summaries['negative_sentiment']
+        complete = (positive.lengths() > 0) & (negative.lengths() > 0)
+        for row in np.flatnonzero(complete):
+            yield product_ids[products[row]], positive[row], negative[row]
+
+
+def current_snapshot(tables=TABLES):
+    """
+    Returns the snapshot in CORPUS_SNAPSHOT_DIR if there is one and the given tables haven't changed
+    since it was written, otherwise None - the caller then reads the database instead.
+    """
+    try:
+        snapshot = CorpusSnapshot()
+    except FileNotFoundError:
+        return None
+    # reviews and summaries refer to products by row, so the products must match too
+    if not snapshot.is_current(('products', *tables)):
+        logger.warning(f"The corpus snapshot in {snapshot.path} is stale, "
+                       f"re-export it with 'python manage.py export_snapshot'")
+        return None
+    return snapshot
+
+
+def import_snapshot(snapshot, batch_size=2000, replace=False, on_table=None):
+    """
+    Loads a snapshot into the database - products are upserted, and reviews and summaries are inserted with
+    their original ids, so the imported tables have the snapshot's fingerprint.
+
+    Args:
+        snapshot: A CorpusSnapshot
+        batch_size: Rows per INSERT
+        replace: Delete the existing reviews and summaries first, otherwise they must be empty
+        on_table: Optional callable(table name, rows) called as each table is written
+
+    Returns:
+        A dict of rows written per table.
+    """
+    from .products import upsert_products
+    from .review_stats import update_product_stats
+
+    if not replace and (Review.objects.exists() or Summary.objects.exists()):
+        raise SnapshotError('The database already has reviews or summaries - import with replace to overwrite them')
+
+    product_ids = snapshot.products['product_id']
+    counts = {}
+    with transaction.atomic():
+        if replace:
+            # plain DELETEs - the ORM would fetch every row to send its delete signals
+            with connection.cursor() as cursor:
+                cursor.execute(f"DELETE FROM {Summary._meta.db_table}")
+                cursor.execute(f"DELETE FROM {Review._meta.db_table}")
+
+        columns = [snapshot.products[name] for name, _, _ in PRODUCT_COLUMNS]
+        for start in range(0, len(snapshot.products), CHUNK_ROWS):
+            stop = min(start + CHUNK_ROWS, len(snapshot.products))
+            upsert_products([
+                Product(product_id=product_ids[row], name=columns[1][row], image_url=columns[2][row],
+                        price=Decimal(f"{columns[3][row]:.2f}"))
+                for row in range(start, stop)
+            ], batch_size=batch_size)
+        counts['products'] = len(snapshot.products)
+        if on_table is not None:
+            on_table('products', counts['products'])
+
+        for table, model, table_columns in (('reviews', Review, REVIEW_COLUMNS),
+                                            ('summaries', Summary, SUMMARY_COLUMNS)):
+            source = getattr(snapshot, table)
+            names = [name for name, _, _ in table_columns]
+            nulls = {name: source.nulls(name) for name, kind, _ in table_columns if kind != 'text'}
+            for start in range(0, len(source), CHUNK_ROWS):
+                stop = min(start + CHUNK_ROWS, len(source))
+                values = {}
+                for name in names:
+                    column = source[name]
+                    if isinstance(column, TextColumn):
+                        values[name] = column.values(start, stop)
+                    else:
+                        values[name] = [
+                            None if nulls[name] is not None and nulls[name][row] else value
+                            for row, value in enumerate(column[start:stop].tolist(), start=start)
+                        ]
+                values['product_id_id'] = [product_ids[row] for row in values.pop('product')]
+                updated_at = [_from_micros(value) for value in values.pop('updated_at', ())]
+                objects = [model(**dict(zip(values, row))) for row in zip(*values.values())]
+                model.objects.bulk_create(objects, batch_size=batch_size)
+                if updated_at:
+                    # auto_now stamps every inserted summary with the current time - restore the exported times,
+                    # so the imported tables still have the snapshot's fingerprint
+                    for obj, value in zip(objects, updated_at):
+                        obj.updated_at = value
+                    model.objects.bulk_update(objects, ['updated_at'], batch_size=batch_size)
+            counts[table] = len(source)
+            if on_table is not None:
+                on_table(table, counts[table])
+
+        update_product_stats()
+    return counts
@@ -0,0 +1,91 @@
+# This class creates a base command which benchmarks the clean_* conversion on a generated sample dump,
+# comparing the original single-process eval() loop with the converter in ingestion/convert.py
+# The sample lines are Python dict literals shaped like the Amazon metadata dump. No database access is needed.
+# To run this, use "python manage.py benchmark_convert" in the CLI
+
+import gzip
+import json
+import os
+import random
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+
+from product_recommender.ingestion.convert import DEFAULT_CHUNK_LINES, convert_file
+from product_recommender.ingestion.records import read_records
+
+
+def write_sample_dump(path, num_lines, seed=0):
+    """Writes num_lines Python dict literals, like metadata.json.gz, to a gzip file."""
+    rng = random.Random(seed)
+    words = ['kettle', 'pan', "chef's", 'knife', 'steel', 'non-stick', 'set', 'mug', 'towel', 'blender', 'lid']
+    with gzip.open(path, 'wt', encoding='utf-8') as g:
+        for i in range(num_lines):
+            item = {
+                'asin': f"B{i:09d}",
+                'title': ' '.join(rng.choices(words, k=rng.randint(3, 10))),
+                'price': round(rng.uniform(1, 200), 2),
+                'imUrl': f"http://ecx.images-amazon.com/images/I/{i}.jpg",
+                'related': {'also_bought': [f"B{rng.randrange(num_lines):09d}" for _ in range(rng.randint(0, 30))]},
+                'salesRank': {'Home &amp; Kitchen': rng.randint(1, 10 ** 6)},
+                'categories': [['Home & Kitchen', 'Kitchen & Dining', 'Cookware']],
+                'description': ' '.join(rng.choices(words, k=rng.randint(10, 60))),
+                'inStock': rng.random() < 0.9,
+            }
+            g.write(repr(item) + '\n')
+
+
+def convert_with_eval(input_path, output_path):
+    """The original clean_* loop - eval() per line, one process, written as an uncompressed JSON array."""
+    with gzip.open(input_path, 'r') as g, open(output_path, 'w') as f:
+        f.write('[')
+        first_line = True
+        for line in g:
+            obj = eval(line.decode('utf-8'))
+            if not first_line:
+                f.write(',' + '\n')
+            first_line = False
+            f.write(json.dumps(obj))
+        f.write(']')
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks eval() line parsing against the multiprocess converter on a generated sample dump.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--lines', type=int, default=200000, help='Sample lines (default: 200000).')
+        parser.add_argument('--workers', default=f"1,{os.cpu_count() or 1}",
+                            help='Comma separated worker counts for the converter (default: 1,<cores>).')
+        parser.add_argument('--chunk-lines', type=int, default=DEFAULT_CHUNK_LINES,
+                            help=f'Lines per worker task (default: {DEFAULT_CHUNK_LINES}).')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            sample_path = os.path.join(temp_dir, 'sample.json.gz')
+            write_sample_dump(sample_path, options['lines'])
+            self.stdout.write(f"{options['lines']} sample lines, {os.path.getsize(sample_path) / 1e6:.1f} MB gzip")
+            self.stdout.write(f"{'method':>20} {'seconds':>9} {'lines/s':>10} {'output MB':>10} {'speedup':>8}")
+
+            eval_path = os.path.join(temp_dir, 'eval.json')
+            start_time = time.perf_counter()
+            convert_with_eval(sample_path, eval_path)
+            baseline = time.perf_counter() - start_time
+            self._report('eval', baseline, baseline, options['lines'], eval_path)
+
+            for workers in sorted({int(workers) for workers in options['workers'].split(',')}):
+                output_path = os.path.join(temp_dir, f"converted_{workers}.jsonl.gz")
+                start_time = time.perf_counter()
+                convert_file(sample_path, output_path, workers=workers, chunk_lines=options['chunk_lines'])
+                elapsed = time.perf_counter() - start_time
+                self._report(f"converter x{workers}", elapsed, baseline, options['lines'], output_path)
+
+                # the converter must produce the same records, in the same order
+                if any(a != b for a, b in zip(read_records(eval_path), read_records(output_path))):
+                    self.stderr.write(self.style.ERROR(f"converter x{workers} output differs from eval output"))
+
+    def _report(self, name, elapsed, baseline, lines, output_path):
+        self.stdout.write(
+            f"{name:>20} {elapsed:>9.2f} {lines / elapsed:>10.0f} {os.path.getsize(output_path) / 1e6:>10.1f} "
+            f"{baseline / elapsed:>7.1f}x"
+        )
@@ -0,0 +1,87 @@
+# This class creates a base command which benchmarks populate_products' batched upsert against the
+# original update_or_create-per-item load, on a synthetic metadata file
+# Both loads run inside a transaction which is rolled back, so the database is left unchanged
+# To run this, use "python manage.py benchmark_populate_products" in the CLI
+
+import json
+import os
+import random
+import tempfile
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from product_recommender.ingestion.products import DEFAULT_BATCH_SIZE, in_category, load_products
+from product_recommender.ingestion.records import read_records
+from product_recommender.models import Product
+
+
+def write_synthetic_metadata(path, num_items, existing_fraction=0.0, seed=0):
+    """
+    Writes a metadata file shaped like metadata_processed.json: mostly Home & Kitchen products,
+    some other categories and some without a title. existing_fraction of the products reuse
+    ASINs already in the database, to exercise the update path of the upsert.
+    """
+    rng = random.Random(seed)
+    existing = list(Product.objects.values_list('product_id', flat=True)[:int(num_items * existing_fraction)])
+    with open(path, 'w') as f:
+        f.write('[')
+        for i in range(num_items):
+            asin = existing[i] if i < len(existing) else f"SYN{i:07d}"
+            item = {
+                'asin': asin,
+                'imUrl': f"http://example.com/{asin}.jpg",
+                'price': round(rng.uniform(1, 200), 2),
+                'categories': [['Home & Kitchen', 'Kitchen & Dining']] if rng.random() < 0.8 else [['Toys & Games']],
+            }
+            if rng.random() < 0.97:
+                item['title'] = f"Synthetic product {i}"
+            f.write((',\n' if i else '') + json.dumps(item))
+        f.write(']')
+
+
+def load_row_by_row(file_path):
+    """The original populate_products load - a SELECT and an INSERT or UPDATE per product."""
+    for item in read_records(file_path):
+        if 'title' in item and in_category(item):
+            Product.objects.update_or_create(
+                product_id=item.get('asin'),
+                defaults={'name': item.get('title'), 'image_url': item.get('imUrl'), 'price': item.get('price')},
+            )
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the batched product upsert against update_or_create per item on a synthetic metadata file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--items', type=int, default=50000, help='Synthetic items (default: 50000).')
+        parser.add_argument('--existing-fraction', type=float, default=0.1,
+                            help='Fraction of items updating existing products (default: 0.1).')
+        parser.add_argument('--batch-sizes', default=f'500,{DEFAULT_BATCH_SIZE},10000',
+                            help=f'Comma separated upsert batch sizes (default: 500,{DEFAULT_BATCH_SIZE},10000).')
+        parser.add_argument('--skip-row-by-row', action='store_true',
+                            help='Only time the batched upsert.')
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            file_path = os.path.join(temp_dir, 'metadata_synthetic.json')
+            write_synthetic_metadata(file_path, options['items'], options['existing_fraction'])
+            self.stdout.write(f"{options['items']} synthetic items")
+            self.stdout.write(f"{'mode':>22} {'seconds':>9} {'items/s':>10}")
+
+            runs = [(f"upsert batch {size}", int(size)) for size in options['batch_sizes'].split(',')]
+            if not options['skip_row_by_row']:
+                runs.append(('update_or_create', None))
+
+            for name, batch_size in runs:
+                start_time = time.perf_counter()
+                with transaction.atomic():
+                    if batch_size is None:
+                        load_row_by_row(file_path)
+                    else:
+                        load_products(file_path, batch_size=batch_size)
+                    elapsed = time.perf_counter() - start_time
+                    # leave the database as it was
+                    transaction.set_rollback(True)
+                self.stdout.write(f"{name:>22} {elapsed:>9.2f} {options['items'] / elapsed:>10.0f}")
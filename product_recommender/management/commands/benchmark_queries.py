@@ -0,0 +1,88 @@
+# This class creates a base command which times the hot product and review queries before and after the
+# review indexes and the denormalized review statistics on Product (migration 0009)
+# "before" drops the indexes inside a transaction that is rolled back and computes the statistics from the
+# Review table, as the views and engines used to. "after" uses the indexes and the Product fields.
+# The database is left unchanged
+# To run this, use "python manage.py benchmark_queries" in the CLI
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Avg, Count
+
+from product_recommender.models import Product, Review, Summary
+
+# The indexes added by migration 0009
+INDEXES = Product._meta.indexes + Review._meta.indexes
+
+
+def _reviews_with_text(product_id):
+    return list(
+        Review.objects.filter(product_id=product_id, review_text__isnull=False).exclude(review_text='')
+        .order_by('id').values_list('review_text', flat=True)
+    )
+
+
+# name -> (before, after), each a callable(product_id)
+QUERIES = {
+    'review count': (
+        lambda product_id: Review.objects.filter(product_id=product_id).count(),
+        lambda product_id: Product.objects.values_list('review_count', flat=True).get(product_id=product_id),
+    ),
+    'average score': (
+        lambda product_id: Review.objects.filter(product_id=product_id).aggregate(avg=Avg('review_score'))['avg'],
+        lambda product_id: Product.objects.values_list('avg_score', flat=True).get(product_id=product_id),
+    ),
+    'has summary': (
+        lambda product_id: Summary.objects.filter(product_id=product_id).exists(),
+        lambda product_id: Product.objects.values_list('has_summary', flat=True).get(product_id=product_id),
+    ),
+    'reviews with text': (_reviews_with_text, _reviews_with_text),
+    'top 10 by reviews': (
+        lambda product_id: list(
+            Product.objects.annotate(count=Count('review')).order_by('-count').values_list('product_id', flat=True)[:10]
+        ),
+        lambda product_id: list(Product.objects.order_by('-review_count').values_list('product_id', flat=True)[:10]),
+    ),
+}
+
+
+class Command(BaseCommand):
+    help = 'Times the hot product/review queries with and without the review indexes and denormalized statistics.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=200,
+                            help='Random products each query is run for (default: 200).')
+
+    def handle(self, *args, **options):
+        product_ids = list(
+            Product.objects.order_by('?').values_list('product_id', flat=True)[:options['products']]
+        )
+        if not product_ids:
+            raise CommandError('No products in the database to query.')
+
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                for index in INDEXES:
+                    cursor.execute(f"DROP INDEX IF EXISTS {connection.ops.quote_name(index.name)}")
+            before = {name: self._time(queries[0], product_ids) for name, queries in QUERIES.items()}
+            # put the indexes back
+            transaction.set_rollback(True)
+        after = {name: self._time(queries[1], product_ids) for name, queries in QUERIES.items()}
+
+        self.stdout.write(f"{len(product_ids)} products, mean milliseconds per query")
+        self.stdout.write(f"{'query':>20} {'before':>9} {'after':>9} {'speedup':>8}")
+        for name in QUERIES:
+            self.stdout.write(
+                f"{name:>20} {before[name]:>9.3f} {after[name]:>9.3f} {before[name] / max(after[name], 1e-9):>7.1f}x"
+            )
+
+    @staticmethod
+    def _time(query, product_ids):
+        # one untimed run, so both sides start with the pages they touch cached
+        query(product_ids[0])
+        start_time = time.perf_counter()
+        for product_id in product_ids:
+            query(product_id)
+        return (time.perf_counter() - start_time) / len(product_ids) * 1000
@@ -0,0 +1,121 @@
+# This class creates a base command which measures what the token-budgeted review selection
+# (summarization/selection.py) keeps of a product's reviews, on the products with the most reviews
+# For each product it compares the selected reviews with all of them:
+#   - review tokens sent in the prompt
+#   - star ratings still represented
+#   - recall of the product's top terms - the most frequent words of its reviews, ignoring stop words,
+#     that still appear in the selected text
+# With "--host" it also summarises every product from all of its reviews and from the selection, and reports how
+# close the two summaries are (TF-IDF cosine) - the summaries are not saved
+# To run this, use "python manage.py benchmark_review_selection" in the CLI
+
+import contextlib
+import io
+import re
+import time
+from collections import Counter
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS, TfidfVectorizer
+
+from product_recommender.management.commands.generate_ai_summaries_v3 import GenerateAISummaries
+from product_recommender.models import Product, Review
+from product_recommender.summarization.selection import DEFAULT_TOKEN_BUDGET, estimate_tokens, select_reviews
+
+# Terms per product that term recall is measured on
+TOP_TERMS = 20
+
+_WORD = re.compile(r"[a-z]{3,}")
+
+
+def _top_terms(texts):
+    counts = Counter(word for text in texts for word in _WORD.findall(text.lower()) if word not in ENGLISH_STOP_WORDS)
+    return {word for word, _ in counts.most_common(TOP_TERMS)}
+
+
+def _similarity(first, second):
+    matrix = TfidfVectorizer().fit_transform([first, second])
+    return float((matrix[0] @ matrix[1].T).toarray()[0, 0])
+
+
+class Command(BaseCommand):
+    help = 'Measures the prompt tokens saved and the coverage kept by the token-budgeted review selection.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=50,
+                            help='Products with the most reviews to measure (default: 50).')
+        parser.add_argument('--token-budget', type=int, default=DEFAULT_TOKEN_BUDGET,
+                            help=f'Review tokens per prompt (default: {DEFAULT_TOKEN_BUDGET}).')
+        parser.add_argument('--host', default=None,
+                            help='Ollama server to also compare the summaries of all reviews and the selection with.')
+
+    def handle(self, *args, **options):
+        product_ids = list(
+            Product.objects.filter(review_count__gt=0).order_by('-review_count')
+            .values_list('product_id', flat=True)[:options['products']]
+        )
+        if not product_ids:
+            raise CommandError('No products with reviews in the database.')
+        generator = GenerateAISummaries(use_snapshot=False, host=options['host']) if options['host'] else None
+
+        totals = Counter()
+        recalls, similarities = [], []
+        selection_seconds = 0.0
+        for product_id in product_ids:
+            reviews = [
+                review for review in Review.objects.filter(product_id_id=product_id).order_by('id')
+                .values_list('review_text', 'review_score', 'created_at_unix') if review[0]
+            ]
+            if not reviews:
+                continue
+            start_time = time.perf_counter()
+            selected = select_reviews(reviews, options['token_budget'])
+            selection_seconds += time.perf_counter() - start_time
+
+            texts = [text for text, _, _ in reviews]
+            selected_text = ' '.join(selected).lower()
+            totals['products'] += 1
+            totals['reviews'] += len(reviews)
+            totals['selected'] += len(selected)
+            totals['tokens'] += sum(estimate_tokens(text) for text in texts)
+            totals['selected_tokens'] += sum(estimate_tokens(text) for text in selected)
+            # a selected review may have been cut short, so match on its start
+            selected_ratings = {score for text, score, _ in reviews if any(
+                chosen.startswith(text[:40]) for chosen in selected)}
+            totals['ratings'] += len({score for _, score, _ in reviews})
+            totals['selected_ratings'] += len(selected_ratings)
+            terms = _top_terms(texts)
+            if terms:
+                recalls.append(sum(term in selected_text for term in terms) / len(terms))
+
+            if generator is not None and len(selected) < len(reviews):
+                # summarize_product prints every product id
+                with contextlib.redirect_stdout(io.StringIO()):
+                    try:
+                        full = generator.summarize_product(product_id, texts)
+                        budgeted = generator.summarize_product(product_id, selected)
+                    except ValueError:
+                        continue
+                similarities.append(np.mean([_similarity(a, b) for a, b in zip(full, budgeted)]))
+
+        products = max(totals['products'], 1)
+        self.stdout.write(f"{totals['products']} products, {options['token_budget']} token budget")
+        self.stdout.write(
+            f"reviews per product:  {totals['reviews'] / products:.1f} -> {totals['selected'] / products:.1f}"
+        )
+        self.stdout.write(
+            f"tokens per product:   {totals['tokens'] / products:.0f} -> {totals['selected_tokens'] / products:.0f} "
+            f"({1 - totals['selected_tokens'] / max(totals['tokens'], 1):.0%} fewer)"
+        )
+        self.stdout.write(
+            f"ratings represented:  {totals['selected_ratings'] / max(totals['ratings'], 1):.1%}"
+        )
+        self.stdout.write(f"top-{TOP_TERMS} term recall:   {np.mean(recalls) if recalls else 1.0:.1%}")
+        self.stdout.write(f"selection time:       {selection_seconds / products * 1000:.2f} ms per product")
+        if similarities:
+            self.stdout.write(
+                f"summary similarity:   {np.mean(similarities):.3f} mean TF-IDF cosine over "
+                f"{len(similarities)} products whose reviews were cut"
+            )
+        self.stdout.write(self.style.SUCCESS('Done'))
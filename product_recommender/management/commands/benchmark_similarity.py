@@ -0,0 +1,108 @@
+# This class creates a base command which benchmarks the similarity backend against synthetic catalogues,
+# reporting query latency and peak memory versus catalogue size
+# It compares a brute-force dot product against every row with the chunked, inverted-index backend
+# used by the TF-IDF engines. No database access is needed.
+# To run this, use "python manage.py benchmark_similarity" in the CLI
+
+import time
+import tracemalloc
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from scipy import sparse
+from sklearn.preprocessing import normalize
+
+from product_recommender.recommendation_engine.similarity import (
+    DEFAULT_CHUNK_SIZE, ChunkedSimilarityBackend, SimilarityField,
+)
+
+
+def synthetic_catalogue(num_products, vocabulary_size, terms_per_product, seed=0):
+    """A row-normalised TF-IDF-like matrix with a Zipfian term distribution, like real product text."""
+    rng = np.random.default_rng(seed)
+    ranks = np.arange(1, vocabulary_size + 1)
+    term_probabilities = (1.0 / ranks) / np.sum(1.0 / ranks)
+    columns = rng.choice(vocabulary_size, size=num_products * terms_per_product, p=term_probabilities)
+    rows = np.repeat(np.arange(num_products), terms_per_product)
+    values = rng.random(len(columns)).astype(np.float32)
+    # down-weight common terms the way idf does
+    values *= np.log1p(ranks[columns]).astype(np.float32)
+    matrix = sparse.csr_matrix((values, (rows, columns)), shape=(num_products, vocabulary_size), dtype=np.float32)
+    matrix.sum_duplicates()
+    return normalize(matrix, norm='l2', copy=False)
+
+
+def brute_force_top_k(matrix, query, k, exclude):
+    scores = (matrix @ query.T).toarray().ravel()
+    scores[exclude] = -np.inf
+    top = np.argpartition(-scores, k)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks top-K similarity latency and memory against synthetic catalogues of increasing size.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', default='10000,50000,100000,300000',
+                            help='Comma separated catalogue sizes (default: 10000,50000,100000,300000).')
+        parser.add_argument('--vocabulary', type=int, default=50000, help='Vocabulary size (default: 50000).')
+        parser.add_argument('--terms', type=int, default=40, help='Terms per product (default: 40).')
+        parser.add_argument('--queries', type=int, default=50, help='Queries timed per size (default: 50).')
+        parser.add_argument('--chunk-size', type=int, default=DEFAULT_CHUNK_SIZE,
+                            help=f'Backend chunk size (default: {DEFAULT_CHUNK_SIZE}).')
+        parser.add_argument('--max-query-terms', type=int, default=None,
+                            help='Prune candidates to the heaviest query terms (default: use every term).')
+        parser.add_argument('--max-posting-fraction', type=float, default=None,
+                            help='Ignore terms found in more than this fraction of products when finding '
+                                 'candidates (default: use every term).')
+
+    def handle(self, *args, **options):
+        sizes = [int(size) for size in options['sizes'].split(',')]
+        k = 10
+
+        self.stdout.write(
+            f"{'products':>10} {'matrix MB':>10} {'brute p50 ms':>13} {'brute p95 ms':>13} {'brute peak MB':>14} "
+            f"{'backend p50 ms':>15} {'backend p95 ms':>15} {'backend peak MB':>16} {'candidates':>11} {'recall@10':>10}"
+        )
+        for size in sizes:
+            matrix = synthetic_catalogue(size, options['vocabulary'], options['terms'])
+            matrix_mb = (matrix.data.nbytes + matrix.indices.nbytes + matrix.indptr.nbytes) / 1e6
+            backend = ChunkedSimilarityBackend(
+                [SimilarityField(matrix)],
+                chunk_size=options['chunk_size'],
+                max_query_terms=options['max_query_terms'],
+                max_posting_fraction=options['max_posting_fraction'],
+            )
+
+            rng = np.random.default_rng(size)
+            targets = rng.choice(size, size=min(options['queries'], size), replace=False)
+
+            brute_times, backend_times, candidate_fractions, recalls = [], [], [], []
+            brute_peak = backend_peak = 0
+            for target in targets:
+                query = matrix[target]
+
+                tracemalloc.start()
+                start_time = time.perf_counter()
+                expected = brute_force_top_k(matrix, query, k, target)
+                brute_times.append(time.perf_counter() - start_time)
+                brute_peak = max(brute_peak, tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+
+                tracemalloc.start()
+                start_time = time.perf_counter()
+                rows, _ = backend.top_k([query], k, exclude=(target,))
+                backend_times.append(time.perf_counter() - start_time)
+                backend_peak = max(backend_peak, tracemalloc.get_traced_memory()[1])
+                tracemalloc.stop()
+
+                candidate_fractions.append(len(backend.candidates([query])) / size)
+                recalls.append(len(set(rows) & set(expected)) / k)
+
+            self.stdout.write(
+                f"{size:>10} {matrix_mb:>10.1f} "
+                f"{np.percentile(brute_times, 50) * 1000:>13.2f} {np.percentile(brute_times, 95) * 1000:>13.2f} "
+                f"{brute_peak / 1e6:>14.2f} "
+                f"{np.percentile(backend_times, 50) * 1000:>15.2f} {np.percentile(backend_times, 95) * 1000:>15.2f} "
+                f"{backend_peak / 1e6:>16.2f} {np.mean(candidate_fractions):>10.1%} {np.mean(recalls):>10.2f}"
+            )
@@ -0,0 +1,121 @@
+# This class creates a base command which compares summary generation throughput with the combined JSON prompt
+# (one call per product) against separate positive and negative prompts (two calls per product)
+# and the saving from the server reusing the KV cache of the prompt prefix every product shares
+# It starts an Ollama stub in-process (see ollama_stub), whose responses take longer the longer the part of the
+# prompt it hasn't cached is, and summarises a sample of products in both modes, then in combined mode again with
+# the stub's prompt cache turned off. Nothing is written to the database
+# Pass "--host" to time a real Ollama server instead - the calls and prompt tokens are then not counted, and the
+# run without the prompt cache is skipped
+# To run this, use "python manage.py benchmark_summaries" in the CLI
+
+import contextlib
+import io
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from product_recommender.management.commands.generate_ai_summaries_v3 import PROMPT_MODES, GenerateAISummaries
+from product_recommender.management.commands.ollama_stub import StubSettings, serve_in_background
+from product_recommender.models import Product, Review
+
+
+class Command(BaseCommand):
+    help = 'Compares summary generation throughput of the combined JSON prompt with separate prompts.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--products', type=int, default=24, help='Products summarised per mode (default: 24).')
+        parser.add_argument('--concurrency', type=int, default=4, help='Products summarised at once (default: 4).')
+        parser.add_argument('--host', default=None, help='Ollama server to time, instead of the in-process stub.')
+        parser.add_argument('--latency', type=float, default=0.2,
+                            help='Stub seconds before the first word of each response (default: 0.2).')
+        parser.add_argument('--prompt-rate', type=float, default=4000,
+                            help='Stub prompt tokens read per second (default: 4000).')
+        parser.add_argument('--invalid-json-rate', type=float, default=0.0,
+                            help='Fraction of the stub\'s JSON answers that are cut short (default: 0).')
+
+    def handle(self, *args, **options):
+        product_ids = list(
+            Product.objects.filter(review_count__gt=0).order_by('?')
+            .values_list('product_id', flat=True)[:options['products']]
+        )
+        if not product_ids:
+            raise CommandError('No products with reviews in the database to summarise.')
+        products = [
+            (product_id, [text for text in Review.objects.filter(product_id_id=product_id)
+                          .values_list('review_text', flat=True) if text])
+            for product_id in product_ids
+        ]
+
+        settings, server, host = None, None, options['host']
+        if host is None:
+            settings = StubSettings(
+                latency=options['latency'],
+                token_delay=0.01,
+                parallel=options['concurrency'],
+                prompt_rate=options['prompt_rate'],
+                invalid_json_rate=options['invalid_json_rate'],
+            )
+            server, host = serve_in_background(settings)
+
+        results = {}
+        try:
+            for mode in PROMPT_MODES:
+                results[mode] = self._run(mode, host, products, options['concurrency'], settings)
+            if settings is not None:
+                settings.prompt_cache = False
+                results['no cache'] = self._run('combined', host, products, options['concurrency'], settings)
+        finally:
+            if server is not None:
+                server.shutdown()
+                server.server_close()
+
+        self.stdout.write(f"{len(products)} products, {options['concurrency']} at once")
+        self.stdout.write(
+            f"{'mode':>10} {'seconds':>8} {'per min':>8} {'failed':>7} {'fallbacks':>10} {'calls':>6} "
+            f"{'prompt tok':>11} {'read tok':>9}"
+        )
+        for mode, result in results.items():
+            self.stdout.write(
+                f"{mode:>10} {result['seconds']:>8.2f} {result['per_minute']:>8.1f} {result['failed']:>7} "
+                f"{result['fallbacks']:>10} {result['calls']:>6} {result['prompt_tokens']:>11} "
+                f"{result['evaluated_tokens']:>9}"
+            )
+        if 'no cache' in results:
+            saved = (results['no cache']['seconds'] - results['combined']['seconds']) / len(products)
+            self.stdout.write(
+                f"Prefix KV cache: {saved * 1000:.0f} ms less per product "
+                f"({saved * len(products) / max(results['no cache']['seconds'], 1e-9):.0%} of the uncached run)"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Combined prompt: {results['separate']['seconds'] / max(results['combined']['seconds'], 1e-9):.2f}x "
+            f"the throughput of separate prompts"
+        ))
+
+    @staticmethod
+    def _run(mode, host, products, concurrency, settings):
+        generator = GenerateAISummaries(use_snapshot=False, host=host, prompt_mode=mode)
+        before = (settings.requests, settings.prompt_tokens, settings.evaluated_tokens) if settings else None
+
+        def summarize(product):
+            try:
+                generator.summarize_product(*product)
+                return True
+            except ValueError:
+                return False
+
+        start_time = time.perf_counter()
+        # summarize_product prints every product id
+        with contextlib.redirect_stdout(io.StringIO()), ThreadPoolExecutor(max_workers=concurrency) as executor:
+            succeeded = sum(executor.map(summarize, products))
+        seconds = time.perf_counter() - start_time
+
+        return {
+            'seconds': seconds,
+            'per_minute': succeeded / max(seconds, 1e-9) * 60,
+            'failed': len(products) - succeeded,
+            'fallbacks': generator.fallbacks,
+            'calls': settings.requests - before[0] if settings else '-',
+            'prompt_tokens': settings.prompt_tokens - before[1] if settings else '-',
+            'evaluated_tokens': settings.evaluated_tokens - before[2] if settings else '-',
+        }
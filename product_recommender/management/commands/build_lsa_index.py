@@ -0,0 +1,54 @@
+# This class creates a base command which builds the LSA embedding + IVF approximate nearest-neighbour index
+# from the published summary TF-IDF model, and reports its recall@10 against exact cosine similarity
+# Run build_summary_model first - the index is tied to the summary model version it was projected from
+# To run this, use "python manage.py build_lsa_index" in the CLI
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from product_recommender.recommendation_engine.lsa_ann import (
+    DEFAULT_COMPONENTS, DEFAULT_NPROBE, LSA_INDEX_NAME, build_lsa_index,
+)
+from product_recommender.recommendation_engine.model_store import StoredModel
+from product_recommender.recommendation_engine.tfidf import SUMMARY_MODEL_NAME
+
+
+class Command(BaseCommand):
+    help = 'Builds the LSA embedding ANN index over the summary TF-IDF model and reports its recall.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--components', type=int, default=DEFAULT_COMPONENTS,
+                            help=f'LSA dimensions (default: {DEFAULT_COMPONENTS}).')
+        parser.add_argument('--lists', type=int, default=None,
+                            help='IVF lists (default: about 4 * sqrt(number of products)).')
+        parser.add_argument('--nprobe', type=int, default=DEFAULT_NPROBE,
+                            help=f'Lists scanned per query (default: {DEFAULT_NPROBE}).')
+
+    def handle(self, *args, **options):
+        start_time = time.time()
+        version = build_lsa_index(
+            components=options['components'],
+            num_lists=options['lists'],
+            nprobe=options['nprobe'],
+        )
+        if version is None:
+            raise CommandError(f"No {SUMMARY_MODEL_NAME} model has been built - run build_summary_model first.")
+
+        meta = StoredModel(LSA_INDEX_NAME, version).meta
+        recall = meta['recall']
+        self.stdout.write(self.style.SUCCESS(
+            f"Built {LSA_INDEX_NAME} version {version} over {meta['num_products']} products "
+            f"in {time.time() - start_time:.2f} seconds"
+        ))
+        self.stdout.write(
+            f"  {meta['components']} components ({meta['explained_variance']:.1%} variance explained), "
+            f"{meta['num_lists']} lists, nprobe {meta['nprobe']}"
+        )
+        self.stdout.write(
+            f"  recall@{recall['k']} vs exact cosine on the embeddings: {recall['recall_at_k_vs_exact_embedding']:.3f}"
+        )
+        if recall['recall_at_k_vs_exact_tfidf'] is not None:
+            self.stdout.write(
+                f"  recall@{recall['k']} vs exact TF-IDF summary cosine: {recall['recall_at_k_vs_exact_tfidf']:.3f}"
+            )
+        self.stdout.write(f"  mean query time: {recall['mean_query_ms']:.3f} ms over {recall['queries']} queries")
@@ -0,0 +1,50 @@
+# This class creates a base command which precomputes the top-K neighbours of every product
+# for the summary and review engines, using blocked sparse matrix multiplication across all cores
+# Run build_summary_model and build_review_index first - the tables are tied to the model version they were built from
+# To run this, use "python manage.py build_neighbours" in the CLI
+
+import time
+
+from django.core.management.base import BaseCommand
+from product_recommender.recommendation_engine.neighbours import (
+    DEFAULT_BLOCK_SIZE, DEFAULT_K, build_neighbours,
+)
+
+ENGINES = {
+    'summary': 'summary_tfidf',
+    'reviews': 'review_tfidf',
+}
+
+
+class Command(BaseCommand):
+    help = 'Precomputes the top-K neighbour table for every product so recommendations are served with a lookup.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--engine', choices=[*ENGINES, 'all'], default='all',
+                            help='Which engine to build the table for (default: all).')
+        parser.add_argument('--k', type=int, default=DEFAULT_K,
+                            help=f'Neighbours kept per product (default: {DEFAULT_K}).')
+        parser.add_argument('--block-size', type=int, default=DEFAULT_BLOCK_SIZE,
+                            help=f'Rows scored per sparse matrix multiplication (default: {DEFAULT_BLOCK_SIZE}).')
+        parser.add_argument('--workers', type=int, default=None,
+                            help='Worker processes (default: one per core).')
+
+    def handle(self, *args, **options):
+        engines = ENGINES if options['engine'] == 'all' else {options['engine']: ENGINES[options['engine']]}
+
+        for engine, model_name in engines.items():
+            start_time = time.time()
+            version = build_neighbours(
+                model_name,
+                k=options['k'],
+                block_size=options['block_size'],
+                workers=options['workers'],
+            )
+            if version is None:
+                self.stderr.write(self.style.ERROR(
+                    f"No {model_name} model has been built - skipping the {engine} neighbour table."
+                ))
+                continue
+            self.stdout.write(self.style.SUCCESS(
+                f"Built {engine} neighbour table version {version} in {time.time() - start_time:.2f} seconds"
+            ))
@@ -0,0 +1,57 @@
+# This class creates a base command which fits the review corpus index offline and saves it to disk,
+# so tfidf_recommendations_from_reviews only has to transform and score the target row per request
+# To run this, use "python manage.py build_review_index" in the CLI
+# Use "python manage.py build_review_index --check" to see whether the saved index is stale
+
+import time
+
+from django.core.management.base import BaseCommand
+from product_recommender.recommendation_engine.model_store import StoredModel, current_version
+from product_recommender.recommendation_engine.tfidf_reviews import (
+    REVIEW_INDEX_NAME, build_review_index, review_corpus_fingerprint,
+)
+
+
+class Command(BaseCommand):
+    help = 'Aggregates each product\'s reviews, vectorizes them once and publishes the review index for the web workers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only report whether the published index matches the reviews in the database.',
+        )
+        parser.add_argument(
+            '--no-snapshot', action='store_true',
+            help='Read the database even if the corpus snapshot (see export_snapshot) is up to date.',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            self.check_index()
+            return
+
+        start_time = time.time()
+        version = build_review_index(use_snapshot=not options['no_snapshot'])
+        if version is None:
+            self.stderr.write(self.style.ERROR('No reviews with text found - nothing to build.'))
+            return
+
+        stored = StoredModel(REVIEW_INDEX_NAME, version)
+        self.stdout.write(self.style.SUCCESS(
+            f"Built {REVIEW_INDEX_NAME} version {version} over {stored.meta['num_products']} products "
+            f"in {time.time() - start_time:.2f} seconds"
+        ))
+
+    def check_index(self):
+        version = current_version(REVIEW_INDEX_NAME)
+        if version is None:
+            self.stdout.write(self.style.WARNING('No review index has been built yet.'))
+            return
+
+        stored = StoredModel(REVIEW_INDEX_NAME, version)
+        if stored.meta.get('fingerprint') == review_corpus_fingerprint():
+            self.stdout.write(self.style.SUCCESS(f"Review index version {version} is up to date."))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"Review index version {version} is stale - run 'python manage.py build_review_index'."
+            ))
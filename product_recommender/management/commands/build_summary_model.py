@@ -0,0 +1,57 @@
+# This class creates a base command which fits the summary TF-IDF model offline and saves it to disk,
+# so tfidf_recommendations only has to run a sparse dot product per request
+# To run this, use "python manage.py build_summary_model" in the CLI
+# Use "python manage.py build_summary_model --check" to see whether the saved model is stale
+
+import time
+
+from django.core.management.base import BaseCommand
+from product_recommender.recommendation_engine.model_store import StoredModel, current_version
+from product_recommender.recommendation_engine.tfidf import (
+    SUMMARY_MODEL_NAME, build_summary_model, summary_corpus_fingerprint,
+)
+
+
+class Command(BaseCommand):
+    help = 'Fits the summary TF-IDF vectorizers over all AI summaries and publishes the model for the web workers.'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check', action='store_true',
+            help='Only report whether the published model matches the summaries in the database.',
+        )
+        parser.add_argument(
+            '--no-snapshot', action='store_true',
+            help='Read the database even if the corpus snapshot (see export_snapshot) is up to date.',
+        )
+
+    def handle(self, *args, **options):
+        if options['check']:
+            self.check_model()
+            return
+
+        start_time = time.time()
+        version = build_summary_model(use_snapshot=not options['no_snapshot'])
+        if version is None:
+            self.stderr.write(self.style.ERROR('No complete summaries found - nothing to build.'))
+            return
+
+        stored = StoredModel(SUMMARY_MODEL_NAME, version)
+        self.stdout.write(self.style.SUCCESS(
+            f"Built {SUMMARY_MODEL_NAME} version {version} over {stored.meta['num_products']} products "
+            f"in {time.time() - start_time:.2f} seconds"
+        ))
+
+    def check_model(self):
+        version = current_version(SUMMARY_MODEL_NAME)
+        if version is None:
+            self.stdout.write(self.style.WARNING('No summary model has been built yet.'))
+            return
+
+        stored = StoredModel(SUMMARY_MODEL_NAME, version)
+        if stored.meta.get('fingerprint') == summary_corpus_fingerprint():
+            self.stdout.write(self.style.SUCCESS(f"Summary model version {version} is up to date."))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"Summary model version {version} is stale - run 'python manage.py build_summary_model'."
+            ))
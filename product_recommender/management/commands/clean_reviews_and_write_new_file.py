@@ -1,48 +1,45 @@
-# This class creates a base command which takes the home and kitchen reviews gzip file and 
-# writes a new JSON file which is formatted to the official JSON specification
+# This class creates a base command which takes the home and kitchen reviews gzip file and
+# writes a new gzip JSON Lines file (one JSON object per line) which populate_reviews can read
+# The lines are parsed without eval, across a pool of worker processes - see ingestion/convert.py
 # To run this, use "python manage.py clean_reviews_and_write_new_file" in the CLI
-# Note that the input_file_path can be amended to fit your chosen filename
+# Note that the input_file_path can be amended to fit your chosen filename, or passed with --input
 
-import json
 import os
-import gzip
 
 from django.core.management.base import BaseCommand
+from product_recommender.ingestion.convert import DEFAULT_CHUNK_LINES, convert_file
+
 
 class Command(BaseCommand):
-    help = 'Creates a new home_and_kitchen_reviews_processed.json file with valid JSON format.'
+    help = 'Creates a new home_and_kitchen_reviews_processed.jsonl.gz file with valid JSON format.'
 
-    def handle(self, *args, **options):
+    def add_arguments(self, parser):
         script_dir = os.path.dirname(os.path.abspath(__file__))
-        input_file_path = os.path.join(script_dir, '..', '..', '..', 'data_files', 'home_and_kitchen_reviews.json.gz')
-        output_file_path = os.path.join(script_dir, '..', '..', '..', 'data_files', 'home_and_kitchen_reviews_processed.json')
-
-        try:
-            with gzip.open(input_file_path, 'r') as g, open(output_file_path, 'w') as f:
-                f.write('[')  # Write the opening bracket for the array
+        data_dir = os.path.join(script_dir, '..', '..', '..', 'data_files')
+        parser.add_argument('--input', default=os.path.join(data_dir, 'home_and_kitchen_reviews.json.gz'),
+                            help='Raw reviews dump (default: data_files/home_and_kitchen_reviews.json.gz).')
+        parser.add_argument('--output', default=os.path.join(data_dir, 'home_and_kitchen_reviews_processed.jsonl.gz'),
+                            help='Output file (default: data_files/home_and_kitchen_reviews_processed.jsonl.gz).')
+        parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: every core).')
+        parser.add_argument('--chunk-lines', type=int, default=DEFAULT_CHUNK_LINES,
+                            help=f'Lines per worker task (default: {DEFAULT_CHUNK_LINES}).')
 
-                first_line = True  # Flag to track the first line
-                for line in g:
-                    try:
-                        # Use eval to parse the object (keeping eval as requested)
-                        obj = eval(line.decode('utf-8'))  
-                        
-                        # Add a comma before the object except for the first one
-                        if not first_line:
-                            f.write(',' + '\n')
-                        first_line = False
-
-                        # Write the JSON object to the output file
-                        f.write(json.dumps(obj)) 
-
-                    except Exception as e:  # Catch any errors during eval
-                        self.stderr.write(self.style.ERROR(f"Error evaluating object: {e} - Line: {line}"))
+    def handle(self, *args, **options):
+        input_file_path = options['input']
+        output_file_path = options['output']
 
-                f.write(']')  # Write the closing bracket for the array
+        def on_error(line_number, error, line):
+            self.stderr.write(self.style.ERROR(f"Error evaluating object on line {line_number}: {error} - Line: {line}"))
 
-            self.stdout.write(self.style.SUCCESS(f'Successfully processed data from {input_file_path} to {output_file_path}'))
+        try:
+            stats = convert_file(input_file_path, output_file_path, workers=options['workers'],
+                                 chunk_lines=options['chunk_lines'], on_error=on_error)
+            self.stdout.write(self.style.SUCCESS(
+                f"Successfully processed data from {input_file_path} to {output_file_path} - "
+                f"{stats['written']} lines in {stats['seconds']:.1f} seconds, {stats['failed']} failed"
+            ))
 
         except FileNotFoundError:
             self.stderr.write(self.style.ERROR(f"Error: Input file '{input_file_path}' not found."))
         except Exception as e:
-            self.stderr.write(self.style.ERROR(f"An error occurred: {e}"))
\ No newline at end of file
+            self.stderr.write(self.style.ERROR(f"An error occurred: {e}"))
@@ -0,0 +1,55 @@
+# This class creates a base command which exports the products, reviews and summaries to a columnar snapshot
+# (memory-mapped NumPy arrays) for the offline jobs - build_summary_model, build_review_index and
+# generate_ai_summaries_v3 read the snapshot instead of the database while it matches the database
+# Re-run it after loading reviews or generating summaries
+# To run this, use "python manage.py export_snapshot" in the CLI
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from product_recommender.ingestion.snapshot import CorpusSnapshot, SnapshotError, snapshot_dir, write_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Exports the products, reviews and summaries to a columnar snapshot for the offline jobs.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default=None,
+                            help='Snapshot directory (default: CORPUS_SNAPSHOT_DIR in settings.py).')
+        parser.add_argument('--check', action='store_true',
+                            help='Only report whether the snapshot matches the database.')
+
+    def handle(self, *args, **options):
+        path = options['output'] or snapshot_dir()
+        if options['check']:
+            self.check_snapshot(path)
+            return
+
+        start_time = time.time()
+
+        def on_table(table, rows):
+            self.stdout.write(f"Wrote {rows} {table} ({time.time() - start_time:.1f}s)")
+
+        try:
+            meta = write_snapshot(path, on_table=on_table)
+        except SnapshotError as e:
+            raise CommandError(f"{e} - run the command again")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Exported {meta['tables']['products']['rows']} products, {meta['tables']['reviews']['rows']} reviews "
+            f"and {meta['tables']['summaries']['rows']} summaries to {path} in {meta['seconds']:.2f} seconds"
+        ))
+
+    def check_snapshot(self, path):
+        try:
+            snapshot = CorpusSnapshot(path)
+        except FileNotFoundError:
+            self.stdout.write(self.style.WARNING('No snapshot has been exported yet.'))
+            return
+
+        if snapshot.is_current():
+            self.stdout.write(self.style.SUCCESS(f"The snapshot in {path} is up to date."))
+        else:
+            self.stdout.write(self.style.WARNING(
+                f"The snapshot in {path} is stale - run 'python manage.py export_snapshot'."
+            ))
@@ -2,36 +2,251 @@
 # Relies on using a local instance of LLAMA 3.2 3B via Ollama and appropriate local hardware
 # Designed to run on an NVIDIA RTX 3080ti
 # Run by using "python manage.py generate_ai_summaries_v3" in the terminal
+# Use "--concurrency N" to keep N products' requests in flight against the Ollama server at once
+# (set OLLAMA_NUM_PARALLEL on the server to at least N, or the extra requests just queue there)
+# To try it without a GPU, start "python manage.py ollama_stub" and pass "--host http://127.0.0.1:11435"
+# Products that already have a summary are skipped, and every attempt is recorded in SummaryProgress, so
+# re-running the command picks up where it stopped. "--resume" also skips the products that failed last time.
+# "--shard i/N" splits the catalogue between N processes or machines by a hash of the product id, e.g.
+#   python manage.py generate_ai_summaries_v3 --shard 0/2   and   python manage.py generate_ai_summaries_v3 --shard 1/2
+# By default both summaries come from one call that answers in JSON, so the reviews are only read by the model once.
+# An answer that isn't valid JSON with both sentences falls back to one call per summary ("--prompt-mode separate"
+# always makes the two calls)
+# Each prompt holds at most "--token-budget" tokens of reviews, chosen by summarization/selection.py
+# "--backend" picks the model behind the summaries (summarization/backends.py): the Ollama API (the default),
+# a Hugging Face model in this process generating "--batch-size" products at once, or a deterministic fake
+# Every summary records a fingerprint of the reviews it was built from, which refresh_summaries compares to find
+# the summaries that need regenerating
+# Each product's tokens, time to first token, latency and retries are written to "--metrics-file"
+# (summarization/telemetry.py), with a progress line every few products and a latency report at the end
 
-from django.core.management.base import BaseCommand
-from product_recommender.models import Product, Review, Summary
-import ollama
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F
+from product_recommender.ingestion.snapshot import current_snapshot
+from product_recommender.models import Product, Review, Summary, SummaryProgress
+from product_recommender.summarization.backends import BACKENDS, DEFAULT_KEEP_ALIVE, DEFAULT_MODELS, make_backend
+from product_recommender.summarization.fingerprint import review_fingerprint
+from product_recommender.summarization.selection import DEFAULT_TOKEN_BUDGET, estimate_tokens, select_reviews
+from product_recommender.summarization.telemetry import SummaryTelemetry, default_metrics_path, new_product_metrics
+from pathlib import Path
+import json
 import logging
+import threading
+import time
+import zlib
 
 logger = logging.getLogger(__name__)
 
+DEFAULT_MODEL = DEFAULT_MODELS['ollama']
+
+# Products finished between progress lines
+PROGRESS_INTERVAL = 5
+
+PROMPT_MODES = ('combined', 'separate')
+
+# JSON schema for the combined prompt's answer - Ollama constrains the output to it
+COMBINED_FORMAT = {
+    'type': 'object',
+    'properties': {
+        'positive': {'type': 'string'},
+        'negative': {'type': 'string'},
+    },
+    'required': ['positive', 'negative'],
+}
+
+
+def parse_combined_summary(text):
+    """
+    Parses the combined prompt's answer.
+
+    Returns:
+        (positive, negative), or None unless the text is a JSON object with both as non-empty strings.
+    """
+    try:
+        data = json.loads(text)
+    except ValueError:
+        return None
+    if not isinstance(data, dict):
+        return None
+    summaries = tuple(data.get(key) for key in ('positive', 'negative'))
+    if not all(isinstance(summary, str) and summary.strip() for summary in summaries):
+        return None
+    return tuple(summary.strip() for summary in summaries)
+
+
+def add_backend_arguments(parser):
+    """The options that choose and configure the summary backend, shared with refresh_summaries."""
+    parser.add_argument('--backend', choices=BACKENDS, default='ollama',
+                        help='Model behind the summaries: the Ollama API, a Hugging Face model in this process, '
+                             'or a deterministic fake (default: ollama).')
+    parser.add_argument('--model', default=None,
+                        help=f'Model name (default: {DEFAULT_MODEL} for ollama, '
+                             f'{DEFAULT_MODELS["transformers"]} for transformers).')
+    parser.add_argument('--host', default=None,
+                        help='Ollama server URL (default: OLLAMA_HOST, or http://localhost:11434).')
+    parser.add_argument('--keep-alive', default=DEFAULT_KEEP_ALIVE,
+                        help='How long the Ollama server keeps the model - and the KV cache of the shared prompt '
+                             f'prefix - loaded between calls (default: {DEFAULT_KEEP_ALIVE}).')
+    parser.add_argument('--batch-size', type=int, default=8,
+                        help='Products generated together by the transformers backend (default: 8).')
+    parser.add_argument('--prompt-mode', choices=PROMPT_MODES, default='combined',
+                        help='"combined" asks for both summaries in one JSON answer, falling back to two calls '
+                             'if it is invalid; "separate" makes one call per summary (default: combined).')
+    parser.add_argument('--token-budget', type=int, default=DEFAULT_TOKEN_BUDGET,
+                        help='Estimated tokens of review text per prompt, chosen to cover every star rating '
+                             f'without near-duplicates; 0 for every review (default: {DEFAULT_TOKEN_BUDGET}).')
+    parser.add_argument('--concurrency', type=int, default=None,
+                        help='Products summarised at once, each with its requests in flight '
+                             '(default: the batch size for transformers, otherwise 1).')
+    parser.add_argument('--metrics-file', default=None,
+                        help='JSON Lines file for the per-product metrics '
+                             '(default: a new file in SUMMARY_METRICS_DIR).')
+
+
+def backend_from_options(options):
+    try:
+        return make_backend(options['backend'], model=options['model'], host=options['host'],
+                            batch_size=options['batch_size'], keep_alive=options['keep_alive'])
+    except ImportError as e:
+        raise CommandError(str(e))
+
+
+def prefill_report(backend, products):
+    """A line on the prompt tokens the backend reused from the prefix's KV cache, or None if it reported none."""
+    prefill = backend.prefill
+    if not prefill.prompt_tokens or not products:
+        return None
+    return (
+        f"Prefix KV cache reused {prefill.cached_tokens} of {prefill.prompt_tokens} prompt tokens "
+        f"({prefill.cached_tokens / prefill.prompt_tokens:.0%}), saving about "
+        f"{prefill.saved_seconds() / products:.3f} seconds of prefill per product"
+    )
+
+
+def metrics_path_from_options(options, command):
+    return Path(options['metrics_file']) if options['metrics_file'] else default_metrics_path(command)
+
+
+def progress_printer(stdout):
+    """An on_progress callback that writes a progress line to stdout every PROGRESS_INTERVAL products."""
+    def on_progress(progress):
+        if progress['done'] % PROGRESS_INTERVAL and progress['done'] != progress['total']:
+            return
+        total = f"/{progress['total']}" if progress['total'] is not None else ''
+        eta = f", ETA {progress['eta_seconds']:.0f}s" if progress['eta_seconds'] is not None else ''
+        stdout.write(
+            f"{progress['done']}{total} products ({progress['failed']} failed), "
+            f"{progress['products_per_minute']:.1f} per minute, "
+            f"{progress['output_tokens_per_second']:.1f} output tokens per second, "
+            f"{progress['queued']} queued, {progress['running']} running{eta}"
+        )
+    return on_progress
+
+
+def parse_shard(value):
+    """Parses "i/N" into (i, N), where 0 <= i < N."""
+    try:
+        index, count = (int(part) for part in value.split('/'))
+    except ValueError:
+        raise CommandError(f"--shard must look like i/N, got '{value}'")
+    if count < 1 or not 0 <= index < count:
+        raise CommandError(f"--shard {value} needs 0 <= i < N")
+    return index, count
+
+
+def in_shard(product_id, shard):
+    """True if the product belongs to the (i, N) shard. crc32 is stable across processes, unlike hash()."""
+    if shard is None:
+        return True
+    index, count = shard
+    return zlib.crc32(product_id.encode('utf-8')) % count == index
+
 # Django convention for running a command from the CLI
 class Command(BaseCommand):
     help = "Generate AI summaries for products in the database"
-    
-    # Django convention for the actions taken when running the command
-    # In this case, writing the log file, creating an instance of GenerateAISummaries, and generating AI summaries
-    def handle(self, *args, **options):
 
-        # log which products have been processed
-        with open('processed_products.txt', 'w') as f:
-            f.write('')  # Empty the file
+    def add_arguments(self, parser):
+        parser.add_argument('--no-snapshot', action='store_true',
+                            help='Read the reviews from the database even if the corpus snapshot is up to date.')
+        add_backend_arguments(parser)
+        parser.add_argument('--max-pending', type=int, default=None,
+                            help='Products read ahead of the workers before reading waits for one to finish '
+                                 '(default: twice the concurrency).')
+        parser.add_argument('--resume', action='store_true',
+                            help='Also skip the products a previous run failed on, instead of retrying them.')
+        parser.add_argument('--limit', type=int, default=None, help='Stop after attempting this many products.')
+        parser.add_argument('--shard', default=None,
+                            help='Only process shard i of N (0-based), e.g. 0/4, so N processes can split the catalogue.')
 
-        generator = GenerateAISummaries()
-        generator.generate_ai_summaries()
+    # Django convention for the actions taken when running the command
+    # In this case, creating an instance of GenerateAISummaries, and generating AI summaries
+    def handle(self, *args, **options):
+        generator = GenerateAISummaries(
+            use_snapshot=not options['no_snapshot'],
+            backend=backend_from_options(options),
+            prompt_mode=options['prompt_mode'],
+            token_budget=options['token_budget'] or None,
+            concurrency=options['concurrency'],
+            max_pending=options['max_pending'],
+            shard=parse_shard(options['shard']) if options['shard'] else None,
+            metrics_path=metrics_path_from_options(options, 'generate_ai_summaries'),
+            on_progress=progress_printer(self.stdout),
+        )
+        try:
+            stats = generator.generate_ai_summaries(resume=options['resume'], limit=options['limit'])
+        finally:
+            generator.backend.close()
+        self.stdout.write(self.style.SUCCESS(
+            f"Summarised {stats['succeeded']} products ({stats['failed']} failed, {stats['skipped']} skipped) "
+            f"in {stats['seconds']:.1f} seconds "
+            f"- {stats['succeeded'] / max(stats['seconds'], 1e-9) * 60:.1f} products per minute"
+            + (f", {stats['fallbacks']} fell back to separate prompts" if stats['fallbacks'] else '')
+        ))
+        if stats['review_tokens']:
+            self.stdout.write(
+                f"Review selection kept {stats['selected_tokens']} of {stats['review_tokens']} review tokens "
+                f"({stats['selected_tokens'] / stats['review_tokens']:.0%})"
+            )
+        report = prefill_report(generator.backend, stats['succeeded'] + stats['failed'])
+        if report:
+            self.stdout.write(report)
+        for line in stats['report']:
+            self.stdout.write(line)
 
 
 # Initialise the llama model with appropriate parameters
 class GenerateAISummaries:
 
     # constructor method
-    def __init__(self):
+    def __init__(self, use_snapshot=True, host=None, model=DEFAULT_MODEL, prompt_mode='combined',
+                 token_budget=DEFAULT_TOKEN_BUDGET, concurrency=None, max_pending=None, shard=None, backend=None,
+                 metrics_path=None, on_progress=None):
         # Define global variables
+        # the reviews are read from the corpus snapshot (see export_snapshot) when it is up to date
+        self.snapshot = current_snapshot(('reviews',)) if use_snapshot else None
+        # shared by every worker thread - an Ollama server at host unless another backend is given
+        self.backend = backend or make_backend('ollama', model=model, host=host)
+        self.prompt_mode = prompt_mode
+        # None sends every review
+        self.token_budget = token_budget
+        # combined answers that were invalid, counted across the worker threads
+        self.fallbacks = 0
+        self.fallbacks_lock = threading.Lock()
+        # enough products in flight to fill the backend's batches
+        self.concurrency = max(1, concurrency or self.backend.batch_size)
+        # backpressure - at most this many products (and their concatenated reviews) are held in memory
+        self.max_pending = max(self.concurrency, max_pending or self.concurrency * 2)
+        self.shard = shard
+        self.shard_label = f"{shard[0]}/{shard[1]}" if shard else ''
+        # per-product metrics are written here (None keeps them in memory for the report only)
+        self.metrics_path = metrics_path
+        # called with SummaryTelemetry.progress() after every finished product
+        self.on_progress = on_progress
+        # products being summarised on the worker threads, for the progress line
+        self.running = 0
+        self.running_lock = threading.Lock()
         self.positive_review_sentiment_prompt = """You are a precise review analyzer. Your responses must:
                                                     1. Be EXACTLY one sentence
                                                     2. Focus ONLY on positive aspects
@@ -44,87 +259,278 @@ class GenerateAISummaries:
                                                     3. Never include greetings or additional commentary
                                                     4. Never make suggestions or recommendations
                                                     5. Never include pros or overall assessment"""
+        self.combined_review_sentiment_prompt = """You are a precise review analyzer. Answer with a JSON object with two keys:
+                                                    "positive": EXACTLY one sentence on ONLY the positive aspects
+                                                    "negative": EXACTLY one sentence on ONLY the negative aspects
+                                                    Never include greetings, additional commentary, suggestions,
+                                                    recommendations or an overall assessment"""
 
-    # function to be called for the log file, stating product_id and success/failure, writing to the file
-    def log_processed_product(self, product_id, success=True):
+    # function to be called for each attempted product, recording product_id and success/failure in SummaryProgress
+    def log_processed_product(self, product_id, success=True, error=None):
         """
-        Logs processed product IDs to a file with their status.
-        
+        Records a processed product's status in SummaryProgress.
+
         Args:
             product_id: The ID of the processed product
             success: Boolean indicating if processing was successful
+            error: The error message if it failed
+
+        Returns:
+            The product's failed attempts since it last succeeded, i.e. how many failures this attempt retries.
         """
-        status = "SUCCESS" if success else "FAILED"
-        with open('processed_products.txt', 'a') as f:
-            f.write(f"{product_id}: {status}\n")
+        progress, created = SummaryProgress.objects.update_or_create(
+            product_id_id=product_id,
+            defaults={
+                'status': SummaryProgress.SUCCEEDED if success else SummaryProgress.FAILED,
+                'error': error,
+                'shard': self.shard_label,
+            },
+        )
+        SummaryProgress.objects.filter(pk=progress.pk).update(
+            attempts=F('attempts') + 1,
+            failures=0 if success else F('failures') + 1,
+        )
+        # update_or_create left failures alone, so this is the count before the attempt
+        return progress.failures
+
+    # The products to skip - those with a complete summary and, when resuming, those a previous run failed on
+    def done_product_ids(self, resume):
+        done = set(Summary.objects.filter(
+            positive_sentiment__isnull=False, negative_sentiment__isnull=False,
+        ).values_list('product_id', flat=True))
+        if resume:
+            done.update(SummaryProgress.objects.filter(status=SummaryProgress.FAILED)
+                        .values_list('product_id', flat=True))
+        return done
+
+    # Yields (product_id, [(text, score, created_at_unix), ...]) for the products include() accepts, from the
+    # snapshot if there is one. Every review is included, with or without text, in id order
+    # Only the included products' reviews are read
+    def product_reviews(self, include=lambda product_id: True):
+        if self.snapshot is not None:
+            product_ids = self.snapshot.products['product_id']
+            for product_row in range(len(self.snapshot.products)):
+                product_id = product_ids[product_row]
+                if include(product_id):
+                    yield product_id, self.snapshot.scored_reviews(product_row)
+            return
+        for product_id in Product.objects.order_by('product_id').values_list('product_id', flat=True):
+            if include(product_id):
+                yield product_id, self.read_reviews(product_id)
+
+    def product_ids(self):
+        if self.snapshot is not None:
+            return self.snapshot.products['product_id']
+        return Product.objects.values_list('product_id', flat=True).iterator(chunk_size=2000)
+
+    @staticmethod
+    def read_reviews(product_id):
+        return list(Review.objects.filter(product_id_id=product_id).order_by('id').values_list(
+            'review_text', 'review_score', 'created_at_unix',
+        ))
+
+    # The texts of the reviews that go into the product's prompt, within the token budget
+    def select_review_texts(self, reviews, stats):
+        reviews = [review for review in reviews if review[0]]
+        review_texts = select_reviews(reviews, self.token_budget)
+        stats['review_tokens'] += sum(estimate_tokens(text) for text, _, _ in reviews)
+        stats['selected_tokens'] += sum(estimate_tokens(text) for text in review_texts)
+        return review_texts
+
+    # Concatenates a product's reviews and generates its positive and negative summaries
+    # Runs on the worker threads, so it doesn't touch the database
+    # metrics (see telemetry.new_product_metrics) gets every model call's tokens and time to first token
+    def summarize_product(self, product_id, review_texts, metrics=None):
+        print(f"product id under inspection: " + product_id)
+        concatenated_reviews = "\n\n".join(review_texts)
+
+        if self.prompt_mode == 'combined':
+            summaries = self.generate_combined_summary(concatenated_reviews, metrics)
+            if summaries is not None:
+                return summaries
+            logger.warning(f"Invalid combined summary for product ID: {product_id}, using separate prompts")
+            with self.fallbacks_lock:
+                self.fallbacks += 1
 
-    # Loops over all products in Product model, concatenates reviews for the product,
+        positive_summary = self.generate_summary(concatenated_reviews, self.positive_review_sentiment_prompt, metrics)
+        negative_summary = self.generate_summary(concatenated_reviews, self.negative_review_sentiment_prompt, metrics)
+        if positive_summary is None or negative_summary is None:
+            # generate_summary has logged why - keep the product without a summary so it is retried
+            raise ValueError("the model returned no summary")
+        return positive_summary, negative_summary
+
+    # Creates or updates the product's Summary and records the product as done, on the main thread
+    # Returns the product's failed attempts before this one
+    def save_summary(self, product_id, positive_summary, negative_summary, fingerprint=None):
+        with transaction.atomic():
+            summary, created = Summary.objects.update_or_create(
+                product_id_id=product_id,
+                defaults={
+                    'positive_sentiment': positive_summary,
+                    'negative_sentiment': negative_summary,
+                    **(fingerprint or {}),
+                }
+            )
+            return self.log_processed_product(product_id)
+
+    # Loops over the products in this shard without a summary, concatenates reviews for the product,
     # calls generate_summary for them to generate positive/negative AI summaries
     # saves to the Summary model
-    # logs success/failure in the processed_products.txt file
-    def generate_ai_summaries(self):
+    # records success/failure in SummaryProgress
+    def generate_ai_summaries(self, resume=False, limit=None):
         """
-        Generates AI summaries for all products in the database.
+        Generates AI summaries for the products in the database (or in this shard) that don't have one.
+        Up to `concurrency` products are summarised at once on a thread pool. Reading the next product
+        waits while `max_pending` products are queued or in flight, so a slow LLM server holds back the
+        reader instead of the queue growing without bound.
+
+        Args:
+            resume: Also skip the products a previous run failed on
+            limit: Stop after attempting this many products
+
+        Returns:
+            A dict with the products that succeeded, failed and were skipped, and the seconds taken.
         """
-        for product in Product.objects.all():
-            try:
-                print(f"product id under inspection: " + product.product_id)
-                reviews = Review.objects.filter(product_id_id=product.product_id)
-                concatenated_reviews = "\n\n".join([review.review_text for review in reviews])
-
-                positive_summary = self.generate_summary(concatenated_reviews, self.positive_review_sentiment_prompt)
-                negative_summary = self.generate_summary(concatenated_reviews, self.negative_review_sentiment_prompt)
-
-                # Create or update Summary object
-                product_obj = Product.objects.get(product_id=product.product_id) 
-                summary, created = Summary.objects.update_or_create(
-                    product_id=product_obj,
-                    defaults={
-                        'positive_sentiment': positive_summary,
-                        'negative_sentiment': negative_summary,
-                    }
-                )
-                summary.positive_sentiment = positive_summary
-                summary.negative_sentiment = negative_summary
-                summary.save()
-
-                logger.info(f"Generated summaries for product ID: {product.product_id}")
-                self.log_processed_product(product.product_id)
-
-            except Exception as e:
-                logger.error(f"Failed to generate summaries for product ID: {product.product_id}: {e}")
-                self.log_processed_product(product.product_id, success=False)
+        stats = self._new_stats()
+        start_time = time.time()
+        done = self.done_product_ids(resume)
+
+        def include(product_id):
+            if not in_shard(product_id, self.shard):
+                return False
+            if product_id in done:
+                stats['skipped'] += 1
+                return False
+            return True
+
+        # counted up front for the progress line's ETA - the product ids only, no reviews
+        total = sum(1 for product_id in self.product_ids()
+                    if in_shard(product_id, self.shard) and product_id not in done)
+        if limit is not None:
+            total = min(total, limit)
+        products = self.product_reviews(include) if limit != 0 else ()
+        self.summarize_products(products, stats, limit, total=total)
+        return dict(stats, fallbacks=self.fallbacks, seconds=time.time() - start_time)
+
+    def refresh_summaries(self, product_ids):
+        """
+        Regenerates the summaries of the given products, in the order given, whether or not they have one.
+        Their reviews are read from the database, as the snapshot is out of date once reviews have changed.
+
+        Returns:
+            A dict with the products that succeeded and failed, and the seconds taken.
+        """
+        stats = self._new_stats()
+        start_time = time.time()
+        products = ((product_id, self.read_reviews(product_id)) for product_id in product_ids)
+        self.summarize_products(products, stats, total=len(product_ids))
+        return dict(stats, fallbacks=self.fallbacks, seconds=time.time() - start_time)
+
+    @staticmethod
+    def _new_stats():
+        return {'succeeded': 0, 'failed': 0, 'skipped': 0, 'review_tokens': 0, 'selected_tokens': 0}
+
+    # Summarises a product on a worker thread, timing its wait for the worker and its own latency into metrics
+    def _timed_summarize_product(self, product_id, review_texts, metrics, submitted_at):
+        started_at = time.perf_counter()
+        metrics['queue_seconds'] = started_at - submitted_at
+        with self.running_lock:
+            self.running += 1
+        try:
+            return self.summarize_product(product_id, review_texts, metrics)
+        finally:
+            metrics['latency_seconds'] = time.perf_counter() - started_at
+            with self.running_lock:
+                self.running -= 1
+
+    # Summarises (product_id, reviews) pairs on the thread pool and saves the results, adding to stats
+    # total is the number of products expected, for the ETA; the end-of-run report lines go in stats['report']
+    def summarize_products(self, products, stats, limit=None, total=None):
+        telemetry = SummaryTelemetry(self.metrics_path, total)
+
+        def save_finished(pending, done):
+            for future in done:
+                product_id, fingerprint, metrics = pending.pop(future)
+                try:
+                    retries = self.save_summary(product_id, *future.result(), fingerprint=fingerprint)
+                    logger.info(f"Generated summaries for product ID: {product_id}")
+                    stats['succeeded'] += 1
+                    telemetry.record(product_id, metrics, success=True, retries=retries)
+                except Exception as e:
+                    logger.error(f"Failed to generate summaries for product ID: {product_id}: {e}")
+                    retries = self.log_processed_product(product_id, success=False, error=str(e))
+                    stats['failed'] += 1
+                    telemetry.record(product_id, metrics, success=False, retries=retries, error=str(e))
+                if self.on_progress is not None:
+                    running = self.running
+                    self.on_progress(telemetry.progress(queued=max(len(pending) - running, 0), running=running))
+
+        try:
+            with ThreadPoolExecutor(max_workers=self.concurrency) as executor:
+                pending = {}
+                submitted = 0
+                for product_id, reviews in products:
+                    review_texts = self.select_review_texts(reviews, stats)
+                    metrics = new_product_metrics()
+                    future = executor.submit(self._timed_summarize_product, product_id, review_texts, metrics,
+                                             time.perf_counter())
+                    pending[future] = (product_id, review_fingerprint(reviews), metrics)
+                    submitted += 1
+                    if len(pending) >= self.max_pending:
+                        finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        save_finished(pending, finished)
+                    if limit is not None and submitted >= limit:
+                        break
+                while pending:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    save_finished(pending, finished)
+        finally:
+            telemetry.close()
+        stats['report'] = telemetry.report()
+
+    # the fixed start of every prompt - the backend can reuse the work done on it across products
+    @staticmethod
+    def prompt_prefix(prompt):
+        return f"{prompt}\n\nREVIEW TEXT:\n"
 
     # generates a summary for an individual product
     # agnostic towards positive, negative - depends on the prompt argument
-    def generate_summary(self, reviews_text, prompt):
+    def generate_summary(self, reviews_text, prompt, metrics=None):
         """
-        Generates a summary using the Ollama model.
+        Generates a summary using the summary backend.
 
         Args:
             reviews_text: The concatenated review text for the product.
             prompt: The prompt for the LLM.
+            metrics: The product's metrics, which the call is added to.
 
         Returns:
             The generated summary.
         """
         try:
-            prompt_plus_reviews = f"{prompt}\n\nREVIEW TEXT:\n{reviews_text}\n\n"
-            # Stream response
-            response = ollama.generate(
-                model="llama3.2",  # Specify the model explicitly
-                prompt=prompt_plus_reviews, 
-                stream=True,
-                options={
-                    "max_tokens": 10  # Adjust the output tokens
-                }
-            )
-            summary = ""
-            for chunk in response:
-                data = chunk["response"]
-                summary += data
-            return summary.strip()
-
+            return self.backend.generate(self.prompt_prefix(prompt), f"{reviews_text}\n\n", metrics=metrics)
         except Exception as e:
             logger.error(f"Failed to generate summary: {e}")
-            return None
\ No newline at end of file
+            return None
+
+    # generates both summaries for an individual product with one call, answered in JSON
+    def generate_combined_summary(self, reviews_text, metrics=None):
+        """
+        Generates the positive and negative summaries with a single call to the summary backend.
+
+        Args:
+            reviews_text: The concatenated review text for the product.
+            metrics: The product's metrics, which the call is added to.
+
+        Returns:
+            (positive, negative), or None if the call failed or the answer was invalid.
+        """
+        try:
+            answer = self.backend.generate(
+                self.prompt_prefix(self.combined_review_sentiment_prompt), f"{reviews_text}\n\n",
+                json_format=COMBINED_FORMAT, metrics=metrics,
+            )
+        except Exception as e:
+            logger.error(f"Failed to generate combined summary: {e}")
+            return None
+        return parse_combined_summary(answer)
@@ -0,0 +1,43 @@
+# This class creates a base command which loads a snapshot written by export_snapshot into the database,
+# e.g. to set up another machine without downloading and converting the Amazon dumps
+# Products are upserted, and reviews and summaries keep their ids, so the snapshot stays current afterwards
+# To run this, use "python manage.py import_snapshot --input path/to/snapshot" in the CLI
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from product_recommender.ingestion.snapshot import CorpusSnapshot, SnapshotError, import_snapshot, snapshot_dir
+
+
+class Command(BaseCommand):
+    help = 'Loads the products, reviews and summaries of a columnar snapshot into the database.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--input', default=None,
+                            help='Snapshot directory (default: CORPUS_SNAPSHOT_DIR in settings.py).')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per INSERT (default: 2000).')
+        parser.add_argument('--replace', action='store_true',
+                            help='Delete the reviews and summaries already in the database first.')
+
+    def handle(self, *args, **options):
+        path = options['input'] or snapshot_dir()
+        try:
+            snapshot = CorpusSnapshot(path)
+        except FileNotFoundError:
+            raise CommandError(f"No snapshot found in {path}")
+
+        start_time = time.time()
+
+        def on_table(table, rows):
+            self.stdout.write(f"Imported {rows} {table} ({time.time() - start_time:.1f}s)")
+
+        try:
+            counts = import_snapshot(snapshot, batch_size=options['batch_size'], replace=options['replace'],
+                                     on_table=on_table)
+        except SnapshotError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Imported {counts['products']} products, {counts['reviews']} reviews and {counts['summaries']} "
+            f"summaries in {time.time() - start_time:.2f} seconds"
+        ))
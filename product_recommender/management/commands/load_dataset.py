@@ -0,0 +1,107 @@
+# This class creates a base command which loads the products and reviews straight from the downloaded gzip
+# files, in one pass over each, without writing the intermediate files of the clean_* commands
+# Products in Home & Kitchen are upserted first, then the reviews of the loaded products are bulk inserted.
+# Only one batch of records is held in memory at a time, plus the set of loaded product ids.
+# Reviews are checkpointed like populate_reviews - if the load is interrupted, run the command again to resume
+# To run this, use "python manage.py load_dataset" in the CLI
+
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from product_recommender.ingestion import products, reviews
+from product_recommender.ingestion.checkpoint import Checkpoint
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Seconds between progress lines
+PROGRESS_INTERVAL = 5
+
+
+def peak_memory_mb():
+    """Peak resident memory of this process in MB, where the platform reports it."""
+    if resource is None:
+        return None
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+class Command(BaseCommand):
+    help = 'Loads Home & Kitchen products and their reviews straight from the downloaded .json.gz files.'
+
+    def add_arguments(self, parser):
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        data_dir = os.path.join(script_dir, '..', '..', '..', 'data_files')
+        parser.add_argument('--metadata', default=os.path.join(data_dir, 'metadata.json.gz'),
+                            help='Metadata dump (default: data_files/metadata.json.gz).')
+        parser.add_argument('--reviews', default=os.path.join(data_dir, 'home_and_kitchen_reviews.json.gz'),
+                            help='Reviews dump (default: data_files/home_and_kitchen_reviews.json.gz).')
+        parser.add_argument('--batch-size', type=int, default=products.DEFAULT_BATCH_SIZE,
+                            help=f'Rows per INSERT (default: {products.DEFAULT_BATCH_SIZE}).')
+        parser.add_argument('--transaction-size', type=int, default=reviews.DEFAULT_TRANSACTION_SIZE,
+                            help=f'Reviews per transaction and checkpoint (default: {reviews.DEFAULT_TRANSACTION_SIZE}).')
+        parser.add_argument('--checkpoint', default=os.path.join(data_dir, 'load_dataset.checkpoint.json'),
+                            help='Review checkpoint file (default: data_files/load_dataset.checkpoint.json).')
+        parser.add_argument('--skip-products', action='store_true',
+                            help='Only load reviews, e.g. to resume after the products were loaded.')
+        parser.add_argument('--restart', action='store_true',
+                            help='Remove the reviews written by an interrupted load and load the reviews from the start.')
+
+    def handle(self, *args, **options):
+        last_report = time.time()
+
+        def report(stats, unit):
+            nonlocal last_report
+            if time.time() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.time()
+                memory = peak_memory_mb()
+                self.stdout.write(
+                    f"  {stats['records']} records, {stats[unit]} {unit} "
+                    f"({stats['records'] / max(stats['seconds'], 1e-9):.0f} records/s"
+                    + (f", peak memory {memory:.0f} MB)" if memory is not None else ")")
+                )
+
+        def on_error(record, e):
+            self.stderr.write(self.style.ERROR(f"Error processing record: {record} - {e}"))
+
+        checkpoint = Checkpoint(options['checkpoint'], options['reviews'])
+        if options['restart']:
+            try:
+                removed = reviews.discard_load(checkpoint)
+            except ValueError as e:
+                raise CommandError(str(e))
+            if removed:
+                self.stdout.write(f"Removed {removed} reviews written by the interrupted load")
+        resuming = checkpoint.load() is not None
+
+        # a resumed run has loaded the products already
+        if not options['skip_products'] and not resuming:
+            self.stdout.write(f"Loading products from {options['metadata']}")
+            stats = products.load_products(
+                options['metadata'], batch_size=options['batch_size'],
+                on_batch=lambda stats: report(stats, 'products'), on_error=on_error,
+            )
+            self.stdout.write(self.style.SUCCESS(
+                f"Upserted {stats['products']} products from {stats['records']} records in {stats['seconds']:.1f} seconds "
+                f"(skipped {stats['skipped_title']} without a title, {stats['skipped_category']} outside Home & Kitchen, "
+                f"{stats['errors']} errors)"
+            ))
+
+        self.stdout.write(f"{'Resuming' if resuming else 'Loading'} reviews from {options['reviews']}")
+        stats = reviews.load_reviews(
+            options['reviews'], checkpoint,
+            batch_size=options['batch_size'], transaction_size=options['transaction_size'],
+            on_commit=lambda stats: report(stats, 'reviews'), on_error=on_error,
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Inserted {stats['written']} reviews in {stats['seconds']:.1f} seconds "
+            f"({stats['written'] / max(stats['seconds'], 1e-9):.0f} rows/s; skipped {stats['skipped']} for products "
+            f"not loaded, {stats['errors']} errors)"
+        ))
+
+        memory = peak_memory_mb()
+        if memory is not None:
+            self.stdout.write(f"Peak memory: {memory:.0f} MB")
@@ -0,0 +1,103 @@
+# This class creates a base command which load-tests one or more running servers and compares their throughput
+# Start the servers first, for example the WSGI and the ASGI (async views) versions of the project side by side:
+#   gunicorn product_recommender.wsgi -w 1 --threads 16 -b 127.0.0.1:8000
+#   uvicorn product_recommender.asgi:application --workers 1 --port 8001
+# then name each one with --target
+# To run this, use "python manage.py load_test --target wsgi=http://127.0.0.1:8000 --target asgi=http://127.0.0.1:8001" in the CLI
+
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from django.core.management.base import BaseCommand, CommandError
+
+from product_recommender.models import Product
+
+# The AJAX calls a product page makes, and a search
+ENDPOINTS = {
+    'recommendations': lambda product_id: f"/api/recommendations/{product_id}/",
+    'reviews': lambda product_id: f"/api/reviews/{product_id}/",
+    'search': lambda product_id: f"/search/?q={product_id[:4]}",
+}
+
+
+def _run_client(base_url, paths, deadline, timeout, results, lock):
+    """One simulated client, sending requests back to back until the deadline."""
+    latencies = []
+    errors = 0
+    while time.monotonic() < deadline:
+        start_time = time.perf_counter()
+        try:
+            with urllib.request.urlopen(base_url + random.choice(paths), timeout=timeout) as response:
+                response.read()
+            latencies.append(time.perf_counter() - start_time)
+        except (urllib.error.URLError, OSError):
+            errors += 1
+    with lock:
+        results['latencies'].extend(latencies)
+        results['errors'] += errors
+
+
+class Command(BaseCommand):
+    help = 'Load-tests running servers (e.g. WSGI vs ASGI) with concurrent clients and compares requests per second.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--target', action='append', required=True,
+                            help='NAME=URL of a running server, e.g. asgi=http://127.0.0.1:8001 (repeatable).')
+        parser.add_argument('--endpoint', choices=[*ENDPOINTS, 'all'], default='recommendations',
+                            help='Endpoint to request (default: recommendations).')
+        parser.add_argument('--concurrency', type=int, default=32, help='Simultaneous clients (default: 32).')
+        parser.add_argument('--duration', type=float, default=20, help='Seconds per target (default: 20).')
+        parser.add_argument('--warmup', type=float, default=3, help='Unmeasured seconds per target (default: 3).')
+        parser.add_argument('--products', type=int, default=200,
+                            help='Random products the requests are spread over (default: 200).')
+        parser.add_argument('--timeout', type=float, default=30, help='Per-request timeout in seconds (default: 30).')
+
+    def handle(self, *args, **options):
+        targets = []
+        for target in options['target']:
+            name, _, url = target.partition('=')
+            if not url:
+                raise CommandError(f"--target must look like NAME=URL, got '{target}'")
+            targets.append((name, url.rstrip('/')))
+
+        product_ids = list(
+            Product.objects.order_by('?').values_list('product_id', flat=True)[:options['products']]
+        )
+        if not product_ids:
+            raise CommandError('No products in the database to request.')
+        endpoints = list(ENDPOINTS) if options['endpoint'] == 'all' else [options['endpoint']]
+        paths = [ENDPOINTS[endpoint](product_id) for endpoint in endpoints for product_id in product_ids]
+
+        self.stdout.write(
+            f"{len(paths)} paths, {options['concurrency']} clients, {options['duration']}s per target"
+        )
+        self.stdout.write(
+            f"{'target':>10} {'requests':>9} {'errors':>7} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}"
+        )
+        for name, url in targets:
+            if options['warmup']:
+                self._load(url, paths, options['concurrency'], options['warmup'], options['timeout'])
+            results, elapsed = self._load(url, paths, options['concurrency'], options['duration'], options['timeout'])
+
+            latencies = np.array(results['latencies']) * 1000
+            percentiles = np.percentile(latencies, [50, 95, 99]) if len(latencies) else [0, 0, 0]
+            self.stdout.write(
+                f"{name:>10} {len(latencies):>9} {results['errors']:>7} {len(latencies) / elapsed:>8.1f} "
+                f"{percentiles[0]:>8.1f} {percentiles[1]:>8.1f} {percentiles[2]:>8.1f}"
+            )
+
+    @staticmethod
+    def _load(url, paths, concurrency, duration, timeout):
+        results = {'latencies': [], 'errors': 0}
+        lock = threading.Lock()
+        start_time = time.monotonic()
+        deadline = start_time + duration
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for _ in range(concurrency):
+                executor.submit(_run_client, url, paths, deadline, timeout, results, lock)
+        return results, time.monotonic() - start_time
@@ -0,0 +1,234 @@
+# This class creates a base command which runs a stand-in for the Ollama HTTP API, for trying out and timing
+# generate_ai_summaries_v3 without a GPU or a model
+# POST /api/generate answers with a fixed sentence, streamed a word at a time like Ollama, after a configurable
+# delay before the first word and between words. Reading the prompt takes --prompt-rate tokens a second on top,
+# so longer prompts cost more, as they do on a GPU. Like a real server, each of the --parallel slots keeps the
+# last prompt it read, and a request only pays for the part of its prompt after the longest start it shares with
+# one of them - so a fixed instruction prefix is read once (--no-prompt-cache to read every prompt in full). Requests with a "format" (JSON mode) get a JSON object with
+# "positive" and "negative" sentences - --invalid-json-rate of them are cut short to exercise callers' fallbacks.
+# --parallel caps the requests served at once, like OLLAMA_NUM_PARALLEL on a real server - the rest wait their turn.
+# To run this, use "python manage.py ollama_stub" in the CLI, then point the summarizer at it:
+#   python manage.py generate_ai_summaries_v3 --host http://127.0.0.1:11435 --concurrency 4
+
+import json
+import os
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from django.core.management.base import BaseCommand
+
+STUB_WORDS = 'The reviewers describe this product in a single clear sentence'.split()
+
+
+class StubSettings:
+    def __init__(self, latency=0.5, token_delay=0.02, tokens=20, parallel=4, prompt_rate=4000, invalid_json_rate=0.0,
+                 prompt_cache=True):
+        self.latency = latency
+        self.token_delay = token_delay
+        self.tokens = tokens
+        self.prompt_rate = prompt_rate
+        self.invalid_json_rate = invalid_json_rate
+        self.slots = threading.BoundedSemaphore(parallel)
+        self.prompt_cache = prompt_cache
+        # the last prompt read by each slot
+        self.cached_prompts = [''] * parallel
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.prompt_tokens = 0
+        self.evaluated_tokens = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+
+def _prompt_tokens(prompt):
+    # roughly four characters per token
+    return len(prompt) // 4
+
+
+def _cached_tokens(settings, prompt):
+    """Takes the slot whose last prompt shares the longest start with prompt. Returns the tokens it saves."""
+    if not settings.prompt_cache:
+        return 0
+    with settings.lock:
+        shared = [len(os.path.commonprefix([cached, prompt])) for cached in settings.cached_prompts]
+        slot = max(range(len(shared)), key=shared.__getitem__)
+        settings.cached_prompts[slot] = prompt
+    return shared[slot] // 4
+
+
+def _stub_sentence(count):
+    return ' '.join(STUB_WORDS[i % len(STUB_WORDS)] for i in range(count)) + '.'
+
+
+def _stub_response_chunks(settings, json_mode):
+    """The pieces of a response as they are streamed - words of a sentence, or slices of a JSON object."""
+    if not json_mode:
+        words = _stub_sentence(settings.tokens).split(' ')
+        return [word + ('' if i == len(words) - 1 else ' ') for i, word in enumerate(words)]
+    text = json.dumps({'positive': _stub_sentence(settings.tokens // 2), 'negative': _stub_sentence(settings.tokens // 2)})
+    if random.random() < settings.invalid_json_rate:
+        text = text[:len(text) // 2]
+    return [text[i:i + 8] for i in range(0, len(text), 8)]
+
+
+def serve_in_background(settings, host='127.0.0.1', port=0):
+    """Starts a stub server on a background thread. Returns the server (call shutdown() to stop it) and its URL."""
+    handler = type('Handler', (OllamaStubHandler,), {'settings': settings})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+class OllamaStubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    settings = None
+
+    def log_message(self, format, *args):
+        # one line per request would swamp the throughput being measured
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        if self.path == '/api/version':
+            self._send_json(200, {'version': 'stub'})
+        elif self.path == '/api/tags':
+            self._send_json(200, {'models': []})
+        else:
+            self._send_json(404, {'error': 'not found'})
+
+    def do_POST(self):
+        length = int(self.headers.get('Content-Length', 0))
+        try:
+            request = json.loads(self.rfile.read(length) or b'{}')
+        except ValueError:
+            self._send_json(400, {'error': 'invalid JSON'})
+            return
+        if self.path != '/api/generate':
+            self._send_json(404, {'error': 'not found'})
+            return
+
+        settings = self.settings
+        # wait for a free slot, as a real server queues requests beyond OLLAMA_NUM_PARALLEL
+        with settings.slots:
+            with settings.lock:
+                settings.requests += 1
+                settings.prompt_tokens += _prompt_tokens(request.get('prompt', ''))
+                settings.in_flight += 1
+                settings.max_in_flight = max(settings.max_in_flight, settings.in_flight)
+            try:
+                self._generate(request)
+            finally:
+                with settings.lock:
+                    settings.in_flight -= 1
+
+    def _generate(self, request):
+        settings = self.settings
+        start_time = time.perf_counter()
+        model = request.get('model', '')
+        prompt = request.get('prompt', '')
+        prompt_tokens = _prompt_tokens(prompt)
+        # like Ollama, prompt_eval_count only counts the tokens that weren't in the cache
+        evaluated = prompt_tokens - _cached_tokens(settings, prompt)
+        with settings.lock:
+            settings.evaluated_tokens += evaluated
+        words = _stub_response_chunks(settings, bool(request.get('format')))
+        prompt_seconds = evaluated / settings.prompt_rate if settings.prompt_rate else 0
+        time.sleep(settings.latency + prompt_seconds)
+
+        def chunk(text, done):
+            payload = {
+                'model': model,
+                'created_at': datetime.now(timezone.utc).isoformat(),
+                'response': text,
+                'done': done,
+            }
+            if done:
+                payload.update({
+                    'done_reason': 'stop',
+                    'total_duration': int((time.perf_counter() - start_time) * 1e9),
+                    'prompt_eval_count': evaluated,
+                    'prompt_eval_duration': int(prompt_seconds * 1e9),
+                    'eval_count': len(words),
+                })
+            return payload
+
+        if not request.get('stream', True):
+            time.sleep(settings.token_delay * len(words))
+            self._send_json(200, chunk(''.join(words), True))
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/x-ndjson')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+        for word in words:
+            self._write_chunk(chunk(word, False))
+            time.sleep(settings.token_delay)
+        self._write_chunk(chunk('', True))
+        self.wfile.write(b'0\r\n\r\n')
+
+    def _write_chunk(self, payload):
+        line = json.dumps(payload).encode('utf-8') + b'\n'
+        self.wfile.write(f"{len(line):X}\r\n".encode('ascii') + line + b'\r\n')
+        self.wfile.flush()
+
+
+class Command(BaseCommand):
+    help = 'Runs a stand-in for the Ollama HTTP API with configurable latency, for testing the summarizer.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Address to listen on (default: 127.0.0.1).')
+        parser.add_argument('--port', type=int, default=11435, help='Port to listen on (default: 11435).')
+        parser.add_argument('--latency', type=float, default=0.5,
+                            help='Seconds before the first word of each response (default: 0.5).')
+        parser.add_argument('--token-delay', type=float, default=0.02,
+                            help='Seconds between streamed words (default: 0.02).')
+        parser.add_argument('--tokens', type=int, default=20, help='Words per response (default: 20).')
+        parser.add_argument('--parallel', type=int, default=4,
+                            help='Requests served at once, like OLLAMA_NUM_PARALLEL (default: 4).')
+        parser.add_argument('--prompt-rate', type=float, default=4000,
+                            help='Prompt tokens read per second, 0 for free prompts (default: 4000).')
+        parser.add_argument('--invalid-json-rate', type=float, default=0.0,
+                            help='Fraction of JSON-mode responses that are cut short (default: 0).')
+        parser.add_argument('--no-prompt-cache', action='store_true',
+                            help='Read every prompt in full, instead of reusing the start shared with a slot\'s last one.')
+
+    def handle(self, *args, **options):
+        settings = StubSettings(
+            latency=options['latency'],
+            token_delay=options['token_delay'],
+            tokens=options['tokens'],
+            parallel=options['parallel'],
+            prompt_rate=options['prompt_rate'],
+            invalid_json_rate=options['invalid_json_rate'],
+            prompt_cache=not options['no_prompt_cache'],
+        )
+        handler = type('Handler', (OllamaStubHandler,), {'settings': settings})
+        server = ThreadingHTTPServer((options['host'], options['port']), handler)
+        server.daemon_threads = True
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Ollama stub listening on http://{options['host']}:{options['port']} "
+            f"({options['latency']}s latency, {options['parallel']} parallel) - Ctrl+C to stop"
+        ))
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            self.stdout.write(
+                f"Served {settings.requests} requests, at most {settings.max_in_flight} at once, "
+                f"reading {settings.evaluated_tokens} of {settings.prompt_tokens} prompt tokens"
+            )
@@ -1,63 +1,56 @@
 # This class creates a base command which takes the file output from clean_metadata_and_write_new_file
 # and writes the data to a the database defined in Django's settings.py
+# Products are upserted in batches - re-running the command updates the name, image and price of existing products
 # To run this, use "python manage.py populate_products" in the CLI
-# Note that the file_path can be amended to fit your chosen filename
+# Note that the file_path can be amended to fit your chosen filename, or passed with --file
 
-import ijson
-import json
 import os
+import time
 
 from django.core.management.base import BaseCommand
-from product_recommender.models import Product
+from product_recommender.ingestion.products import DEFAULT_BATCH_SIZE, load_products
+
+# Seconds between progress lines
+PROGRESS_INTERVAL = 5
 
 
 class Command(BaseCommand):
-    help = 'Populates the Product table with data from metadata_processed.json'
+    help = 'Populates the Product table with data from metadata_processed.jsonl.gz'
 
-    def handle(self, *args, **options):
+    def add_arguments(self, parser):
         # Get the directory of the current script
         script_dir = os.path.dirname(os.path.abspath(__file__))
+        parser.add_argument('--file',
+                            default=os.path.join(script_dir, '..', '..', '..', 'data_files', 'metadata_processed.jsonl.gz'),
+                            help='Processed metadata file (default: data_files/metadata_processed.jsonl.gz).')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help=f'Products per upsert (default: {DEFAULT_BATCH_SIZE}).')
 
-        # Construct the relative path to metadata.json
-        file_path = os.path.join(script_dir, '..', '..', '..', 'data_files', 'metadata_processed.json')
+    def handle(self, *args, **options):
+        file_path = options['file']
         print(file_path)
 
-        processed_count = 0  # Initialize a counter for processed items
-        skip_count = 0
-
-        with open(file_path, 'r') as f:
-            for item in ijson.items(f, 'item'):
-                try:
-                    if 'title' not in item:
-                        print(f"Skipping item without title: {item['asin']}") 
-                        skip_count += 1
-                        continue  # Skip to the next item
-                    
-                    # Check if "Home & Garden" is in the categories list
-                    categories = item.get('categories')
-                    if categories and any("Home & Kitchen" in sublist for sublist in categories):
-
-                        product_id = item.get('asin')
-                        price = item.get('price')
-
-                        Product.objects.update_or_create(
-                            product_id=product_id,
-                            defaults={
-                                'name': item.get('title'),  # Use .get() for safety
-                                'image_url': item.get('imUrl'),
-                                'price': price,
-                            }
-                        )
-
-                        processed_count += 1
-
-                except Exception as e: 
-                    print(f"Error processing item: {item}")
-                    print(e)
-
-        print(f"Processed {processed_count} items.") 
-        print(f"Skipped {skip_count} items.") 
-
-        # with open(file_path, 'r') as f:
-        #     for item in ijson.items(f, 'item', multiple_values=True):
-        #         print(item) 
\ No newline at end of file
+        last_report = time.time()
+
+        def on_batch(stats):
+            nonlocal last_report
+            if time.time() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.time()
+                self.stdout.write(
+                    f"Read {stats['records']} items, upserted {stats['products']} products "
+                    f"({stats['records'] / max(stats['seconds'], 1e-9):.0f} items/s)"
+                )
+
+        def on_error(item, e):
+            print(f"Error processing item: {item}")
+            print(e)
+
+        stats = load_products(file_path, batch_size=options['batch_size'], on_batch=on_batch, on_error=on_error)
+
+        print(f"Processed {stats['products']} items.")
+        print(f"Skipped {stats['skipped_title']} items without a title and "
+              f"{stats['skipped_category']} items outside Home & Kitchen.")
+        self.stdout.write(self.style.SUCCESS(
+            f"Loaded {stats['records']} items in {stats['seconds']:.1f} seconds "
+            f"({stats['records'] / max(stats['seconds'], 1e-9):.0f} items/s, {stats['errors']} errors)."
+        ))
@@ -1,45 +1,71 @@
 # This class creates a base command which takes the file output from clean_reviews_and_write_new_file
 # and writes the data to a the database defined in Django's settings.py
+# Reviews are streamed from the file and written in batches, with a checkpoint after every transaction -
+# if the load is interrupted, running the command again resumes from the checkpoint
 # To run this, use "python manage.py populate_reviews" in the CLI
-# Note that the file_path can be amended to fit your chosen filename
+# Note that the file_path can be amended to fit your chosen filename, or passed with --file
 
 import os
-import ijson
-from django.core.management.base import BaseCommand
-from ...models import Product, Review
+
+from django.core.management.base import BaseCommand, CommandError
+from ...ingestion.checkpoint import Checkpoint
+from ...ingestion.reviews import DEFAULT_BATCH_SIZE, DEFAULT_TRANSACTION_SIZE, discard_load, load_reviews
+
 
 class Command(BaseCommand):
-    help = 'Populates the Review table with data from home_and_kitchen_reviews_processed.json, ' \
+    help = 'Populates the Review table with data from home_and_kitchen_reviews_processed.jsonl.gz, ' \
            'matching reviews to existing ASINs in the Product table.'
 
-    def handle(self, *args, **options):
+    def add_arguments(self, parser):
         script_dir = os.path.dirname(os.path.abspath(__file__))
-        file_path = os.path.join(script_dir, '..', '..', '..', 'data_files', 'home_and_kitchen_reviews_processed.json')
+        data_dir = os.path.join(script_dir, '..', '..', '..', 'data_files')
+        parser.add_argument('--file', default=os.path.join(data_dir, 'home_and_kitchen_reviews_processed.jsonl.gz'),
+                            help='Processed reviews file (default: data_files/home_and_kitchen_reviews_processed.jsonl.gz).')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help=f'Reviews per INSERT (default: {DEFAULT_BATCH_SIZE}).')
+        parser.add_argument('--transaction-size', type=int, default=DEFAULT_TRANSACTION_SIZE,
+                            help=f'Records per transaction and checkpoint (default: {DEFAULT_TRANSACTION_SIZE}).')
+        parser.add_argument('--checkpoint', default=os.path.join(data_dir, 'populate_reviews.checkpoint.json'),
+                            help='Checkpoint file (default: data_files/populate_reviews.checkpoint.json).')
+        parser.add_argument('--restart', action='store_true',
+                            help='Remove the reviews written by an interrupted load and load the file from the start.')
+
+    def handle(self, *args, **options):
+        file_path = options['file']
         print(file_path)
 
-        processed_count = 0
-        existing_asins = set(Product.objects.values_list('product_id', flat=True))  # Get ASINs
-
-        with open(file_path, 'r') as f:
-            for review_data in ijson.items(f, 'item'):
-                try:
-                    asin = review_data.get('asin')
-
-                    # Check if the ASIN exists in your Product database
-                    if asin in existing_asins:  
-                        Review.objects.create(
-                            product_id=Product.objects.get(product_id=asin),  # Get Product object
-                            review_id=review_data.get('unixReviewTime'),  # Use unique review ID
-                            review_title=review_data.get('summary'),
-                            review_username=review_data.get('reviewerName', 'default user'),
-                            review_score=int(review_data.get('overall', 1)),  # Default to 1 if missing
-                            review_text=review_data.get('reviewText'),
-                            created_at_unix=review_data.get('unixReviewTime')
-                        )
-                        processed_count += 1
-
-                except Exception as e:
-                    print(f"Error processing review: {review_data}")
-                    print(e)
-
-        print(f"Processed {processed_count} reviews.")
\ No newline at end of file
+        checkpoint = Checkpoint(options['checkpoint'], file_path)
+        if options['restart']:
+            try:
+                removed = discard_load(checkpoint)
+            except ValueError as e:
+                raise CommandError(str(e))
+            if removed:
+                self.stdout.write(f"Removed {removed} reviews written by the interrupted load")
+        state = checkpoint.load()
+        if state is not None:
+            self.stdout.write(f"Resuming after {state['records']} records ({state['reviews']} reviews written)")
+
+        def on_commit(stats):
+            self.stdout.write(
+                f"Committed {stats['reviews']} reviews from {stats['records']} records "
+                f"({stats['written'] / max(stats['seconds'], 1e-9):.0f} rows/s)"
+            )
+
+        def on_error(record, e):
+            print(f"Error processing review: {record}")
+            print(e)
+
+        stats = load_reviews(
+            file_path, checkpoint,
+            batch_size=options['batch_size'],
+            transaction_size=options['transaction_size'],
+            on_commit=on_commit,
+            on_error=on_error,
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Processed {stats['reviews']} reviews. Skipped {stats['skipped']} reviews for unknown products "
+            f"and {stats['errors']} invalid reviews. Wrote {stats['written']} reviews in {stats['seconds']:.1f} seconds "
+            f"({stats['written'] / max(stats['seconds'], 1e-9):.0f} rows/s)."
+        ))
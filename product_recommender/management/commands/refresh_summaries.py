@@ -0,0 +1,151 @@
+# This class creates a base command which regenerates only the AI summaries whose reviews have changed since they
+# were generated, so a nightly refresh costs in proportion to the new reviews rather than to the catalogue
+# A summary is stale when its reviews have changed by --min-change of the count it was built from (and by at least
+# --min-reviews reviews) - the larger of the move in the product's review count and the number of reviews newer than
+# the newest one it was built from, found without reading any review text.
+# "--full-check" also hashes every summarised product's reviews, to find edited reviews.
+# Stale summaries are regenerated most-viewed first (RecommendationPerformance records over the last --days days),
+# up to --limit products per run
+# Summaries generated before fingerprints were recorded are not tracked - "--adopt" fingerprints them from the
+# current reviews without regenerating them
+# Per-product metrics go to "--metrics-file", as for generate_ai_summaries_v3
+# To run this, use "python manage.py refresh_summaries" in the CLI
+
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db.models import Count
+from django.utils import timezone
+
+from product_recommender.management.commands.generate_ai_summaries_v3 import (
+    GenerateAISummaries, add_backend_arguments, backend_from_options, metrics_path_from_options, prefill_report,
+    progress_printer,
+)
+from product_recommender.models import RecommendationPerformance, Summary
+from product_recommender.summarization.fingerprint import (
+    DEFAULT_MIN_CHANGE, DEFAULT_MIN_REVIEWS, FINGERPRINT_FIELDS, review_fingerprint, stale_summaries,
+)
+
+# Product ids per query - every id is a query parameter, and older SQLite builds allow 999 per statement
+ID_BATCH_SIZE = 500
+
+
+def _batches(items, size=ID_BATCH_SIZE):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def product_traffic(product_ids, days):
+    """Recommendation requests recorded per product over the last `days` days."""
+    since = timezone.now() - timedelta(days=days)
+    traffic = {}
+    for batch in _batches(product_ids):
+        traffic.update(
+            RecommendationPerformance.objects.filter(product_id__in=batch, recorded_at__gte=since)
+            .values('product_id').annotate(requests=Count('id')).values_list('product_id', 'requests')
+        )
+    return traffic
+
+
+class Command(BaseCommand):
+    help = 'Regenerates the AI summaries whose reviews have changed, most-viewed products first.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-change', type=float, default=DEFAULT_MIN_CHANGE,
+                            help='Fraction of the reviews a summary was built from that must have been added or '
+                                 f'removed for it to be refreshed (default: {DEFAULT_MIN_CHANGE}).')
+        parser.add_argument('--min-reviews', type=int, default=DEFAULT_MIN_REVIEWS,
+                            help=f'Reviews that must have been added or removed (default: {DEFAULT_MIN_REVIEWS}).')
+        parser.add_argument('--full-check', action='store_true',
+                            help='Also hash every summarised product\'s reviews, to find edited or replaced reviews.')
+        parser.add_argument('--days', type=int, default=30,
+                            help='Days of recommendation traffic used to prioritise products (default: 30).')
+        parser.add_argument('--limit', type=int, default=None, help='Regenerate at most this many summaries.')
+        parser.add_argument('--dry-run', action='store_true', help='Only list the summaries that would be refreshed.')
+        parser.add_argument('--adopt', action='store_true',
+                            help='Fingerprint the summaries that have none from their current reviews, '
+                                 'without regenerating them.')
+        add_backend_arguments(parser)
+
+    def handle(self, *args, **options):
+        untracked = Summary.objects.filter(source_review_count__isnull=True)
+        if options['adopt']:
+            adopted = self._adopt(untracked)
+            self.stdout.write(self.style.SUCCESS(f"Fingerprinted {adopted} summaries from their current reviews"))
+            return
+
+        # product id -> reviews added or removed, None for edits found by --full-check
+        stale = dict(stale_summaries(options['min_change'], options['min_reviews']))
+        if options['full_check']:
+            stale.update((product_id, None) for product_id in self._changed_hashes(exclude=stale))
+
+        traffic = product_traffic(stale, options['days'])
+        ordered = sorted(stale, key=lambda product_id: (-traffic.get(product_id, 0), -(stale[product_id] or 0)))
+        if options['limit'] is not None:
+            ordered = ordered[:options['limit']]
+
+        untracked_count = untracked.count()
+        if untracked_count:
+            self.stdout.write(
+                f"{untracked_count} summaries have no fingerprint and are not checked - run with --adopt to track them"
+            )
+        if options['dry_run']:
+            for product_id in ordered:
+                change = (f"{stale[product_id]} reviews added, removed or replaced" if stale[product_id] is not None
+                          else 'reviews edited')
+                self.stdout.write(f"{product_id}: {change}, {traffic.get(product_id, 0)} recent requests")
+            self.stdout.write(self.style.SUCCESS(
+                f"Would refresh {len(ordered)} of {len(stale)} stale summaries"
+            ))
+            return
+
+        generator = GenerateAISummaries(
+            use_snapshot=False,
+            backend=backend_from_options(options),
+            prompt_mode=options['prompt_mode'],
+            token_budget=options['token_budget'] or None,
+            concurrency=options['concurrency'],
+            metrics_path=metrics_path_from_options(options, 'refresh_summaries'),
+            on_progress=progress_printer(self.stdout),
+        )
+        try:
+            stats = generator.refresh_summaries(ordered)
+        finally:
+            generator.backend.close()
+        self.stdout.write(self.style.SUCCESS(
+            f"Refreshed {stats['succeeded']} of {len(stale)} stale summaries ({stats['failed']} failed) "
+            f"in {stats['seconds']:.1f} seconds"
+        ))
+        report = prefill_report(generator.backend, stats['succeeded'] + stats['failed'])
+        if report:
+            self.stdout.write(report)
+        for line in stats['report']:
+            self.stdout.write(line)
+
+    @staticmethod
+    def _fingerprints(product_ids):
+        for product_id in product_ids:
+            yield product_id, review_fingerprint(GenerateAISummaries.read_reviews(product_id))
+
+    def _changed_hashes(self, exclude):
+        """The fingerprinted products whose reviews no longer hash to their summary's fingerprint."""
+        stored = dict(Summary.objects.filter(source_hash__isnull=False).values_list('product_id', 'source_hash'))
+        product_ids = [product_id for product_id in stored if product_id not in exclude]
+        return [
+            product_id for product_id, fingerprint in self._fingerprints(product_ids)
+            if fingerprint['source_hash'] != stored[product_id]
+        ]
+
+    def _adopt(self, untracked):
+        adopted = 0
+        product_ids = list(untracked.values_list('product_id', flat=True).distinct())
+        for batch in _batches(product_ids):
+            fingerprints = dict(self._fingerprints(batch))
+            summaries = list(Summary.objects.filter(product_id__in=batch, source_review_count__isnull=True))
+            for summary in summaries:
+                for field, value in fingerprints[summary.product_id_id].items():
+                    setattr(summary, field, value)
+            Summary.objects.bulk_update(summaries, FINGERPRINT_FIELDS)
+            adopted += len(summaries)
+        return adopted
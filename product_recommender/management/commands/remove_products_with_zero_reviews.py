@@ -1,16 +1,53 @@
+# This class creates a base command which removes the products that have no reviews, as these are not useful for this project
+# Products are deleted in batches with plain SQL, together with their summaries, recommendation timings and feedback,
+# without loading any of them into memory
+# Use "python manage.py remove_products_with_zero_reviews --dry-run" to only count what would be deleted
+# To run this, use "python manage.py remove_products_with_zero_reviews" in the CLI
+
+import time
+
 from django.core.management.base import BaseCommand
-from product_recommender.models import Product, Review
+from product_recommender.ingestion.cleanup import (
+    DEFAULT_BATCH_SIZE, count_products_without_reviews, remove_products_without_reviews,
+)
+
+# Seconds between progress lines
+PROGRESS_INTERVAL = 5
+
 
 class Command(BaseCommand):
     help = 'Removes Product entries with no matching reviews.'
 
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE,
+                            help=f'Products deleted per batch and transaction (default: {DEFAULT_BATCH_SIZE}).')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Only count the products and their related rows that would be deleted.')
+
     def handle(self, *args, **options):
-        # Get all product IDs that have at least one review
-        product_ids_with_reviews = Review.objects.values_list('product_id', flat=True).distinct()
-        
+        if options['dry_run']:
+            start_time = time.time()
+            counts = count_products_without_reviews()
+            self.stdout.write(self.style.SUCCESS(
+                f"Would delete {counts['products']} products with no reviews, {counts['summaries']} summaries, "
+                f"{counts['performance']} recommendation performance records, {counts['feedback']} feedback "
+                f"records and {counts['summary_progress']} summary progress records "
+                f"(counted in {time.time() - start_time:.2f} seconds)"
+            ))
+            return
+
+        last_report = time.time()
 
-        # Delete products that are NOT in the above list
-        products_to_delete = Product.objects.exclude(product_id__in=product_ids_with_reviews)
-        deleted_count, _ = products_to_delete.delete()
+        def on_batch(stats):
+            nonlocal last_report
+            if time.time() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.time()
+                self.stdout.write(f"{stats['products']} products deleted ({stats['seconds']:.1f}s)")
 
-        self.stdout.write(self.style.SUCCESS(f'Successfully deleted {deleted_count} products with no reviews.'))
\ No newline at end of file
+        stats = remove_products_without_reviews(batch_size=options['batch_size'], on_batch=on_batch)
+        self.stdout.write(self.style.SUCCESS(
+            f"Successfully deleted {stats['products']} products with no reviews, {stats['summaries']} summaries, "
+            f"{stats['performance']} recommendation performance records, {stats['feedback']} feedback records "
+            f"and {stats['summary_progress']} summary progress records in {stats['batches']} batches "
+            f"and {stats['seconds']:.2f} seconds."
+        ))
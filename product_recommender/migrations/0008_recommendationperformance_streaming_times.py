@@ -0,0 +1,23 @@
+# Generated by Django 5.1.4 on 2026-10-18 06:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_recommender', '0007_recommendationperformance'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recommendationperformance',
+            name='time_to_first',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='recommendationperformance',
+            name='total_time',
+            field=models.FloatField(blank=True, null=True),
+        ),
+    ]
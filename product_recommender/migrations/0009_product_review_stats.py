@@ -0,0 +1,56 @@
+# Generated by Django 5.1.4 on 2026-10-18 06:59
+
+from django.db import migrations, models
+from django.db.models import Avg, Count, Exists, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_review_stats(apps, schema_editor):
+    # the same UPDATE as ingestion.review_stats.update_product_stats, with the historical models
+    Product = apps.get_model('product_recommender', 'Product')
+    Review = apps.get_model('product_recommender', 'Review')
+    Summary = apps.get_model('product_recommender', 'Summary')
+    reviews = Review.objects.filter(product_id=OuterRef('pk')).order_by().values('product_id')
+    Product.objects.update(
+        review_count=Coalesce(Subquery(reviews.annotate(count=Count('id')).values('count')), 0),
+        avg_score=Subquery(reviews.annotate(avg=Avg('review_score')).values('avg')),
+        has_summary=Exists(Summary.objects.filter(product_id=OuterRef('pk'))),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_recommender', '0008_recommendationperformance_streaming_times'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='avg_score',
+            field=models.FloatField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='has_summary',
+            field=models.BooleanField(default=False),
+        ),
+        migrations.AddField(
+            model_name='product',
+            name='review_count',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(fields=['-review_count'], name='product_review_count_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product_id', 'review_score'], name='review_product_score_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(condition=models.Q(('review_text__isnull', False)), fields=['product_id', 'id'], name='review_with_text_idx'),
+        ),
+        migrations.RunPython(backfill_review_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.4 on 2026-10-18 07:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_recommender', '0009_product_review_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SummaryProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('succeeded', 'Succeeded'), ('failed', 'Failed')], max_length=10)),
+                ('attempts', models.IntegerField(default=0)),
+                ('error', models.TextField(blank=True, null=True)),
+                ('shard', models.CharField(blank=True, default='', max_length=20)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('product_id', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='summary_progress', to='product_recommender.product')),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.4 on 2026-10-18 07:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_recommender', '0010_summaryprogress'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='summary',
+            name='source_hash',
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddField(
+            model_name='summary',
+            name='source_max_created_at',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='summary',
+            name='source_review_count',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.4 on 2026-10-18 07:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_recommender', '0011_summary_fingerprint'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='summary',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, null=True),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.4 on 2026-10-18 07:32
+
+from django.db import migrations, models
+
+
+def count_last_failures(apps, schema_editor):
+    # the number of failures before this field existed isn't known - a product that last failed has at least one
+    SummaryProgress = apps.get_model('product_recommender', 'SummaryProgress')
+    SummaryProgress.objects.filter(status='failed').update(failures=1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_recommender', '0012_summary_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='summaryprogress',
+            name='failures',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.RunPython(count_last_failures, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.1.4 on 2026-10-18 07:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('product_recommender', '0013_summaryprogress_failures'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['product_id', 'created_at_unix'], name='review_product_created_idx'),
+        ),
+    ]
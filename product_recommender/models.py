@@ -10,6 +10,16 @@ class Product(models.Model):
     name = models.CharField(max_length=255)
     image_url = models.CharField(max_length=255)
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    # Denormalized from the product's reviews and summary, so pages don't count them per request
+    # Kept up to date by the review loaders and the Review/Summary signals (see ingestion/review_stats.py)
+    review_count = models.IntegerField(default=0)
+    avg_score = models.FloatField(null=True, blank=True)
+    has_summary = models.BooleanField(default=False)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['-review_count'], name='product_review_count_idx'),
+        ]
 
 # All of the reviews for the products in the Home & Kitchen category
 class Review(models.Model):
@@ -21,6 +31,17 @@ class Review(models.Model):
     review_text = models.TextField(null=True)
     created_at_unix = models.IntegerField(blank=True, null=True)
 
+    class Meta:
+        indexes = [
+            # covers the per-product count and average score without reading the review rows
+            models.Index(fields=['product_id', 'review_score'], name='review_product_score_idx'),
+            # the reviews the review engine reads, in the (product, id) order it reads them
+            models.Index(fields=['product_id', 'id'], condition=models.Q(review_text__isnull=False),
+                         name='review_with_text_idx'),
+            # the reviews newer than a summary's fingerprint, counted by refresh_summaries
+            models.Index(fields=['product_id', 'created_at_unix'], name='review_product_created_idx'),
+        ]
+
 # House the AI summaries of the reviews and allocate to their relevant products including 
 class Summary(models.Model):
     product_id = models.ForeignKey('Product', on_delete=models.CASCADE, related_name='summary')
@@ -28,7 +49,29 @@ class Summary(models.Model):
     #                              related_name='summary', null=True, blank=True)
     positive_sentiment = models.TextField(null=True)
     negative_sentiment = models.TextField(null=True)
+    # Fingerprint of the product's reviews when the summary was generated (see summarization/fingerprint.py),
+    # so refresh_summaries only regenerates the summaries whose reviews have changed since
+    source_review_count = models.IntegerField(null=True, blank=True)
+    source_max_created_at = models.IntegerField(null=True, blank=True)
+    source_hash = models.CharField(max_length=64, null=True, blank=True)
+    # Set on every save, so the model and snapshot fingerprints notice a summary rewritten in place
+    updated_at = models.DateTimeField(auto_now=True, null=True)
     
+# Progress of generate_ai_summaries_v3 - one row per product it has attempted, so an interrupted run can resume
+class SummaryProgress(models.Model):
+    SUCCEEDED = 'succeeded'
+    FAILED = 'failed'
+
+    product_id = models.OneToOneField('Product', on_delete=models.CASCADE, related_name='summary_progress')
+    status = models.CharField(max_length=10, choices=[(SUCCEEDED, 'Succeeded'), (FAILED, 'Failed')])
+    attempts = models.IntegerField(default=0)
+    # failed attempts since the product last succeeded - a regenerated summary isn't a retry
+    failures = models.IntegerField(default=0)
+    error = models.TextField(null=True, blank=True)
+    # the --shard the product was processed by, e.g. "0/4"
+    shard = models.CharField(max_length=20, blank=True, default='')
+    updated_at = models.DateTimeField(auto_now=True)
+
 # House whether the recommended product was a good one or not
 class Feedback(models.Model):
     initial_product_id = models.ForeignKey('Product', on_delete=models.CASCADE)
@@ -42,4 +85,7 @@ class RecommendationPerformance(models.Model):
     summary_time = models.FloatField()
     reviews_time = models.FloatField()
     num_reviews = models.IntegerField()
-    recorded_at = models.DateTimeField(auto_now_add=True)
\ No newline at end of file
+    recorded_at = models.DateTimeField(auto_now_add=True)
+    # Wall-clock time until the first engine's results were sent (streamed responses only), and until both were
+    time_to_first = models.FloatField(null=True, blank=True)
+    total_time = models.FloatField(null=True, blank=True)
\ No newline at end of file
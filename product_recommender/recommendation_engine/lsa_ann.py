@@ -0,0 +1,242 @@
+# A third recommendation engine: approximate nearest neighbours over dense LSA embeddings of the summaries
+# Built offline by build_lsa_index from the published summary TF-IDF model:
+#   1. the positive and negative TF-IDF rows are concatenated (each scaled by sqrt(0.5), so a dot product
+#      between two rows is the summary engine's combined cosine) and projected to a low-rank dense space
+#      with truncated SVD (LSA), then l2-normalised
+#   2. an IVF index groups the embeddings into k-means clusters stored contiguously by cluster; a query
+#      only scores the embeddings in the few clusters whose centroids are closest to it
+# Everything runs on the CPU with numpy, so a query is a couple of small dense matrix-vector products.
+
+import time
+
+import numpy as np
+from scipy import sparse
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.decomposition import TruncatedSVD
+from sklearn.preprocessing import normalize
+
+from .model_store import ModelLoader, StoredModel, current_version, ordered_products, write_model
+from .tfidf import SUMMARY_MODEL_NAME, SummaryModel, summary_model_loader
+
+LSA_INDEX_NAME = 'summary_lsa'
+
+DEFAULT_COMPONENTS = 128
+DEFAULT_NPROBE = 8
+RECALL_QUERIES = 200
+
+
+def _combined_tfidf(positive_matrix, negative_matrix):
+    weight = np.sqrt(0.5)
+    return sparse.hstack([positive_matrix * weight, negative_matrix * weight], format='csr')
+
+
+def _default_num_lists(num_rows):
+    # the usual IVF rule of thumb - around 4 * sqrt(n) lists keeps both the centroid scan and each list short
+    return max(1, min(num_rows, int(4 * np.sqrt(num_rows))))
+
+
+class IVFIndex:
+    """
+    An inverted-file index over l2-normalised embeddings.
+    The embeddings are stored grouped by cluster, so probing a list is a contiguous slice.
+
+    Args:
+        centroids: (n_lists, d) cluster centroids
+        list_offsets: (n_lists + 1,) start of each list in the grouped arrays
+        list_rows: (n,) original row index of each grouped embedding
+        list_embeddings: (n, d) embeddings grouped by list
+    """
+
+    def __init__(self, centroids, list_offsets, list_rows, list_embeddings):
+        self.centroids = centroids
+        self.list_offsets = list_offsets
+        self.list_rows = list_rows
+        self.list_embeddings = list_embeddings
+
+    @classmethod
+    def build(cls, embeddings, num_lists, seed=0):
+        kmeans = MiniBatchKMeans(n_clusters=num_lists, random_state=seed, n_init=3,
+                                 batch_size=max(1024, num_lists * 4))
+        assignments = kmeans.fit_predict(embeddings)
+        order = np.argsort(assignments, kind='stable')
+        counts = np.bincount(assignments, minlength=num_lists)
+        list_offsets = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+        centroids = normalize(kmeans.cluster_centers_).astype(np.float32)
+        return cls(centroids, list_offsets, order.astype(np.int64), embeddings[order])
+
+    def search(self, query, k, nprobe=DEFAULT_NPROBE, exclude=()):
+        """Returns the original row indices of the (approximately) k most similar embeddings, best first."""
+        nprobe = min(nprobe, len(self.centroids))
+        centroid_scores = self.centroids @ query
+        probe = np.argpartition(-centroid_scores, nprobe - 1)[:nprobe]
+
+        rows = []
+        scores = []
+        for list_id in probe:
+            start, end = self.list_offsets[list_id], self.list_offsets[list_id + 1]
+            if start == end:
+                continue
+            rows.append(self.list_rows[start:end])
+            scores.append(self.list_embeddings[start:end] @ query)
+        if not rows:
+            return np.empty(0, dtype=np.int64)
+
+        rows = np.concatenate(rows)
+        scores = np.concatenate(scores)
+        if len(exclude):
+            keep = ~np.isin(rows, list(exclude))
+            rows, scores = rows[keep], scores[keep]
+        if len(scores) > k:
+            top = np.argpartition(-scores, k)[:k]
+            rows, scores = rows[top], scores[top]
+        return rows[np.argsort(-scores, kind='stable')]
+
+
+def _exact_top_k(scores, k, exclude):
+    scores = scores.copy()
+    scores[list(exclude)] = -np.inf
+    top = np.argpartition(-scores, k)[:k] if len(scores) > k else np.arange(len(scores))
+    return top[np.argsort(-scores[top], kind='stable')]
+
+
+def measure_recall(index, embeddings, tfidf_matrix=None, k=10, nprobe=DEFAULT_NPROBE,
+                   queries=RECALL_QUERIES, seed=0):
+    """
+    Measures the ANN index on a sample of catalogue products.
+
+    Returns:
+        dict with recall@k against exact cosine over the embeddings, recall@k against exact cosine over the
+        original TF-IDF vectors (if tfidf_matrix is given), and the mean ANN query time in milliseconds.
+    """
+    rng = np.random.default_rng(seed)
+    num_rows = len(embeddings)
+    sample = rng.choice(num_rows, size=min(queries, num_rows), replace=False)
+
+    embedding_recalls = []
+    tfidf_recalls = []
+    query_times = []
+    for row in sample:
+        start_time = time.perf_counter()
+        approximate = index.search(embeddings[row], k, nprobe=nprobe, exclude=(row,))
+        query_times.append(time.perf_counter() - start_time)
+
+        exact = _exact_top_k(embeddings @ embeddings[row], k, (row,))
+        embedding_recalls.append(len(set(approximate) & set(exact)) / max(1, len(exact)))
+        if tfidf_matrix is not None:
+            tfidf_scores = (tfidf_matrix @ tfidf_matrix[row].T).toarray().ravel()
+            tfidf_exact = _exact_top_k(tfidf_scores, k, (row,))
+            tfidf_recalls.append(len(set(approximate) & set(tfidf_exact)) / max(1, len(tfidf_exact)))
+
+    return {
+        'recall_at_k_vs_exact_embedding': float(np.mean(embedding_recalls)),
+        'recall_at_k_vs_exact_tfidf': float(np.mean(tfidf_recalls)) if tfidf_recalls else None,
+        'mean_query_ms': float(np.mean(query_times) * 1000),
+        'k': k,
+        'nprobe': nprobe,
+        'queries': len(sample),
+    }
+
+
+def build_lsa_index(components=DEFAULT_COMPONENTS, num_lists=None, nprobe=DEFAULT_NPROBE, seed=0):
+    """
+    Projects the published summary TF-IDF model into LSA embeddings, builds the IVF index over them,
+    measures its recall and publishes everything with the model store.
+
+    Returns:
+        The published version string, or None if build_summary_model has not published a summary model to project.
+    """
+    source_version = current_version(SUMMARY_MODEL_NAME)
+    if source_version is None:
+        return None
+    summary_model = SummaryModel(StoredModel(SUMMARY_MODEL_NAME, source_version))
+
+    tfidf_matrix = _combined_tfidf(summary_model.positive_matrix, summary_model.negative_matrix)
+    num_rows, num_terms = tfidf_matrix.shape
+    components = max(1, min(components, num_terms - 1, num_rows - 1))
+
+    svd = TruncatedSVD(n_components=components, random_state=seed)
+    embeddings = normalize(svd.fit_transform(tfidf_matrix)).astype(np.float32)
+
+    num_lists = num_lists or _default_num_lists(num_rows)
+    index = IVFIndex.build(embeddings, num_lists, seed=seed)
+    recall = measure_recall(index, embeddings, tfidf_matrix, nprobe=nprobe, seed=seed)
+
+    return write_model(
+        LSA_INDEX_NAME,
+        arrays={
+            'product_ids': np.array(summary_model.product_ids),
+            'centroids': index.centroids,
+            'list_offsets': index.list_offsets,
+            'list_rows': index.list_rows,
+            'list_embeddings': index.list_embeddings,
+        },
+        objects={'svd': svd},
+        meta={
+            'source_model': SUMMARY_MODEL_NAME,
+            'source_version': source_version,
+            'components': components,
+            'num_lists': num_lists,
+            'nprobe': nprobe,
+            'explained_variance': float(svd.explained_variance_ratio_.sum()),
+            'recall': recall,
+            'num_products': num_rows,
+        },
+    )
+
+
+class LSAIndex:
+    def __init__(self, stored):
+        self.stored = stored
+        self.version = stored.version
+        self.source_version = stored.meta['source_version']
+        self.nprobe = stored.meta['nprobe']
+        self.product_ids = stored.array('product_ids').tolist()
+        self.row_for_product = {pid: row for row, pid in enumerate(self.product_ids)}
+        self.svd = stored.object('svd')
+        list_rows = stored.array('list_rows')
+        list_embeddings = stored.array('list_embeddings')
+        self.index = IVFIndex(stored.array('centroids'), stored.array('list_offsets'), list_rows, list_embeddings)
+        # position of each original row in the grouped arrays, to look up a catalogue product's own embedding
+        self.grouped_position = np.empty(len(list_rows), dtype=np.int64)
+        self.grouped_position[list_rows] = np.arange(len(list_rows))
+
+    def embedding(self, product_id, summary=None):
+        """Returns the embedding of a product, projecting its summary if it isn't in the index."""
+        row = self.row_for_product.get(product_id)
+        if row is not None:
+            return self.index.list_embeddings[self.grouped_position[row]]
+
+        # a summary written after the index was built - project it with the summary model it was built from
+        summary_model = summary_model_loader.get()
+        if summary_model is None or summary_model.version != self.source_version:
+            return None
+        positive_vector, negative_vector = summary_model.target_vectors(product_id, summary)
+        if positive_vector is None:
+            return None
+        projected = self.svd.transform(_combined_tfidf(positive_vector, negative_vector))
+        return normalize(projected).astype(np.float32).ravel()
+
+
+# Loaded once per worker process and reloaded when build_lsa_index publishes a new version
+lsa_index_loader = ModelLoader(LSA_INDEX_NAME, LSAIndex)
+
+
+def lsa_recommendations(target_product):
+    target_product_id = target_product.product_id
+
+    # never built on the request path - build_lsa_index publishes it, and the loader logs while it is missing
+    index = lsa_index_loader.get()
+    if index is None:
+        return []
+
+    embedding = index.embedding(target_product_id, target_product.summary.first())
+    if embedding is None:
+        print(f"Target product {target_product_id} has no summary in the LSA index.")
+        return []
+
+    # never recommend the product to itself
+    target_row = index.row_for_product.get(target_product_id)
+    exclude = () if target_row is None else (target_row,)
+
+    top_indices = index.index.search(embedding, 10, nprobe=index.nprobe, exclude=exclude)
+    return ordered_products([index.product_ids[i] for i in top_indices])
@@ -0,0 +1,269 @@
+# Persistence helpers for the offline recommendation models
+# Each model is written to RECOMMENDATION_MODEL_DIR/<name>/<version>/ and a CURRENT file in
+# RECOMMENDATION_MODEL_DIR/<name>/ names the live version. A rebuild writes a new version directory
+# and then swaps CURRENT atomically, so running workers keep serving the old files until they reload.
+
+import json
+import logging
+import os
+import shutil
+import threading
+import time
+from datetime import datetime
+from pathlib import Path
+
+import joblib
+import numpy as np
+from django.conf import settings
+from django.db import connection
+from scipy import sparse
+
+logger = logging.getLogger(__name__)
+
+CURRENT_FILE = 'CURRENT'
+META_FILE = 'meta.json'
+
+# how many published versions to keep on disk, so a worker that has just loaded the previous one is not cut short
+VERSIONS_TO_KEEP = 2
+
+# every ModelLoader registers itself here so preload_models() can warm them all at worker startup
+_LOADERS = []
+
+
+def model_root(name):
+    """Returns the directory holding every version of the named model."""
+    return Path(settings.RECOMMENDATION_MODEL_DIR) / name
+
+
+def new_version():
+    """Returns a sortable, unique version string for a model build."""
+    # microseconds, so two builds in the same second don't share a directory
+    return datetime.now().strftime('%Y%m%d%H%M%S.%f') + f"-{os.getpid()}"
+
+
+def current_version(name):
+    """Returns the live version of the named model, or None if it has never been built."""
+    try:
+        return (model_root(name) / CURRENT_FILE).read_text().strip() or None
+    except FileNotFoundError:
+        return None
+
+
+class StoredModel:
+    """
+    A read-only view over one published version of a model.
+    Arrays and sparse matrices are opened with np.load(mmap_mode='r') so the pages are shared
+    between every worker process on the host through the OS page cache.
+    """
+
+    def __init__(self, name, version, mmap=True):
+        self.name = name
+        self.version = version
+        self.path = model_root(name) / version
+        self.mmap_mode = 'r' if mmap else None
+        with open(self.path / META_FILE) as f:
+            self.meta = json.load(f)
+
+    def has(self, key):
+        return key in self.meta.get('arrays', []) or key in self.meta.get('matrices', []) \
+            or key in self.meta.get('objects', [])
+
+    def array(self, key):
+        return np.load(self.path / f"{key}.npy", mmap_mode=self.mmap_mode, allow_pickle=False)
+
+    def matrix(self, key):
+        shape = tuple(self.meta['shapes'][key])
+        data = self.array(f"{key}.data")
+        indices = self.array(f"{key}.indices")
+        indptr = self.array(f"{key}.indptr")
+        return sparse.csr_matrix((data, indices, indptr), shape=shape, copy=False)
+
+    def object(self, key):
+        return joblib.load(self.path / f"{key}.joblib")
+
+
+def write_model(name, arrays=None, matrices=None, objects=None, meta=None, version=None):
+    """
+    Writes a new version of a model to disk and publishes it as the live version.
+
+    Args:
+        name: The model name, used as the directory under RECOMMENDATION_MODEL_DIR
+        arrays: dict of key -> numpy array, saved as .npy
+        matrices: dict of key -> scipy sparse matrix, saved as CSR data/indices/indptr .npy files
+        objects: dict of key -> picklable object (e.g. a fitted vectorizer), saved with joblib
+        meta: extra JSON-serialisable metadata stored alongside the files
+        version: optional explicit version string
+
+    Returns:
+        The published version string.
+    """
+    arrays = arrays or {}
+    matrices = matrices or {}
+    objects = objects or {}
+    version = version or new_version()
+
+    root = model_root(name)
+    if (root / version).exists():
+        raise FileExistsError(f"{name} model version {version} already exists")
+    staging = root / f".{version}.tmp"
+    shutil.rmtree(staging, ignore_errors=True)
+    staging.mkdir(parents=True)
+
+    shapes = {}
+    for key, array in arrays.items():
+        np.save(staging / f"{key}.npy", np.asarray(array), allow_pickle=False)
+    for key, matrix in matrices.items():
+        matrix = sparse.csr_matrix(matrix)
+        matrix.sort_indices()
+        np.save(staging / f"{key}.data.npy", matrix.data, allow_pickle=False)
+        np.save(staging / f"{key}.indices.npy", matrix.indices, allow_pickle=False)
+        np.save(staging / f"{key}.indptr.npy", matrix.indptr, allow_pickle=False)
+        shapes[key] = list(matrix.shape)
+    for key, obj in objects.items():
+        joblib.dump(obj, staging / f"{key}.joblib")
+
+    full_meta = dict(meta or {})
+    full_meta.update({
+        'name': name,
+        'version': version,
+        'built_at': time.time(),
+        'arrays': list(arrays),
+        'matrices': list(matrices),
+        'objects': list(objects),
+        'shapes': shapes,
+    })
+    with open(staging / META_FILE, 'w') as f:
+        json.dump(full_meta, f, indent=2)
+
+    os.replace(staging, root / version)
+    _publish(root, version)
+    _prune_old_versions(root, version)
+    logger.info(f"Published {name} model version {version}")
+    return version
+
+
+def _publish(root, version):
+    tmp_current = root / f".{CURRENT_FILE}.tmp"
+    tmp_current.write_text(version)
+    os.replace(tmp_current, root / CURRENT_FILE)
+
+
+def _prune_old_versions(root, live_version):
+    versions = sorted(p.name for p in root.iterdir() if p.is_dir() and not p.name.startswith('.'))
+    for old in versions[:-VERSIONS_TO_KEEP]:
+        if old != live_version:
+            shutil.rmtree(root / old, ignore_errors=True)
+
+
+class ModelLoader:
+    """
+    Holds the live version of a stored model in memory for the lifetime of a worker process.
+
+    The CURRENT file is re-read at most once every RECOMMENDATION_MODEL_CHECK_INTERVAL seconds,
+    and the model is reloaded when a rebuild has published a new version. An optional
+    fingerprint function is compared against the fingerprint saved at build time, so a worker
+    can tell (and log) that the data has moved on since the model was built. The fingerprint
+    queries run on a background thread, so no request waits for them or for the lock.
+
+    Args:
+        name: The stored model name
+        factory: Callable turning a StoredModel into the object the engine queries
+        fingerprint: Optional callable returning the current corpus fingerprint from the database
+    """
+
+    def __init__(self, name, factory, fingerprint=None):
+        self.name = name
+        self.factory = factory
+        self.fingerprint = fingerprint
+        self.stale = False
+        self._model = None
+        self._version = None
+        self._last_check = None
+        self._checking_stale = False
+        self._lock = threading.Lock()
+        _LOADERS.append(self)
+
+    def get(self):
+        """Returns the loaded model, or None if it has not been built yet."""
+        now = time.monotonic()
+        interval = getattr(settings, 'RECOMMENDATION_MODEL_CHECK_INTERVAL', 60)
+        if self._last_check is not None and now - self._last_check < interval:
+            return self._model
+
+        with self._lock:
+            if self._last_check is not None and now - self._last_check < interval:
+                return self._model
+            self._last_check = now
+            try:
+                version = current_version(self.name)
+                if version is None and self._model is None:
+                    # at most once per check interval, rather than on every request
+                    logger.warning(f"No {self.name} model has been built, run its management command")
+                if version and version != self._version:
+                    self._model = self.factory(StoredModel(self.name, version))
+                    self._version = version
+                    logger.info(f"Loaded {self.name} model version {version}")
+                self._start_stale_check()
+            except Exception as e:
+                # keep serving whatever was loaded before rather than failing the request
+                logger.error(f"Failed to load {self.name} model: {e}")
+        return self._model
+
+    @property
+    def version(self):
+        return self._version
+
+    def _start_stale_check(self):
+        # called holding the lock; at most one check runs at a time
+        if self._model is None or self.fingerprint is None or self._checking_stale:
+            return
+        built_from = self._model.stored.meta.get('fingerprint')
+        if built_from is None:
+            self.stale = False
+            return
+        self._checking_stale = True
+        threading.Thread(target=self._check_stale, args=(self._version, built_from), daemon=True,
+                         name=f"{self.name}-stale-check").start()
+
+    def _check_stale(self, version, built_from):
+        try:
+            stale = built_from != self.fingerprint()
+        except Exception as e:
+            logger.error(f"Failed to check whether the {self.name} model is stale: {e}")
+            return
+        finally:
+            # the thread's own database connection
+            connection.close()
+            self._checking_stale = False
+        if version != self._version:
+            # a newer version was loaded while the fingerprint was computed
+            return
+        if stale and not self.stale:
+            logger.warning(f"{self.name} model version {version} is stale, "
+                           f"rebuild it with its management command")
+        self.stale = stale
+
+    def reset(self):
+        """Forgets the loaded model so the next get() reloads it from disk."""
+        with self._lock:
+            self._model = None
+            self._version = None
+            self._last_check = None
+
+
+def preload_models():
+    """Loads every registered model, intended to be called once at worker startup."""
+    # importing the engines registers their loaders
+    from . import lsa_ann, neighbours, tfidf, tfidf_reviews  # noqa: F401
+
+    for loader in _LOADERS:
+        # get() logs the models that have not been built
+        loader.get()
+
+
+def ordered_products(product_ids):
+    """Bulk fetches Product objects while keeping the order of product_ids."""
+    from ..models import Product
+
+    product_dict = {p.product_id: p for p in Product.objects.filter(product_id__in=product_ids)}
+    return [product_dict[pid] for pid in product_ids if pid in product_dict]
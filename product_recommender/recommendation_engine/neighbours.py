@@ -0,0 +1,142 @@
+# Precomputed item-to-item neighbour tables
+# Both engines return the same top-K for a product until their model is rebuilt, so build_neighbours
+# computes every product's neighbours in one batch job and the views answer most requests with a lookup.
+# A table records the model version it was computed from and is ignored once that model is replaced.
+
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from .model_store import ModelLoader, StoredModel, current_version, ordered_products, write_model
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_K = 10
+DEFAULT_BLOCK_SIZE = 512
+
+# The weighted matrices each engine scores with, matching tfidf.py and tfidf_reviews.py
+ENGINE_MATRICES = {
+    'summary_tfidf': [('positive', 0.5), ('negative', 0.5)],
+    'review_tfidf': [('reviews', 1.0)],
+}
+
+
+def neighbours_name(model_name):
+    return f"{model_name}_neighbours"
+
+
+# --- Batch computation ---
+# These run in worker processes, which open the model files themselves (memory-mapped, so the
+# matrices are shared rather than copied) instead of having them pickled across.
+
+_worker_matrices = None
+
+
+def _init_worker(model_name, version):
+    global _worker_matrices
+    stored = StoredModel(model_name, version)
+    _worker_matrices = [(stored.matrix(key), weight) for key, weight in ENGINE_MATRICES[model_name]]
+
+
+def _block_neighbours(start, end, k):
+    """Scores rows start:end against every row with one sparse product per matrix and keeps the top k."""
+    scores = None
+    for matrix, weight in _worker_matrices:
+        block_scores = (matrix[start:end] @ matrix.T) * weight
+        scores = block_scores if scores is None else scores + block_scores
+    scores = scores.tocsr()
+
+    neighbours = np.full((end - start, k), -1, dtype=np.int32)
+    neighbour_scores = np.zeros((end - start, k), dtype=np.float32)
+    for offset in range(end - start):
+        row_start, row_end = scores.indptr[offset], scores.indptr[offset + 1]
+        columns = scores.indices[row_start:row_end]
+        values = scores.data[row_start:row_end]
+
+        # never list a product as its own neighbour
+        keep = columns != start + offset
+        columns, values = columns[keep], values[keep]
+        if len(values) > k:
+            top = np.argpartition(-values, k)[:k]
+            columns, values = columns[top], values[top]
+        order = np.argsort(-values, kind='stable')
+        neighbours[offset, :len(order)] = columns[order]
+        neighbour_scores[offset, :len(order)] = values[order]
+    return start, neighbours, neighbour_scores
+
+
+def build_neighbours(model_name, k=DEFAULT_K, block_size=DEFAULT_BLOCK_SIZE, workers=None):
+    """
+    Computes the top-k neighbours of every product in the live version of a model and
+    publishes them as a table of row indices into that model.
+
+    Args:
+        model_name: 'summary_tfidf' or 'review_tfidf'
+        k: Neighbours kept per product
+        block_size: Rows scored per sparse matrix multiplication
+        workers: Worker processes, defaults to every core
+
+    Returns:
+        The published version string, or None if the model has not been built.
+    """
+    source_version = current_version(model_name)
+    if source_version is None:
+        return None
+
+    stored = StoredModel(model_name, source_version)
+    num_rows = stored.meta['shapes'][ENGINE_MATRICES[model_name][0][0]][0]
+    neighbours = np.full((num_rows, k), -1, dtype=np.int32)
+    neighbour_scores = np.zeros((num_rows, k), dtype=np.float32)
+
+    workers = workers or os.cpu_count() or 1
+    blocks = [(start, min(start + block_size, num_rows)) for start in range(0, num_rows, block_size)]
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(model_name, source_version)) as executor:
+        futures = [executor.submit(_block_neighbours, start, end, k) for start, end in blocks]
+        for done, future in enumerate(futures, start=1):
+            start, block_neighbours, block_scores = future.result()
+            neighbours[start:start + len(block_neighbours)] = block_neighbours
+            neighbour_scores[start:start + len(block_scores)] = block_scores
+            if done % 50 == 0 or done == len(futures):
+                logger.info(f"{model_name}: scored {done}/{len(futures)} blocks")
+
+    return write_model(
+        neighbours_name(model_name),
+        arrays={'neighbours': neighbours, 'scores': neighbour_scores},
+        meta={'source_model': model_name, 'source_version': source_version, 'k': k},
+    )
+
+
+# --- Request path ---
+
+class NeighbourTable:
+    def __init__(self, stored):
+        self.stored = stored
+        self.version = stored.version
+        self.source_version = stored.meta['source_version']
+        self.neighbours = stored.array('neighbours')
+        self.k = stored.meta['k']
+
+
+neighbour_table_loaders = {
+    model_name: ModelLoader(neighbours_name(model_name), NeighbourTable)
+    for model_name in ENGINE_MATRICES
+}
+
+
+def lookup_neighbours(model_loader, product_id, k=DEFAULT_K):
+    """
+    Returns the precomputed recommendations for a product as Product objects,
+    or None on a miss - no table, a table built from an older model, or a product the model doesn't know.
+    """
+    model = model_loader.get()
+    table = neighbour_table_loaders[model_loader.name].get()
+    if model is None or table is None or table.source_version != model.version or k > table.k:
+        return None
+
+    row = model.row_for_product.get(product_id)
+    if row is None:
+        return None
+    return ordered_products([model.product_ids[i] for i in table.neighbours[row][:k] if i >= 0])
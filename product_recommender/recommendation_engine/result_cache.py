@@ -0,0 +1,285 @@
+# Caches of recommendation results
+# Reloading a product page asks both engines for the same answer again, and that answer only changes when a
+# model is rebuilt or the product's own summary/reviews change. Results are cached under
+# (engine, product_id, model version), so a rebuilt model never serves results computed from the old one.
+# Entries expire after a TTL as a safety net for changes the signals can't see (e.g. bulk inserts).
+# A product's entries are dropped by the Summary/Review signals in signals.py.
+#
+# Two interchangeable caches, chosen by RECOMMENDATION_CACHE['BACKEND'] in settings.py:
+#   'local'  - RecommendationCache, an LRU dictionary inside each worker process
+#   'shared' - SharedRecommendationCache, stored in one of Django's CACHES so every worker shares the results
+#              (file, database, memcached or Redis backends). Concurrent misses on the same product are
+#              single-flighted with a lock entry in the cache, so a hot product is only computed once.
+
+import logging
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import caches
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_MAX_ENTRIES = 10000
+DEFAULT_TTL = 300
+DEFAULT_CACHE_ALIAS = 'recommendations'
+# How long a lock is held at most, and how long a waiting request polls for the locked result
+DEFAULT_LOCK_TIMEOUT = 10
+LOCK_POLL_INTERVAL = 0.05
+
+
+class RecommendationCache:
+    """
+    A thread-safe LRU cache with a TTL, keyed by (engine, product_id, model version).
+
+    Args:
+        max_entries: Entries kept before the least recently used is evicted
+        ttl: Seconds an entry stays valid, or None to never expire
+    """
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        # product_id -> keys cached for it, so a product's entries can be dropped without a full scan
+        self._keys_for_product = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def get(self, engine, product_id, model_version):
+        """Returns the cached value, or None on a miss."""
+        key = (engine, product_id, model_version)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                self._remove(key)
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, engine, product_id, model_version, value):
+        key = (engine, product_id, model_version)
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            self._keys_for_product.setdefault(product_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                self.evictions += 1
+
+    def get_or_compute(self, engine, product_id, model_version, compute):
+        """Returns the cached value, calling compute() and caching its result on a miss."""
+        value = self.get(engine, product_id, model_version)
+        if value is None:
+            value = compute()
+            self.set(engine, product_id, model_version, value)
+        return value
+
+    def invalidate_product(self, product_id):
+        """Drops every engine's cached results for a product."""
+        with self._lock:
+            for key in list(self._keys_for_product.get(product_id, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._keys_for_product.clear()
+
+    def _remove(self, key):
+        self._entries.pop(key, None)
+        product_keys = self._keys_for_product.get(key[1])
+        if product_keys is not None:
+            product_keys.discard(key)
+            if not product_keys:
+                del self._keys_for_product[key[1]]
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': 'local',
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
+
+
+class SharedRecommendationCache:
+    """
+    Recommendation results stored in a Django cache, shared by every worker that uses the same CACHES entry.
+
+    Each product has a generation number in the cache. Invalidating a product bumps it, so the entries
+    cached by every worker for the old generation stop matching without having to know their keys.
+    Eviction is left to the cache backend (MAX_ENTRIES/CULL_FREQUENCY in CACHES, or the server's own policy).
+
+    Args:
+        alias: The CACHES entry to store results in
+        ttl: Seconds an entry stays valid, or None to never expire
+        lock_timeout: Seconds a computing worker holds the lock for, and a waiting worker waits for its result
+    """
+
+    def __init__(self, alias=DEFAULT_CACHE_ALIAS, ttl=DEFAULT_TTL, lock_timeout=DEFAULT_LOCK_TIMEOUT):
+        self.alias = alias
+        self.ttl = ttl
+        self.lock_timeout = lock_timeout
+        self._counter_lock = threading.Lock()
+        # per-process counters - the backends don't expose their own
+        self.hits = 0
+        self.misses = 0
+        self.lock_waits = 0
+        self.lock_timeouts = 0
+        self.invalidations = 0
+
+    @property
+    def cache(self):
+        # caches[] hands out one connection per thread
+        return caches[self.alias]
+
+    def _count(self, counter):
+        with self._counter_lock:
+            setattr(self, counter, getattr(self, counter) + 1)
+
+    @staticmethod
+    def _generation_key(product_id):
+        return f"recommendations:generation:{product_id}"
+
+    @staticmethod
+    def _entry_key(engine, product_id, model_version):
+        return f"recommendations:{engine}:{product_id}:{model_version}"
+
+    def _lookup(self, engine, product_id, model_version):
+        """Returns (value or None, current generation) with a single round trip to the cache."""
+        entry_key = self._entry_key(engine, product_id, model_version)
+        generation_key = self._generation_key(product_id)
+        found = self.cache.get_many([entry_key, generation_key])
+        generation = found.get(generation_key, 0)
+        entry = found.get(entry_key)
+        if entry is not None and entry[0] == generation:
+            return entry[1], generation
+        return None, generation
+
+    def get(self, engine, product_id, model_version):
+        """Returns the cached value, or None on a miss."""
+        value, _ = self._lookup(engine, product_id, model_version)
+        self._count('hits' if value is not None else 'misses')
+        return value
+
+    def set(self, engine, product_id, model_version, value, generation=None):
+        if generation is None:
+            generation = self.cache.get(self._generation_key(product_id), 0)
+        self.cache.set(self._entry_key(engine, product_id, model_version), (generation, value), self.ttl)
+
+    def _acquire(self, lock_key, token):
+        return self.cache.add(lock_key, token, self.lock_timeout) and self.cache.get(lock_key) == token
+
+    def get_or_compute(self, engine, product_id, model_version, compute):
+        """
+        Returns the cached value, or computes and caches it on a miss.
+        Only the worker that takes the product's lock computes; the others wait for its result,
+        and fall back to computing it themselves if it doesn't arrive within lock_timeout.
+        """
+        value, generation = self._lookup(engine, product_id, model_version)
+        if value is not None:
+            self._count('hits')
+            return value
+        self._count('misses')
+
+        lock_key = f"{self._entry_key(engine, product_id, model_version)}:lock"
+        token = uuid.uuid4().hex
+        # add() only writes if the key is missing, so one caller takes the lock. The file backend's add() is a
+        # check-then-write, so the lock is read back - its writes are atomic renames and the last writer wins.
+        # That narrows the race rather than closing it: on the file backend two workers can occasionally both
+        # compute, which only costs time. The database, memcached and Redis backends add() atomically.
+        if not self._acquire(lock_key, token):
+            self._count('lock_waits')
+            deadline = time.monotonic() + self.lock_timeout
+            while time.monotonic() < deadline:
+                time.sleep(LOCK_POLL_INTERVAL)
+                value, generation = self._lookup(engine, product_id, model_version)
+                if value is not None:
+                    return value
+                if self.cache.get(lock_key) is None:
+                    # the lock holder failed or was invalidated - compute it here instead
+                    break
+            else:
+                self._count('lock_timeouts')
+                logger.warning(f"Timed out waiting for {engine} recommendations for {product_id}")
+
+        try:
+            value = compute()
+            self.set(engine, product_id, model_version, value, generation)
+        finally:
+            if self.cache.get(lock_key) == token:
+                self.cache.delete(lock_key)
+        return value
+
+    def invalidate_product(self, product_id):
+        """Drops every engine's cached results for a product, in every worker."""
+        generation_key = self._generation_key(product_id)
+        # add() then incr() so concurrent invalidations never reset the counter
+        self.cache.add(generation_key, 0, None)
+        try:
+            self.cache.incr(generation_key)
+        except ValueError:
+            # the key was culled between the two calls
+            self.cache.set(generation_key, 1, None)
+        self._count('invalidations')
+
+    def clear(self):
+        self.cache.clear()
+
+    def stats(self):
+        with self._counter_lock:
+            lookups = self.hits + self.misses
+            return {
+                'backend': 'shared',
+                'cache_alias': self.alias,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': round(self.hits / lookups, 4) if lookups else 0.0,
+                'lock_waits': self.lock_waits,
+                'lock_timeouts': self.lock_timeouts,
+                'invalidations': self.invalidations,
+            }
+
+
+def _cache_from_settings():
+    options = getattr(settings, 'RECOMMENDATION_CACHE', {})
+    if options.get('BACKEND', 'local') == 'shared':
+        return SharedRecommendationCache(
+            alias=options.get('CACHE_ALIAS', DEFAULT_CACHE_ALIAS),
+            ttl=options.get('TTL', DEFAULT_TTL),
+            lock_timeout=options.get('LOCK_TIMEOUT', DEFAULT_LOCK_TIMEOUT),
+        )
+    return RecommendationCache(
+        max_entries=options.get('MAX_ENTRIES', DEFAULT_MAX_ENTRIES),
+        ttl=options.get('TTL', DEFAULT_TTL),
+    )
+
+
+# One cache object per worker process, shared by every request thread
+recommendation_cache = _cache_from_settings()
@@ -0,0 +1,134 @@
+# Similarity backend used by both TF-IDF engines to score a product against the whole catalogue
+# The rows of each matrix are l2-normalised, so a dot product is a cosine similarity.
+# Scoring runs in two stages so time and memory stay bounded as the catalogue grows:
+#   1. candidate pruning - an inverted index (the transposed matrix, one posting list per term) gives the
+#      products that share at least one of the query's terms; every other product scores 0
+#   2. exact scoring - the candidates are scored against the full query in fixed-size row chunks,
+#      keeping a running top-K, so no more than one chunk of scores is held at a time
+# When the candidates would cover most of the catalogue anyway, stage 1 is skipped and every row is scored
+# with one sparse matrix-vector product over the (memory-mapped) matrix, which is cheaper than gathering the
+# candidate rows and only allocates one float per product.
+
+import numpy as np
+from scipy import sparse
+
+DEFAULT_CHUNK_SIZE = 50000
+
+# Above this fraction of the catalogue it is cheaper to scan every row than to gather the candidate rows
+FULL_SCAN_FRACTION = 0.3
+
+
+class SimilarityField:
+    """
+    One weighted TF-IDF matrix that contributes to the score, e.g. the positive summaries with weight 0.5.
+
+    Args:
+        matrix: Row-normalised CSR matrix, one row per product
+        weight: Multiplier applied to this field's cosine similarity
+        inverted: The same matrix transposed to CSR (term -> products), built here if not given
+    """
+
+    def __init__(self, matrix, weight=1.0, inverted=None):
+        self.matrix = sparse.csr_matrix(matrix, copy=False)
+        self.weight = weight
+        self.inverted = inverted if inverted is not None else self.matrix.T.tocsr()
+        self.posting_lengths = np.diff(self.inverted.indptr)
+
+
+class ChunkedSimilarityBackend:
+    """
+    Scores query vectors against every row of one or more SimilarityFields.
+
+    Args:
+        fields: List of SimilarityField, all with the same number of rows
+        chunk_size: Candidate rows gathered and scored at a time
+        max_query_terms: Only the heaviest query terms are used to find candidates
+        max_posting_fraction: Terms found in more than this fraction of products are not used to find candidates
+
+    Both pruning options trade a little recall for speed - products that only share the dropped terms are
+    never scored. Left as None, candidates come from every query term and the results are exact.
+    The candidates themselves are always scored on every term.
+    """
+
+    def __init__(self, fields, chunk_size=DEFAULT_CHUNK_SIZE, max_query_terms=None, max_posting_fraction=None):
+        self.fields = fields
+        self.chunk_size = chunk_size
+        self.max_query_terms = max_query_terms
+        self.max_posting_fraction = max_posting_fraction
+        self.num_rows = fields[0].matrix.shape[0]
+
+    def _candidate_terms(self, field, query):
+        terms, weights = query.indices, query.data
+        if self.max_posting_fraction is not None:
+            keep = field.posting_lengths[terms] <= self.max_posting_fraction * self.num_rows
+            terms, weights = terms[keep], weights[keep]
+        if self.max_query_terms is not None and len(terms) > self.max_query_terms:
+            terms = terms[np.argpartition(-weights, self.max_query_terms)[:self.max_query_terms]]
+        return terms
+
+    def candidates(self, query_vectors):
+        """Returns the sorted row indices sharing at least one (pruned) query term with the target."""
+        mask = np.zeros(self.num_rows, dtype=bool)
+        for field, query in zip(self.fields, query_vectors):
+            terms = self._candidate_terms(field, sparse.csr_matrix(query))
+            # the rows of the inverted index are posting lists, so this gathers every posting for the terms
+            mask[field.inverted[terms].indices] = True
+        return np.flatnonzero(mask)
+
+    def _estimated_candidates(self, query_vectors):
+        # the summed posting lengths are an upper bound on the candidates, read straight from the index pointers
+        return sum(
+            int(field.posting_lengths[self._candidate_terms(field, query)].sum())
+            for field, query in zip(self.fields, query_vectors)
+        )
+
+    def top_k(self, query_vectors, k, exclude=()):
+        """
+        Returns the row indices and scores of the k best matches, best first.
+
+        Args:
+            query_vectors: One 1 x n_terms sparse vector per field, in the same order as the fields
+            k: Number of results
+            exclude: Row indices that must not be returned (e.g. the target product itself)
+        """
+        query_vectors = [sparse.csr_matrix(query) for query in query_vectors]
+        # a dense query lets each chunk be scored with a sparse matrix-vector product straight into an array
+        dense_queries = [query.toarray().ravel().astype(np.float32) for query in query_vectors]
+
+        if self._estimated_candidates(query_vectors) > self.num_rows * FULL_SCAN_FRACTION:
+            return self._full_scan_top_k(dense_queries, k, exclude)
+
+        candidate_rows = self.candidates(query_vectors)
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        keep = k + len(exclude)
+        for start in range(0, len(candidate_rows), self.chunk_size):
+            rows = candidate_rows[start:start + self.chunk_size]
+            chunk_scores = np.zeros(len(rows), dtype=np.float32)
+            for field, dense_query in zip(self.fields, dense_queries):
+                chunk_scores += field.weight * (field.matrix[rows] @ dense_query)
+
+            # merge the chunk into the running top-K
+            if len(chunk_scores) > keep:
+                top = np.argpartition(-chunk_scores, keep)[:keep]
+                rows, chunk_scores = rows[top], chunk_scores[top]
+            best_rows = np.concatenate([best_rows, rows])
+            best_scores = np.concatenate([best_scores, chunk_scores])
+
+        return _best_first(best_rows, best_scores, k, exclude)
+
+    def _full_scan_top_k(self, dense_queries, k, exclude):
+        scores = np.zeros(self.num_rows, dtype=np.float32)
+        for field, dense_query in zip(self.fields, dense_queries):
+            scores += field.weight * (field.matrix @ dense_query)
+        scores[list(exclude)] = -np.inf
+        rows = np.argpartition(-scores, k)[:k] if self.num_rows > k else np.arange(self.num_rows)
+        return _best_first(rows, scores[rows], k, exclude)
+
+
+def _best_first(rows, scores, k, exclude):
+    if len(exclude):
+        allowed = ~np.isin(rows, list(exclude))
+        rows, scores = rows[allowed], scores[allowed]
+    order = np.argsort(-scores, kind='stable')[:k]
+    return rows[order], scores[order]
@@ -2,18 +2,132 @@
 # circumvents issues around dependency injection, circular imports, encapsulation, and order of operations
 
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from ..models import Summary, Product, Review
-import time
-
-# Initialize fresh vectorizers for each call to avoid fitting conflicts
-def get_fresh_positive_vectorizer():
-    return TfidfVectorizer(stop_words='english')
-
-def get_fresh_negative_vectorizer():
-    return TfidfVectorizer(stop_words='english')
+from django.db.models import Count, Max
+from ..ingestion.snapshot import current_snapshot
+from ..models import Summary
+from .model_store import ModelLoader, write_model, ordered_products
+from .similarity import ChunkedSimilarityBackend, SimilarityField
+import numpy as np
+
+SUMMARY_MODEL_NAME = 'summary_tfidf'
+
+
+def _complete_summaries():
+    """Summaries which have both a positive and a negative sentiment, i.e. the rows the engine can score."""
+    return Summary.objects.filter(
+        positive_sentiment__isnull=False,
+        negative_sentiment__isnull=False,
+    ).exclude(positive_sentiment='').exclude(negative_sentiment='')
+
+
+def summary_corpus_fingerprint():
+    """
+    A cheap fingerprint of the summary corpus, used to tell when the stored model has gone stale.
+    The newest updated_at catches summaries rewritten in place (e.g. by refresh_summaries), which leave the
+    count and max id unchanged.
+    """
+    stats = _complete_summaries().aggregate(count=Count('id'), max_id=Max('id'), updated_at=Max('updated_at'))
+    return [stats['count'], stats['max_id'], stats['updated_at'].isoformat() if stats['updated_at'] else None]
+
+
+def build_summary_model(use_snapshot=True):
+    """
+    Fits the positive and negative vectorizers over every product summary and publishes
+    the vocabularies and row-normalised TF-IDF matrices with the model store.
+    The summaries are read from the corpus snapshot when it is up to date, otherwise from the database.
+
+    Returns:
+        The published version string, or None if there are no summaries to fit.
+    """
+    fingerprint = summary_corpus_fingerprint()
+
+    product_ids = []
+    positive_summaries = []
+    negative_summaries = []
+    seen = set()
+    snapshot = current_snapshot(('summaries',)) if use_snapshot else None
+    if snapshot is not None:
+        rows = snapshot.complete_summaries()
+    else:
+        rows = _complete_summaries().order_by('product_id', 'id').values_list(
+            'product_id', 'positive_sentiment', 'negative_sentiment'
+        ).iterator(chunk_size=2000)
+    for product_id, positive, negative in rows:
+        # a product should only have one summary, but keep the first if there are duplicates
+        if product_id in seen:
+            continue
+        seen.add(product_id)
+        product_ids.append(product_id)
+        positive_summaries.append(positive)
+        negative_summaries.append(negative)
+
+    if not product_ids:
+        return None
+
+    positive_vectorizer = TfidfVectorizer(stop_words='english', dtype=np.float32)
+    negative_vectorizer = TfidfVectorizer(stop_words='english', dtype=np.float32)
+
+    # TfidfVectorizer l2-normalises each row, so a dot product between rows is their cosine similarity
+    positive_matrix = positive_vectorizer.fit_transform(positive_summaries)
+    negative_matrix = negative_vectorizer.fit_transform(negative_summaries)
+
+    return write_model(
+        SUMMARY_MODEL_NAME,
+        arrays={'product_ids': np.array(product_ids)},
+        # the transposed matrices are the inverted indexes (term -> products) the similarity backend prunes with
+        matrices={
+            'positive': positive_matrix,
+            'negative': negative_matrix,
+            'positive_inverted': positive_matrix.T.tocsr(),
+            'negative_inverted': negative_matrix.T.tocsr(),
+        },
+        objects={'positive_vectorizer': positive_vectorizer, 'negative_vectorizer': negative_vectorizer},
+        meta={'fingerprint': fingerprint, 'num_products': len(product_ids)},
+    )
+
+
+class SummaryModel:
+    """The fitted summary vocabularies and matrices, scored against the whole catalogue per request."""
+
+    def __init__(self, stored):
+        self.stored = stored
+        self.version = stored.version
+        self.product_ids = stored.array('product_ids').tolist()
+        self.row_for_product = {pid: row for row, pid in enumerate(self.product_ids)}
+        self.positive_matrix = stored.matrix('positive')
+        self.negative_matrix = stored.matrix('negative')
+        self.positive_vectorizer = stored.object('positive_vectorizer')
+        self.negative_vectorizer = stored.object('negative_vectorizer')
+        self.backend = ChunkedSimilarityBackend([
+            SimilarityField(self.positive_matrix, 0.5, _stored_inverted(stored, 'positive')),
+            SimilarityField(self.negative_matrix, 0.5, _stored_inverted(stored, 'negative')),
+        ])
+
+    def target_vectors(self, product_id, summary=None):
+        """Returns the positive and negative vectors for a product, transforming its summary if it isn't in the model."""
+        row = self.row_for_product.get(product_id)
+        if row is not None:
+            return self.positive_matrix[row], self.negative_matrix[row]
+        if summary is None or not (summary.positive_sentiment and summary.negative_sentiment):
+            return None, None
+        # the summary was written after the model was built - transform it, but never refit
+        return (self.positive_vectorizer.transform([summary.positive_sentiment]),
+                self.negative_vectorizer.transform([summary.negative_sentiment]))
+
+    def top_k(self, positive_vector, negative_vector, k, exclude=()):
+        """Row indices of the k products with the highest combined positive/negative cosine similarity."""
+        rows, _ = self.backend.top_k([positive_vector, negative_vector], k, exclude=exclude)
+        return rows
+
+
+def _stored_inverted(stored, key):
+    # models published before the inverted indexes were stored build them on load instead
+    return stored.matrix(f"{key}_inverted") if stored.has(f"{key}_inverted") else None
+
+
+# Loaded once per worker process and reloaded when build_summary_model publishes a new version
+summary_model_loader = ModelLoader(SUMMARY_MODEL_NAME, SummaryModel, fingerprint=summary_corpus_fingerprint)
 
-PRODUCT_LIMIT = 5000
 
 def tfidf_recommendations(target_product):
     target_product_id = target_product.product_id
@@ -24,66 +138,19 @@ def tfidf_recommendations(target_product):
         print(f"Target product {target_product_id} has no summary.")
         return []
 
-    # Use prefetch_related for reverse foreign key relationships
-    # This eliminates the N+1 query problem by fetching summaries in a separate optimized query
-    products_with_summaries = Product.objects.prefetch_related('summary').filter(
-        summary__positive_sentiment__isnull=False,
-        summary__negative_sentiment__isnull=False
-    ).exclude(product_id=target_product_id)[:PRODUCT_LIMIT]
-
-    print(f"Number of products_with_summaries: {len(products_with_summaries)}")
-
-    # Build lists directly from the prefetched query results
-    valid_products = []
-    positive_summaries = []
-    negative_summaries = []
-
-    for product in products_with_summaries:
-        # Access prefetched summaries directly without additional database hits
-        summaries = list(product.summary.all())  # Convert to list to access prefetched data
-        if summaries:
-            summary_obj = summaries[0]  # Get the first summary
-            if summary_obj.positive_sentiment and summary_obj.negative_sentiment:
-                valid_products.append(product)
-                positive_summaries.append(summary_obj.positive_sentiment)
-                negative_summaries.append(summary_obj.negative_sentiment)
-
-    if not positive_summaries:  # This also covers negative_summaries since they're populated together
-        print("no summaries found in tfidf")
+    # never built on the request path - build_summary_model publishes it, and the loader logs while it is missing
+    model = summary_model_loader.get()
+    if model is None:
         return []
 
-    # Get fresh vectorizer instances to avoid fitting conflicts
-    positive_vectorizer = get_fresh_positive_vectorizer()
-    negative_vectorizer = get_fresh_negative_vectorizer()
-
-    # Combine target summaries with all summaries to fit vectorizer once
-    all_positive = [target_summary.positive_sentiment] + positive_summaries
-    all_negative = [target_summary.negative_sentiment] + negative_summaries
-
-    # Fit and transform in one step
-    positive_tfidf_matrix = positive_vectorizer.fit_transform(all_positive)
-    negative_tfidf_matrix = negative_vectorizer.fit_transform(all_negative)
-
-    # Extract target vectors (first row) and comparison vectors
-    target_positive_tfidf = positive_tfidf_matrix[0:1]
-    comparison_positive_tfidf = positive_tfidf_matrix[1:]
-    
-    target_negative_tfidf = negative_tfidf_matrix[0:1]
-    comparison_negative_tfidf = negative_tfidf_matrix[1:]
-
-    # Calculate similarities
-    positive_cosine_similarities = cosine_similarity(target_positive_tfidf, comparison_positive_tfidf).flatten()
-    negative_cosine_similarities = cosine_similarity(target_negative_tfidf, comparison_negative_tfidf).flatten()
-
-    # Combine similarities and get top 10
-    combined_similarities = (positive_cosine_similarities + negative_cosine_similarities) * 0.5
+    positive_vector, negative_vector = model.target_vectors(target_product_id, target_summary)
+    if positive_vector is None:
+        print(f"Target product {target_product_id} has an incomplete summary.")
+        return []
 
-    # Use argpartition for better performance when we only need top K
-    if len(combined_similarities) <= 10:
-        top_indices = combined_similarities.argsort()[::-1]
-    else:
-        # argpartition is O(n) vs O(n log n) for full sort
-        top_k_indices = (-combined_similarities).argpartition(10)[:10]
-        top_indices = top_k_indices[(-combined_similarities[top_k_indices]).argsort()]
+    # never recommend the product to itself
+    target_row = model.row_for_product.get(target_product_id)
+    exclude = () if target_row is None else (target_row,)
 
-    return [valid_products[i] for i in top_indices]
\ No newline at end of file
+    top_indices = model.top_k(positive_vector, negative_vector, 10, exclude=exclude)
+    return ordered_products([model.product_ids[i] for i in top_indices])
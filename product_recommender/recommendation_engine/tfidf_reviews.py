@@ -1,134 +1,153 @@
 # helper methods for views.py
 # circumvents issues around dependency injection, circular imports, encapsulation, and order of operations
 
+from itertools import chain
+
 from sklearn.feature_extraction.text import TfidfVectorizer
-from sklearn.metrics.pairwise import cosine_similarity
-from ..models import Review, Product
-from collections import defaultdict
+from django.db.models import Count, Max
+from ..ingestion.snapshot import current_snapshot
+from ..models import Product, Review
+from .model_store import ModelLoader, write_model, ordered_products
+from .similarity import ChunkedSimilarityBackend, SimilarityField
 import numpy as np
 
-# Initialize fresh vectorizer for each call to avoid fitting conflicts
-def get_fresh_review_vectorizer():
-    return TfidfVectorizer(stop_words='english')
+REVIEW_INDEX_NAME = 'review_tfidf'
 
-PRODUCT_LIMIT = 5000
+# Aggregated review documents have thousands of terms, so candidates are found with the heaviest
+# terms only - products sharing none of them can only score near zero. Candidates are still scored on every term.
+MAX_QUERY_TERMS = 64
+
+
+def _reviews_with_text():
+    """Reviews which have some review text to vectorize."""
+    return Review.objects.filter(review_text__isnull=False).exclude(review_text='')
+
+
+def review_corpus_fingerprint():
+    """A cheap fingerprint of the review corpus, used to tell when the stored index has gone stale."""
+    stats = _reviews_with_text().aggregate(count=Count('id'), max_id=Max('id'))
+    return [stats['count'], stats['max_id']]
+
+
+def _product_documents(product_ids):
+    """
+    Streams one document per product - all of its review text joined together.
+    Reviews are read in product order, so only one product's reviews are held in memory at a time.
+    The product ids are appended to product_ids as each document is yielded.
+    """
+    rows = _reviews_with_text().order_by('product_id', 'id').values_list('product_id', 'review_text')
+    current_id = None
+    current_texts = []
+    for product_id, review_text in rows.iterator(chunk_size=5000):
+        if product_id != current_id:
+            if current_texts:
+                product_ids.append(current_id)
+                yield ' '.join(current_texts)
+            current_id = product_id
+            current_texts = []
+        current_texts.append(review_text)
+    if current_texts:
+        product_ids.append(current_id)
+        yield ' '.join(current_texts)
+
+
+def _snapshot_product_documents(snapshot, product_ids):
+    """The same documents as _product_documents, sliced from the memory-mapped corpus snapshot."""
+    for product_id, review_texts in snapshot.product_review_texts():
+        if review_texts:
+            product_ids.append(product_id)
+            yield ' '.join(review_texts)
+
+
+def build_review_index(use_snapshot=True):
+    """
+    Aggregates each product's reviews into one document, vectorizes the corpus once, and publishes
+    the CSR matrix, the fitted vocabulary and the product-id row map with the model store.
+    The reviews are read from the corpus snapshot when it is up to date, otherwise from the database.
+
+    Returns:
+        The published version string, or None if there are no reviews to index.
+    """
+    fingerprint = review_corpus_fingerprint()
+
+    product_ids = []
+    snapshot = current_snapshot(('reviews',)) if use_snapshot else None
+    documents = _snapshot_product_documents(snapshot, product_ids) if snapshot is not None \
+        else _product_documents(product_ids)
+    # the documents are streamed, so look at the first one to tell whether there are any
+    first_document = next(documents, None)
+    if first_document is None:
+        return None
+
+    review_vectorizer = TfidfVectorizer(stop_words='english', dtype=np.float32)
+    # fit_transform only iterates the documents once, so they can be streamed straight from the database
+    tfidf_matrix = review_vectorizer.fit_transform(chain([first_document], documents))
+
+    return write_model(
+        REVIEW_INDEX_NAME,
+        arrays={'product_ids': np.array(product_ids)},
+        # the transposed matrix is the inverted index (term -> products) the similarity backend prunes with
+        matrices={'reviews': tfidf_matrix, 'reviews_inverted': tfidf_matrix.T.tocsr()},
+        objects={'review_vectorizer': review_vectorizer},
+        meta={'fingerprint': fingerprint, 'num_products': len(product_ids)},
+    )
+
+
+class ReviewIndex:
+    """The memory-mapped review corpus matrix - a request only transforms the target row and scores it."""
+
+    def __init__(self, stored):
+        self.stored = stored
+        self.version = stored.version
+        self.product_ids = stored.array('product_ids').tolist()
+        self.row_for_product = {pid: row for row, pid in enumerate(self.product_ids)}
+        self.matrix = stored.matrix('reviews')
+        self.review_vectorizer = stored.object('review_vectorizer')
+        inverted = stored.matrix('reviews_inverted') if stored.has('reviews_inverted') else None
+        self.backend = ChunkedSimilarityBackend(
+            [SimilarityField(self.matrix, 1.0, inverted)], max_query_terms=MAX_QUERY_TERMS,
+        )
+
+    def target_vector(self, product_id):
+        """Returns the TF-IDF row for a product, transforming its reviews if they aren't in the index yet."""
+        row = self.row_for_product.get(product_id)
+        if row is not None:
+            return self.matrix[row]
+
+        target_reviews = list(_reviews_with_text().filter(product_id=product_id).values_list('review_text', flat=True))
+        if not target_reviews:
+            return None
+        # the reviews were written after the index was built - transform them, but never refit
+        return self.review_vectorizer.transform([' '.join(target_reviews)])
+
+    def top_k(self, target_vector, k, exclude=()):
+        """Row indices of the k products whose reviews are most similar to the target's."""
+        rows, _ = self.backend.top_k([target_vector], k, exclude=exclude)
+        return rows
+
+
+# Loaded once per worker process and reloaded when build_review_index publishes a new version
+review_index_loader = ModelLoader(REVIEW_INDEX_NAME, ReviewIndex, fingerprint=review_corpus_fingerprint)
 
-def tfidf_recommendations_from_reviews(target_product):
-    target_product_id = target_product.product_id
-    
-    # Get fresh vectorizer instance to avoid fitting conflicts
-    review_vectorizer = get_fresh_review_vectorizer()
 
 def tfidf_recommendations_from_reviews(target_product):
     target_product_id = target_product.product_id
-    
-    # Get fresh vectorizer instance to avoid fitting conflicts
-    review_vectorizer = get_fresh_review_vectorizer()
-
-    # First, try to get reviews directly by product_id
-    target_reviews_direct = Review.objects.filter(
-        product_id=target_product_id,
-        review_text__isnull=False
-    ).exclude(review_text='').values_list('review_text', flat=True)
-
-    print(f"Direct target reviews found: {len(target_reviews_direct)}")
-
-    # If no direct reviews found, check if there might be a different ID mapping
-    if not target_reviews_direct:
-        # Get all reviews for products that exist in our Product table
-        all_reviews = Review.objects.filter(
-            product_id__in=Product.objects.values_list('product_id', flat=True),
-            review_text__isnull=False
-        ).exclude(
-            review_text=''
-        ).values_list('review_text', 'product_id')[:PRODUCT_LIMIT * 10]
-        
-        print(f"No direct reviews found for target {target_product_id}")
-        print(f"Available product IDs in reviews (sample): {list(set(pid for _, pid in all_reviews))[:10]}")
-        
-        # Check if target product exists in Product table but reviews use different ID format
-        product_exists = Product.objects.filter(product_id=target_product_id).exists()
-        print(f"Target product exists in Product table: {product_exists}")
-        
-        if not product_exists:
-            print("Target product not found in Product table")
-            return []
-        
-        # Since we can't find reviews for this specific product,
-        # we'll use similar products based on product attributes as fallback
-        # This is a graceful degradation rather than returning nothing
-        similar_products = Product.objects.exclude(
-            product_id=target_product_id
-        ).filter(
-            product_id__in=[pid for _, pid in all_reviews]
-        )[:10]
-        
-        print(f"Returning {len(similar_products)} similar products as fallback")
-        return list(similar_products)
-    
-    # Continue with original logic if we found target reviews
-    # Get reviews for other products  
-    other_reviews = Review.objects.filter(
-        product_id__in=Product.objects.values_list('product_id', flat=True),
-        review_text__isnull=False
-    ).exclude(
-        product_id=target_product_id
-    ).exclude(
-        review_text=''
-    ).values_list('review_text', 'product_id')[:PRODUCT_LIMIT * 10]
-
-    if not other_reviews:
-        print("No other product reviews available.")
+
+    # never built on the request path - build_review_index publishes it, and the loader logs while it is missing
+    index = review_index_loader.get()
+    if index is None:
         return []
 
-    # Aggregate reviews by product
-    product_review_texts = defaultdict(list)
-    for review_text, product_id in other_reviews:
-        product_review_texts[product_id].append(review_text)
-
-    # Limit to top products by review count for better quality recommendations
-    sorted_products = sorted(
-        product_review_texts.items(), 
-        key=lambda x: len(x[1]), 
-        reverse=True
-    )[:PRODUCT_LIMIT]
-    
-    # Combine all reviews per product into single documents
-    other_product_ids = [pid for pid, _ in sorted_products]
-    other_combined_texts = [' '.join(reviews) for _, reviews in sorted_products]
-    target_combined_text = ' '.join(target_reviews_direct)
-
-    # Create corpus for fitting vectorizer
-    all_texts = [target_combined_text] + other_combined_texts
-    
-    # Fit and transform in one step
-    tfidf_matrix = review_vectorizer.fit_transform(all_texts)
-    
-    # Split target and other matrices
-    target_tfidf = tfidf_matrix[0:1]  # First row
-    other_tfidf = tfidf_matrix[1:]    # Remaining rows
-
-    # Calculate cosine similarities
-    cosine_similarities = cosine_similarity(target_tfidf, other_tfidf).flatten()
-
-    # Use argpartition for efficient top-k selection
-    if len(cosine_similarities) <= 10:
-        top_indices = cosine_similarities.argsort()[::-1]
-    else:
-        # argpartition is O(n) vs O(n log n) for full sort
-        top_k_indices = (-cosine_similarities).argpartition(10)[:10]
-        top_indices = top_k_indices[(-cosine_similarities[top_k_indices]).argsort()]
-    
-    # Get the actual Product objects for the top recommendations
-    recommended_product_ids = [other_product_ids[i] for i in top_indices]
-    
-    # Bulk fetch the Product objects to maintain return type consistency
-    recommended_products = Product.objects.filter(
-        product_id__in=recommended_product_ids
-    )
-    
-    # Maintain the similarity-based ordering
-    product_dict = {p.product_id: p for p in recommended_products}
-    ordered_products = [product_dict[pid] for pid in recommended_product_ids if pid in product_dict]
-    
-    return ordered_products
\ No newline at end of file
+    target_vector = index.target_vector(target_product_id)
+    if target_vector is None:
+        # graceful degradation rather than returning nothing
+        print(f"No direct reviews found for target {target_product_id}")
+        # the most reviewed products, from the review_count index
+        return list(Product.objects.exclude(product_id=target_product_id).order_by('-review_count')[:10])
+
+    # never recommend the product to itself
+    target_row = index.row_for_product.get(target_product_id)
+    exclude = () if target_row is None else (target_row,)
+
+    top_indices = index.top_k(target_vector, 10, exclude=exclude)
+    return ordered_products([index.product_ids[i] for i in top_indices])
@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -126,3 +127,57 @@ STATIC_ROOT = BASE_DIR / 'staticfiles'
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
+
+
+# Recommendation models
+# Offline-built TF-IDF models are written here by the build_* management commands
+# and memory-mapped by every worker process
+
+RECOMMENDATION_MODEL_DIR = BASE_DIR / 'model_files'
+
+# How often (in seconds) a worker checks whether a newer model version has been published
+RECOMMENDATION_MODEL_CHECK_INTERVAL = 60
+
+# Columnar snapshot of the products, reviews and summaries written by export_snapshot
+# The model builders and generate_ai_summaries_v3 read it instead of the database while it is up to date
+CORPUS_SNAPSHOT_DIR = BASE_DIR / 'snapshot_files' / 'corpus'
+
+# Per-product metrics of each generate_ai_summaries_v3 / refresh_summaries run, one JSON Lines file per run
+SUMMARY_METRICS_DIR = BASE_DIR / 'metrics_files'
+
+
+# Serve the async versions of search_results, api_reviews and api_recommendations_both
+# asgi.py turns this on, so they are used whenever the project runs under an ASGI server (uvicorn, daphne)
+ASYNC_VIEWS = os.environ.get('DJANGO_ASYNC_VIEWS', '0') == '1'
+
+# Threads api_recommendations_both runs the recommendation engines on, in parallel
+RECOMMENDATION_ENGINE_THREADS = 4
+
+# Recommendation result cache, keyed by (engine, product, model version)
+# BACKEND 'shared' keeps the results in the CACHES entry named by CACHE_ALIAS, so every worker process shares them
+# and concurrent misses on one product are only computed once (LOCK_TIMEOUT is how long the others wait, in seconds).
+# BACKEND 'local' keeps a separate in-memory LRU cache in each worker, bounded by MAX_ENTRIES.
+# TTL is in seconds for both
+RECOMMENDATION_CACHE = {
+    'BACKEND': 'shared',
+    'CACHE_ALIAS': 'recommendations',
+    'MAX_ENTRIES': 10000,
+    'TTL': 300,
+    'LOCK_TIMEOUT': 10,
+}
+
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# The file-based cache is shared by every worker on this machine. Point 'recommendations' at memcached or Redis
+# to share it between machines, or use the DatabaseCache (python manage.py createcachetable)
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'recommendations': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache_files' / 'recommendations',
+        'OPTIONS': {
+            'MAX_ENTRIES': 10000,
+        },
+    },
+}
@@ -0,0 +1,26 @@
+# Signal handlers that keep derived recommendation data in step with the tables it is computed from
+
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .ingestion.review_stats import update_product_stats
+from .models import Review, Summary
+from .recommendation_engine.result_cache import recommendation_cache
+
+
+@receiver(post_save, sender=Summary)
+@receiver(post_delete, sender=Summary)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def invalidate_cached_recommendations(sender, instance, **kwargs):
+    """A product's cached recommendations are dropped whenever its summary or one of its reviews changes."""
+    recommendation_cache.invalidate_product(instance.product_id_id)
+
+
+@receiver(post_save, sender=Summary)
+@receiver(post_delete, sender=Summary)
+@receiver(post_save, sender=Review)
+@receiver(post_delete, sender=Review)
+def update_review_stats(sender, instance, **kwargs):
+    """A product's review_count, avg_score and has_summary are recomputed whenever its summary or a review changes."""
+    update_product_stats([instance.product_id_id])
@@ -0,0 +1,4 @@
+# Library code used by generate_ai_summaries_v3 to turn a product's reviews into its AI summaries:
+# the language model backends, the token-budgeted selection of the reviews that go into the prompt, the fingerprints
+# of the reviews a summary was built from that refresh_summaries uses to find the out-of-date summaries, and the
+# per-product telemetry of a run
@@ -0,0 +1,365 @@
+# The language model backends that generate the summaries, chosen with generate_ai_summaries_v3 --backend
+# Every backend answers the same call: generate(prefix, text, json_format, metrics) returns the model's answer to
+# prefix + text, where prefix is the fixed instructions shared by every product and text is one product's reviews.
+# Keeping the two apart lets a backend reuse the work done on the prefix - its KV cache - so that only the product's
+# text is prefilled. Every backend counts the prompt tokens it reused in self.prefill (PrefillStats).
+#   'ollama'       - OllamaBackend, the Ollama HTTP API (a local server, or the ollama_stub stand-in). The server keeps
+#                    the KV cache of each slot's last prompt and only reads what follows the start a new prompt
+#                    shares with it, as long as the model stays loaded - so every prompt starts with the same prefix
+#                    and asks the server to keep the model loaded (keep_alive). Reuse is measured from the
+#                    prompt_eval_count the server reports, which leaves out the cached tokens
+#   'transformers' - TransformersBackend, a Hugging Face model in this process. Calls from the generator's worker
+#                    threads are gathered into padded batches of up to --batch-size; the shared prefix is encoded
+#                    once into a PrefixCache and its KV cache reused by every batch, and on the CPU the linear layers
+#                    run in int8
+#   'fake'         - FakeBackend, a deterministic answer made from the review text, for tests and benchmarks
+# Backends raise on failure - the caller decides whether to retry or fall back. Each call's tokens and time to
+# first token are added to the product's metrics dict, when one is given (see telemetry.py).
+
+import copy
+import hashlib
+import json
+import logging
+import queue
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+import ollama
+
+from .selection import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('ollama', 'transformers', 'fake')
+
+DEFAULT_MODELS = {
+    'ollama': 'llama3.2',
+    'transformers': 'meta-llama/Llama-3.2-3B-Instruct',
+    'fake': 'fake',
+}
+
+# Tokens generated per answer by the in-process backend - a sentence each for the combined JSON answer
+MAX_NEW_TOKENS = 96
+# Seconds the batching thread waits for more calls to fill a batch
+BATCH_WAIT = 0.05
+# How long the Ollama server keeps the model, and so its prompt caches, loaded after a call
+DEFAULT_KEEP_ALIVE = '30m'
+
+
+def record_call(metrics, prompt_tokens, prompt_eval_tokens, output_tokens, ttft_seconds):
+    """Adds one model call to a product's metrics (telemetry.new_product_metrics), if there are any."""
+    if metrics is None:
+        return
+    metrics['calls'] += 1
+    metrics['prompt_tokens'] += prompt_tokens
+    metrics['prompt_eval_tokens'] += prompt_eval_tokens
+    metrics['output_tokens'] += output_tokens
+    if metrics['ttft_seconds'] is None:
+        metrics['ttft_seconds'] = ttft_seconds
+
+
+class PrefillStats:
+    """Prompt tokens prefilled and reused from a KV cache, and the time prefilling took, across worker threads."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = 0
+        self.prompt_tokens = 0
+        self.cached_tokens = 0
+        self.prefill_seconds = 0.0
+
+    def add(self, prompt_tokens, cached_tokens, prefill_seconds):
+        with self.lock:
+            self.calls += 1
+            self.prompt_tokens += prompt_tokens
+            self.cached_tokens += cached_tokens
+            self.prefill_seconds += prefill_seconds
+
+    def saved_seconds(self):
+        """Estimated prefill time saved by the reused tokens, at the rate the other tokens were prefilled."""
+        prefilled = self.prompt_tokens - self.cached_tokens
+        return self.cached_tokens * self.prefill_seconds / prefilled if prefilled > 0 else 0.0
+
+
+class SummaryBackend:
+    """A language model that answers prefix + text. Subclasses implement generate()."""
+
+    # calls worth having in flight at once - the generator sizes its worker pool from this
+    batch_size = 1
+
+    def __init__(self, model):
+        self.model = model
+        self.prefill = PrefillStats()
+
+    def generate(self, prefix, text, json_format=None, metrics=None):
+        """
+        Answers the prompt prefix + text.
+
+        Args:
+            prefix: The instructions, the same for every product
+            text: The product's part of the prompt
+            json_format: A JSON schema the answer should follow, or None for plain text
+            metrics: The product's metrics, which the call is added to (see record_call)
+
+        Returns:
+            The answer, stripped of surrounding whitespace.
+        """
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class OllamaBackend(SummaryBackend):
+    """The Ollama HTTP API. One client is shared by every worker thread - its connection pool is thread-safe."""
+
+    def __init__(self, model=DEFAULT_MODELS['ollama'], host=None, keep_alive=DEFAULT_KEEP_ALIVE):
+        super().__init__(model)
+        self.client = ollama.Client(host=host)
+        self.keep_alive = keep_alive
+
+    def generate(self, prefix, text, json_format=None, metrics=None):
+        prompt = prefix + text
+        if json_format is not None:
+            settings = {"format": json_format}
+        else:
+            settings = {
+                "options": {
+                    "max_tokens": 10  # Adjust the output tokens
+                }
+            }
+        start_time = time.perf_counter()
+        ttft = None
+        # Stream response - JSON answers too, so the time to the first token can be measured
+        summary = ""
+        for chunk in self.client.generate(model=self.model, prompt=prompt, stream=True, keep_alive=self.keep_alive,
+                                          **settings):
+            if ttft is None and chunk["response"]:
+                ttft = time.perf_counter() - start_time
+            summary += chunk["response"]
+            if chunk.get("done"):
+                self._count_call(prompt, chunk, ttft, metrics)
+        return summary.strip()
+
+    def _count_call(self, prompt, response, ttft, metrics):
+        # the server only reports the tokens it read, so the prompt's own length is estimated
+        evaluated = response.get("prompt_eval_count")
+        if evaluated is None:
+            return
+        prompt_tokens = max(estimate_tokens(prompt), evaluated)
+        self.prefill.add(prompt_tokens, prompt_tokens - evaluated, (response.get("prompt_eval_duration") or 0) / 1e9)
+        record_call(metrics, prompt_tokens, evaluated, response.get("eval_count") or 0, ttft)
+
+
+class FakeBackend(SummaryBackend):
+    """
+    Answers with words picked from the text by a hash of the prompt, so the same prompt always gets the same
+    answer. latency adds a fixed delay to every call.
+    """
+
+    WORD = re.compile(r"[A-Za-z]{4,}")
+
+    def __init__(self, model=DEFAULT_MODELS['fake'], latency=0.0):
+        super().__init__(model)
+        self.latency = latency
+
+    def _sentence(self, digest, words):
+        picked = [words[digest[i] % len(words)] for i in range(8)]
+        return f"Reviewers mention {' '.join(picked).lower()}."
+
+    def generate(self, prefix, text, json_format=None, metrics=None):
+        if self.latency:
+            time.sleep(self.latency)
+        digest = hashlib.sha256(f"{prefix}\x00{text}".encode('utf-8')).digest()
+        words = self.WORD.findall(text) or ['nothing']
+        if json_format is not None:
+            answer = json.dumps({
+                'positive': self._sentence(digest[:8], words),
+                'negative': self._sentence(digest[8:16], words),
+            })
+        else:
+            answer = self._sentence(digest, words)
+        prompt_tokens = estimate_tokens(prefix + text)
+        record_call(metrics, prompt_tokens, prompt_tokens, estimate_tokens(answer), self.latency)
+        return answer
+
+
+class PrefixCache:
+    """
+    The KV caches of prompt prefixes, each computed once with encode(prefix) -> (token ids, KV cache).
+    Also keeps how long encoding took per token, as an estimate of the prefill time a reuse saves.
+    """
+
+    def __init__(self, encode):
+        self.encode = encode
+        self.entries = {}
+        self.seconds_per_token = 0.0
+
+    def get(self, prefix):
+        """(token ids, KV cache) of prefix. The cache must be copied before generation extends it."""
+        entry = self.entries.get(prefix)
+        if entry is None:
+            start_time = time.perf_counter()
+            entry = self.entries[prefix] = self.encode(prefix)
+            self.seconds_per_token = (time.perf_counter() - start_time) / max(entry[0].shape[-1], 1)
+        return entry
+
+
+class TransformersBackend(SummaryBackend):
+    """
+    A Hugging Face causal language model run in this process, generating for up to batch_size products at once.
+
+    generate() is called from the generator's worker threads. Each call is queued, and a single thread takes
+    the queued calls with the same prefix (up to batch_size, waiting BATCH_WAIT for more) and runs them as one
+    padded batch: the prefix is encoded once per distinct prefix and its KV cache copied into every batch, so
+    only the product texts are prefilled. The product texts are padded on the left, between the prefix and the
+    text, so every row's answer starts at the same position.
+
+    Args:
+        model: The model id on the Hugging Face hub, or a local directory
+        batch_size: Products generated together
+        quantize: Run the linear layers in int8 (dynamic quantization - CPU only)
+        device: 'cpu', or e.g. 'cuda'
+        max_new_tokens: Tokens generated per answer
+        prefix_cache: Reuse the prefix's KV cache - False prefills the whole prompt of every batch, for comparison
+    """
+
+    def __init__(self, model=DEFAULT_MODELS['transformers'], batch_size=8, quantize=True, device='cpu',
+                 max_new_tokens=MAX_NEW_TOKENS, prefix_cache=True):
+        super().__init__(model)
+        # optional - only needed for this backend
+        import torch
+        from transformers import AutoModelForCausalLM, AutoTokenizer, DynamicCache
+
+        self.torch = torch
+        self.cache_class = DynamicCache
+        self.batch_size = max(1, batch_size)
+        self.device = device
+        self.max_new_tokens = max_new_tokens
+        self.tokenizer = AutoTokenizer.from_pretrained(model)
+        self.tokenizer.padding_side = 'left'
+        if self.tokenizer.pad_token is None:
+            self.tokenizer.pad_token = self.tokenizer.eos_token
+        self.lm = AutoModelForCausalLM.from_pretrained(model, torch_dtype=torch.float32 if device == 'cpu' else 'auto')
+        self.lm.eval()
+        if quantize and device == 'cpu':
+            self.lm = torch.ao.quantization.quantize_dynamic(self.lm, {torch.nn.Linear}, dtype=torch.qint8)
+        self.lm.to(device)
+        self.prefix_cache = PrefixCache(self._encode_prefix) if prefix_cache else None
+        self.calls = queue.Queue()
+        self.thread = threading.Thread(target=self._run_batches, daemon=True)
+        self.thread.start()
+
+    def generate(self, prefix, text, json_format=None, metrics=None):
+        # the model isn't constrained to a schema - the prompt asks for JSON and the caller validates the answer
+        future = Future()
+        self.calls.put((prefix, text, future, metrics))
+        return future.result()
+
+    def close(self):
+        self.calls.put(None)
+        self.thread.join()
+
+    def _next_batch(self, waiting):
+        """Takes the oldest call and up to batch_size - 1 more with the same prefix. Returns None to stop."""
+        if not waiting:
+            call = self.calls.get()
+            if call is None:
+                return None
+            waiting.append(call)
+        deadline = time.monotonic() + BATCH_WAIT
+        while len(waiting) < self.batch_size * 2:
+            try:
+                call = self.calls.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                break
+            if call is None:
+                self.calls.put(None)
+                break
+            waiting.append(call)
+        prefix = waiting[0][0]
+        batch = [call for call in waiting if call[0] == prefix][:self.batch_size]
+        for call in batch:
+            waiting.remove(call)
+        return batch
+
+    def _run_batches(self):
+        waiting = []
+        while True:
+            batch = self._next_batch(waiting)
+            if batch is None:
+                break
+            try:
+                answers = self._generate_batch(batch[0][0], [text for _, text, _, _ in batch])
+            except Exception as e:
+                for _, _, future, _ in batch:
+                    future.set_exception(e)
+            else:
+                for (_, _, future, metrics), (answer, counts) in zip(batch, answers):
+                    # the batch is generated in one go, so there is no separate time to first token
+                    record_call(metrics, *counts, None)
+                    future.set_result(answer)
+
+    def _encode_prefix(self, prefix):
+        ids = self.tokenizer(prefix, return_tensors='pt').input_ids.to(self.device)
+        with self.torch.no_grad():
+            cache = self.lm(input_ids=ids, past_key_values=self.cache_class(), use_cache=True).past_key_values
+        return ids, cache
+
+    def _generate_batch(self, prefix, texts):
+        torch = self.torch
+        rows = len(texts)
+        encoded = self.tokenizer(texts, return_tensors='pt', padding=True, add_special_tokens=False).to(self.device)
+        if self.prefix_cache is not None:
+            prefix_ids, prefix_cache = self.prefix_cache.get(prefix)
+            # generation extends the cache in place, so every batch starts from a copy of the prefix's
+            cache = copy.deepcopy(prefix_cache)
+            if rows > 1:
+                cache.batch_repeat_interleave(rows)
+        else:
+            prefix_ids = self.tokenizer(prefix, return_tensors='pt').input_ids.to(self.device)
+            cache = None
+        input_ids = torch.cat([prefix_ids.expand(rows, -1), encoded.input_ids], dim=1)
+        attention_mask = torch.cat([torch.ones_like(prefix_ids).expand(rows, -1), encoded.attention_mask], dim=1)
+
+        prefix_tokens = prefix_ids.shape[-1]
+        row_tokens = encoded.attention_mask.sum(dim=1).tolist()
+        text_tokens = sum(row_tokens)
+        cached_tokens = rows * prefix_tokens if cache is not None else 0
+        seconds_per_token = self.prefix_cache.seconds_per_token if self.prefix_cache is not None else 0.0
+        self.prefill.add(rows * prefix_tokens + text_tokens, cached_tokens, text_tokens * seconds_per_token)
+
+        with torch.no_grad():
+            output = self.lm.generate(
+                input_ids=input_ids,
+                attention_mask=attention_mask,
+                past_key_values=cache,
+                max_new_tokens=self.max_new_tokens,
+                do_sample=False,
+                pad_token_id=self.tokenizer.pad_token_id,
+            )
+        generated = output[:, input_ids.shape[1]:]
+        output_tokens = (generated != self.tokenizer.pad_token_id).sum(dim=1).tolist()
+        answers = self.tokenizer.batch_decode(generated, skip_special_tokens=True)
+        # per row - the answer, and (prompt tokens, tokens prefilled, output tokens)
+        return [
+            (answer.strip(), (prefix_tokens + tokens, tokens + (prefix_tokens if cache is None else 0), produced))
+            for answer, tokens, produced in zip(answers, row_tokens, output_tokens)
+        ]
+
+
+def make_backend(name, model=None, host=None, batch_size=1, latency=0.0, keep_alive=DEFAULT_KEEP_ALIVE):
+    """Creates the backend called name, with its default model unless one is given."""
+    model = model or DEFAULT_MODELS[name]
+    if name == 'ollama':
+        return OllamaBackend(model, host=host, keep_alive=keep_alive)
+    if name == 'transformers':
+        try:
+            return TransformersBackend(model, batch_size=batch_size)
+        except ImportError as e:
+            raise ImportError(f"The transformers backend needs torch and transformers installed ({e})") from e
+    if name == 'fake':
+        return FakeBackend(model, latency=latency)
+    raise ValueError(f"Unknown summary backend '{name}'")
@@ -0,0 +1,71 @@
+# Fingerprints of the reviews a summary was generated from, stored on Summary by generate_ai_summaries_v3
+# A fingerprint is (review count, newest created_at_unix, content hash). refresh_summaries finds the summaries
+# that may be out of date without reading any review text: the change is the larger of how far Product.review_count
+# has moved from the stored count and how many reviews are newer than the stored newest date (counted on the
+# (product, created_at_unix) index), so reviews replaced by newer ones are found even when the count is unchanged.
+# Edited reviews, or replacements no newer than the old ones, are only found by hashing every product (--full-check).
+
+import hashlib
+import math
+
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from ..models import Review, Summary
+
+# The Summary fields a fingerprint is stored in
+FINGERPRINT_FIELDS = ['source_review_count', 'source_max_created_at', 'source_hash']
+
+# A summary is refreshed when its reviews have changed by this fraction of the count it was built from
+DEFAULT_MIN_CHANGE = 0.1
+# ... and by at least this many reviews
+DEFAULT_MIN_REVIEWS = 1
+
+
+def review_fingerprint(reviews):
+    """
+    Fingerprints a product's reviews.
+
+    Args:
+        reviews: Every review of the product, as (review text or None, review score, created_at_unix or None),
+            in review id order
+
+    Returns:
+        A dict of the Summary fields source_review_count, source_max_created_at and source_hash.
+    """
+    digest = hashlib.sha256()
+    for text, score, created_at in reviews:
+        digest.update(f"{score}\x1f{created_at}\x1f{text or ''}\x1e".encode('utf-8'))
+    dates = [created_at for _, _, created_at in reviews if created_at is not None]
+    return {
+        'source_review_count': len(reviews),
+        'source_max_created_at': max(dates) if dates else None,
+        'source_hash': digest.hexdigest(),
+    }
+
+
+def change_threshold(review_count, min_change=DEFAULT_MIN_CHANGE, min_reviews=DEFAULT_MIN_REVIEWS):
+    """The number of added or removed reviews at which a summary built from review_count reviews is refreshed."""
+    return max(min_reviews, math.ceil(min_change * review_count))
+
+
+def stale_summaries(min_change=DEFAULT_MIN_CHANGE, min_reviews=DEFAULT_MIN_REVIEWS):
+    """
+    Yields (product_id, reviews added, removed or replaced) for the complete summaries with a fingerprint whose
+    reviews have changed by at least the change threshold - the larger of the move in the product's review count
+    and the number of its reviews newer than the newest one the summary was built from.
+    """
+    newer_reviews = Review.objects.filter(
+        product_id=OuterRef('product_id'),
+        # a summary built from undated reviews counts every dated review as newer
+        created_at_unix__gt=Coalesce(OuterRef('source_max_created_at'), Value(-1)),
+    ).order_by().values('product_id').annotate(count=Count('id')).values('count')
+    summaries = Summary.objects.filter(
+        source_review_count__isnull=False, positive_sentiment__isnull=False, negative_sentiment__isnull=False,
+    ).annotate(
+        newer=Coalesce(Subquery(newer_reviews, output_field=IntegerField()), 0),
+    ).values_list('product_id', 'source_review_count', 'product_id__review_count', 'newer')
+    for product_id, built_from, review_count, newer in summaries.iterator(chunk_size=2000):
+        change = max(abs(review_count - built_from), newer)
+        if change and change >= change_threshold(built_from, min_change, min_reviews):
+            yield product_id, change
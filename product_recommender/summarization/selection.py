@@ -0,0 +1,154 @@
+# Token-budgeted selection of the reviews a product's summaries are generated from
+# Joining every review makes the prompts of popular products thousands of tokens long - slow for the model to read,
+# and silently cut off once they pass its context window (2048 tokens by default in Ollama). select_reviews picks a
+# representative subset that fits a budget instead:
+#   1. the budget is shared round-robin between the star ratings present, so the 1-star complaints of a mostly
+#      5-star product still reach the prompt
+#   2. within a rating, reviews of a useful length go first, then the most recent; very long reviews are cut to
+#      MAX_REVIEW_TOKENS so one review can't take the whole budget
+#   3. a review that is a near-duplicate of one already chosen is passed over (MinHash signatures of word
+#      shingles, banded so only likely pairs are compared). Only the reviews that are considered get hashed,
+#      so a product with thousands of reviews costs little more than one with a few dozen
+# A product whose reviews already fit the budget gets all of them, unchanged.
+# Tokens are estimated at four characters each, as the Ollama stub counts them.
+
+import re
+import zlib
+from collections import defaultdict, deque
+
+import numpy as np
+
+# Review tokens per prompt - leaves room for the instructions and the answer in a 2048 token context
+DEFAULT_TOKEN_BUDGET = 1500
+CHARS_PER_TOKEN = 4
+# A review is cut to this many tokens
+MAX_REVIEW_TOKENS = 300
+# Reviews shorter than this ("Great!") say little, reviews of this length or more count as fully informative
+MIN_REVIEW_TOKENS = 8
+USEFUL_REVIEW_TOKENS = 60
+# Weight of recency against length in a review's rank
+RECENCY_WEIGHT = 0.5
+
+# MinHash - NUM_PERM hash functions in BANDS bands; two reviews sharing a band are compared, and are
+# near-duplicates when they agree on at least DUPLICATE_SIMILARITY of their hashes (estimated Jaccard similarity)
+NUM_PERM = 64
+BANDS = 16
+SHINGLE_WORDS = 3
+DUPLICATE_SIMILARITY = 0.8
+
+_PRIME = (1 << 31) - 1
+_rng = np.random.RandomState(7)
+_HASH_A = _rng.randint(1, _PRIME, NUM_PERM).astype(np.uint64)
+_HASH_B = _rng.randint(0, _PRIME, NUM_PERM).astype(np.uint64)
+_WORD = re.compile(r"\w+")
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN
+
+
+def minhash_signature(text):
+    """The MinHash signature (NUM_PERM uint64 values) of the set of word shingles in text."""
+    words = _WORD.findall(text.lower())
+    shingles = {' '.join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    # crc32 is stable across processes, unlike hash()
+    hashes = np.fromiter((zlib.crc32(shingle.encode('utf-8')) & _PRIME for shingle in shingles),
+                         dtype=np.uint64, count=len(shingles))
+    # both factors are below 2**31, so the products fit in 64 bits
+    return ((np.outer(_HASH_A, hashes) + _HASH_B[:, None]) % _PRIME).min(axis=1)
+
+
+class NearDuplicateFilter:
+    """Remembers the texts added to it, and refuses a text that is a near-duplicate of one of them."""
+
+    def __init__(self):
+        self.signatures = []
+        # (band, band hashes) -> positions in self.signatures
+        self.buckets = defaultdict(list)
+
+    def add(self, text):
+        """Adds text, unless it is a near-duplicate of a text already added. Returns True if it was added."""
+        rows = NUM_PERM // BANDS
+        signature = minhash_signature(text)
+        bands = [(band, signature[band * rows:(band + 1) * rows].tobytes()) for band in range(BANDS)]
+        candidates = {position for key in bands for position in self.buckets.get(key, ())}
+        if any(np.mean(self.signatures[position] == signature) >= DUPLICATE_SIMILARITY for position in candidates):
+            return False
+        for key in bands:
+            self.buckets[key].append(len(self.signatures))
+        self.signatures.append(signature)
+        return True
+
+
+def fits_budget(reviews, token_budget):
+    """True if every review can go into the prompt as it is."""
+    return token_budget is None or sum(estimate_tokens(text) for text, _, _ in reviews) <= token_budget
+
+
+def _rank(reviews, tokens):
+    """Indices of the reviews, best first - informative length first, then recency."""
+    dates = [created_at or 0 for _, _, created_at in reviews]
+    newest, oldest = max(dates), min(dates)
+    span = max(newest - oldest, 1)
+
+    def score(index):
+        if tokens[index] < MIN_REVIEW_TOKENS:
+            length = 0.0
+        else:
+            length = min(tokens[index], USEFUL_REVIEW_TOKENS) / USEFUL_REVIEW_TOKENS
+        return length + RECENCY_WEIGHT * (dates[index] - oldest) / span
+
+    return sorted(range(len(reviews)), key=score, reverse=True)
+
+
+def select_review_indices(reviews, token_budget=DEFAULT_TOKEN_BUDGET):
+    """
+    Chooses the reviews to summarise a product from.
+
+    Args:
+        reviews: A list of (review text, review score, created_at_unix or None), empty texts already left out
+        token_budget: Estimated tokens the selected reviews may take up, None for no limit
+
+    Returns:
+        The indices of the selected reviews, in their original order.
+    """
+    if fits_budget(reviews, token_budget):
+        return list(range(len(reviews)))
+    tokens = [min(estimate_tokens(text), MAX_REVIEW_TOKENS) for text, _, _ in reviews]
+
+    by_score = defaultdict(deque)
+    for index in _rank(reviews, tokens):
+        by_score[reviews[index][1]].append(index)
+    chosen = NearDuplicateFilter()
+
+    # one review per rating in turn, until the budget is spent or every rating has run out
+    selected, remaining = [], token_budget
+    queues = [by_score[score] for score in sorted(by_score)]
+    while queues and remaining > 0:
+        for queue in queues:
+            while queue:
+                index = queue.popleft()
+                # a review too long for what is left is passed over for a shorter one of the same rating
+                if tokens[index] <= remaining and chosen.add(reviews[index][0]):
+                    selected.append(index)
+                    remaining -= tokens[index]
+                    break
+        queues = [queue for queue in queues if queue]
+    return sorted(selected)
+
+
+def truncate_review(text, max_tokens=MAX_REVIEW_TOKENS):
+    """Cuts text to about max_tokens at a word boundary."""
+    limit = max_tokens * CHARS_PER_TOKEN
+    if len(text) <= limit:
+        return text
+    return text[:limit].rsplit(' ', 1)[0] + '...'
+
+
+def select_reviews(reviews, token_budget=DEFAULT_TOKEN_BUDGET):
+    """
+    The texts of the reviews to summarise a product from, fitted to token_budget (see select_review_indices).
+    """
+    if fits_budget(reviews, token_budget):
+        return [text for text, _, _ in reviews]
+    return [truncate_review(reviews[index][0]) for index in select_review_indices(reviews, token_budget)]
@@ -0,0 +1,142 @@
+# Per-product metrics of a summary generation run, for tuning --concurrency and --batch-size from data
+# Every finished product is written as one JSON line to a file in SUMMARY_METRICS_DIR:
+#   product_id, status, error, retries (failed attempts since the product last succeeded),
+#   calls (model calls, 2+ after a fallback),
+#   prompt_tokens, prompt_eval_tokens (the ones not reused from a KV cache), output_tokens,
+#   queue_seconds (waiting for a worker), ttft_seconds (first model call's time to first token), latency_seconds
+# The run's totals give the live progress (throughput, ETA, queue depth) and the end-of-run report with a
+# latency histogram.
+
+import json
+import time
+from datetime import datetime
+
+import numpy as np
+from django.conf import settings
+
+# Width of the longest histogram bar
+HISTOGRAM_WIDTH = 40
+
+
+def new_product_metrics():
+    """The per-product counters the backends add each model call to (see backends.record_call)."""
+    return {'calls': 0, 'prompt_tokens': 0, 'prompt_eval_tokens': 0, 'output_tokens': 0, 'ttft_seconds': None}
+
+
+def default_metrics_path(command):
+    return settings.SUMMARY_METRICS_DIR / f"{command}-{datetime.now():%Y%m%d-%H%M%S}.jsonl"
+
+
+class SummaryTelemetry:
+    """
+    Writes per-product metrics to a JSON Lines file and keeps the run's totals.
+
+    Args:
+        path: The JSON Lines file, or None to only keep the totals
+        total: Products the run is expected to attempt, for the ETA, or None if unknown
+    """
+
+    def __init__(self, path=None, total=None):
+        self.path = path
+        self.total = total
+        self.start_time = time.perf_counter()
+        self.records = []
+        # running totals, so progress() doesn't go through every record
+        self.failed = 0
+        self.output_tokens = 0
+        self.file = None
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self.file = open(path, 'a', encoding='utf-8')
+
+    def record(self, product_id, metrics, success, retries=0, error=None):
+        """Adds a finished product, and writes it to the file."""
+        record = {
+            'product_id': product_id,
+            'status': 'succeeded' if success else 'failed',
+            'error': error,
+            'retries': retries,
+            **{key: metrics.get(key) for key in new_product_metrics()},
+            'queue_seconds': metrics.get('queue_seconds'),
+            'latency_seconds': metrics.get('latency_seconds'),
+        }
+        self.records.append(record)
+        self.failed += not success
+        self.output_tokens += record['output_tokens']
+        if self.file is not None:
+            self.file.write(json.dumps(record) + '\n')
+            self.file.flush()
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def progress(self, queued, running):
+        """
+        The run so far - products done and failed, throughput, ETA and queue depth.
+
+        Args:
+            queued: Products read and waiting for a worker
+            running: Products being summarised
+        """
+        elapsed = time.perf_counter() - self.start_time
+        done = len(self.records)
+        per_second = done / elapsed if elapsed > 0 else 0.0
+        remaining = max(self.total - done, 0) if self.total is not None else None
+        return {
+            'done': done,
+            'total': self.total,
+            'failed': self.failed,
+            'queued': queued,
+            'running': running,
+            'seconds': elapsed,
+            'products_per_minute': per_second * 60,
+            'output_tokens_per_second': self.output_tokens / max(elapsed, 1e-9),
+            'eta_seconds': remaining / per_second if remaining is not None and per_second > 0 else None,
+        }
+
+    def report(self):
+        """Lines summarising the run - throughput, tokens, latency percentiles and a latency histogram."""
+        if not self.records:
+            return ['No products were attempted']
+        elapsed = time.perf_counter() - self.start_time
+        latencies = np.array([record['latency_seconds'] or 0.0 for record in self.records])
+        ttfts = np.array([record['ttft_seconds'] for record in self.records if record['ttft_seconds'] is not None])
+        queue_seconds = np.array([record['queue_seconds'] or 0.0 for record in self.records])
+        totals = {key: sum(record[key] for record in self.records)
+                  for key in ('calls', 'prompt_tokens', 'prompt_eval_tokens', 'output_tokens', 'retries')}
+        count = len(self.records)
+
+        lines = [
+            f"{count} products in {elapsed:.1f} seconds - {count / elapsed * 60:.1f} per minute, "
+            f"{totals['output_tokens'] / elapsed:.1f} output tokens per second",
+            f"per product: {totals['calls'] / count:.2f} model calls, {totals['prompt_tokens'] / count:.0f} prompt "
+            f"tokens ({totals['prompt_eval_tokens'] / count:.0f} prefilled), {totals['output_tokens'] / count:.0f} "
+            f"output tokens, {totals['retries']} retries of earlier failures in total",
+            f"latency p50 {np.percentile(latencies, 50):.2f}s, p90 {np.percentile(latencies, 90):.2f}s, "
+            f"p99 {np.percentile(latencies, 99):.2f}s, max {latencies.max():.2f}s; "
+            f"mean wait for a worker {queue_seconds.mean():.2f}s",
+        ]
+        if len(ttfts):
+            lines.append(
+                f"time to first token p50 {np.percentile(ttfts, 50):.2f}s, p90 {np.percentile(ttfts, 90):.2f}s"
+            )
+        lines.append('latency histogram:')
+        lines.extend(latency_histogram(latencies))
+        if self.path is not None:
+            lines.append(f"per-product metrics written to {self.path}")
+        return lines
+
+
+def latency_histogram(latencies):
+    """Text histogram lines of latencies in seconds, in buckets that double in width."""
+    low = max(float(latencies.min()), 1e-3)
+    # bucket edges at powers of two, from the one below the fastest to the one above the slowest
+    edges = 2.0 ** np.arange(np.floor(np.log2(low)), np.floor(np.log2(max(float(latencies.max()), low))) + 2)
+    counts, _ = np.histogram(np.clip(latencies, edges[0], edges[-1]), bins=edges)
+    largest = max(counts.max(), 1)
+    return [
+        f"  {start:>8.3g}s - {stop:<8.3g}s {count:>6} {'#' * int(round(count / largest * HISTOGRAM_WIDTH))}"
+        for start, stop, count in zip(edges[:-1], edges[1:], counts)
+    ]
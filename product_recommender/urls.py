@@ -15,20 +15,36 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# Under ASGI the async versions of the busiest views are served instead (see ASYNC_VIEWS in settings.py)
+if settings.ASYNC_VIEWS:
+    search_results = views.search_results_async
+    api_recommendations_both = views.api_recommendations_both_async
+    api_reviews = views.api_reviews_async
+    api_recommendations_stream = views.api_recommendations_stream_async
+else:
+    search_results = views.search_results
+    api_recommendations_both = views.api_recommendations_both
+    api_reviews = views.api_reviews
+    api_recommendations_stream = views.api_recommendations_stream
+
 urlpatterns = [
     # Main pages
     path('', views.homepage, name='homepage'),
-    path('search/', views.search_results, name='search_results'),
+    path('search/', search_results, name='search_results'),
     path('random/', views.random_product, name='random_product'),
     path('product/<str:product_id>/', views.product_detail, name='product_detail'),
     path('analytics/', views.recommendation_analytics, name='recommendation_analytics'),
     
     # Primary API endpoints (new unified structure)
-    path('api/recommendations/<str:product_id>/', views.api_recommendations_both, name='api_recommendations_both'),
-    path('api/reviews/<str:product_id>/', views.api_reviews, name='api_reviews'),
+    path('api/recommendations/<str:product_id>/', api_recommendations_both, name='api_recommendations_both'),
+    path('api/stream/recommendations/<str:product_id>/', api_recommendations_stream, name='api_recommendations_stream'),
+    path('api/recommendations/<str:engine>/<str:product_id>/', views.api_recommendations_engine, name='api_recommendations_engine'),
+    path('api/reviews/<str:product_id>/', api_reviews, name='api_reviews'),
+    path('api/cache-stats/', views.api_cache_stats, name='api_cache_stats'),
     
     # Legacy API endpoints (deprecated - keep for backward compatibility)
     # These can be removed once frontend is fully migrated
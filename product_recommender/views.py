@@ -1,15 +1,24 @@
 # This class contains the Python functions which handle http requests and return responses
 # Also contains backend logic
 
-from django.shortcuts import render, get_object_or_404, redirect
-from django.http import HttpResponse, HttpResponseNotFound, HttpResponseServerError, JsonResponse
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
+from django.http import HttpResponse, HttpResponseNotFound, HttpResponseServerError, JsonResponse, StreamingHttpResponse
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
+from django.db import close_old_connections
 from django.db.models import Q, Avg, F
+from django.conf import settings
 from .models import Product, Summary, Review, RecommendationPerformance
-from .recommendation_engine.tfidf import tfidf_recommendations
-from .recommendation_engine.tfidf_reviews import tfidf_recommendations_from_reviews
+from .recommendation_engine.tfidf import tfidf_recommendations, summary_model_loader
+from .recommendation_engine.tfidf_reviews import tfidf_recommendations_from_reviews, review_index_loader
+from .recommendation_engine.neighbours import lookup_neighbours
+from .recommendation_engine.lsa_ann import lsa_recommendations, lsa_index_loader
+from .recommendation_engine.result_cache import recommendation_cache
+import asyncio
+import math
 import random
 import time
+import json
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from collections import defaultdict
 import html
 
@@ -83,34 +92,102 @@ def _get_product(product_id=None):
     product.name = _unescape_product_name(product.name)
     return product
 
+def _summary_engine(product):
+    # Serve from the precomputed neighbour table, and only score live on a miss
+    recommendations = lookup_neighbours(summary_model_loader, product.product_id)
+    if recommendations is None:
+        recommendations = tfidf_recommendations(product)
+    return recommendations
+
+def _reviews_engine(product):
+    # Serve from the precomputed neighbour table, and only score live on a miss
+    recommendations = lookup_neighbours(review_index_loader, product.product_id)
+    if recommendations is None:
+        recommendations = tfidf_recommendations_from_reviews(product)
+    return recommendations
+
+def _cached_recommendations(engine, model_loader, product, recommend):
+    """
+    Returns an engine's top 4 recommendations for a product from the recommendation cache,
+    computing and caching them on a miss. The key includes the engine's model version,
+    so results are recomputed once a rebuilt model has been picked up.
+    """
+    def compute():
+        recommendations = recommend(product)[:4]
+
+        # Unescape product names in recommendations
+        for rec in recommendations:
+            rec.name = _unescape_product_name(rec.name)
+        return recommendations
+
+    # get() picks up a newly published model version before it is used in the key
+    model_loader.get()
+    return list(recommendation_cache.get_or_compute(engine, product.product_id, model_loader.version, compute))
+
 def _get_recommendations_from_summary(product):
     """Gets recommendations using the AI summary TF-IDF."""
     start_time = time.time()
-    recommendations = tfidf_recommendations(product)[:4]
+    recommendations = _cached_recommendations('summary', summary_model_loader, product, _summary_engine)
     end_time = time.time()
     time_taken = end_time - start_time
-    
-    # Unescape product names in recommendations
-    for rec in recommendations:
-        rec.name = _unescape_product_name(rec.name)
-        
+
     return recommendations, "{:.4f} seconds".format(time_taken)
 
 def _get_recommendations_from_reviews(product):
     """Gets recommendations using the raw review text TF-IDF."""
     start_time = time.time()
-    recommendations = tfidf_recommendations_from_reviews(product)[:4]
+    recommendations = _cached_recommendations('reviews', review_index_loader, product, _reviews_engine)
     end_time = time.time()
     time_taken = end_time - start_time
-    
-    # Unescape product names in recommendations
-    for rec in recommendations:
-        rec.name = _unescape_product_name(rec.name)
-        
+
     return recommendations, "{:.4f} seconds".format(time_taken)
 
+def _get_recommendations_from_lsa(product):
+    """Gets recommendations using the approximate nearest-neighbour index over LSA summary embeddings."""
+    start_time = time.time()
+    recommendations = _cached_recommendations('lsa', lsa_index_loader, product, lsa_recommendations)
+    end_time = time.time()
+    time_taken = end_time - start_time
+
+    return recommendations, "{:.4f} seconds".format(time_taken)
+
+# The engines that can be requested individually through api_recommendations_engine
+RECOMMENDATION_ENGINES = {
+    'summary': _get_recommendations_from_summary,
+    'reviews': _get_recommendations_from_reviews,
+    'lsa': _get_recommendations_from_lsa,
+}
+
+# Threads the engines run on, so api_recommendations_both waits for the slower engine rather than both in turn.
+# The scoring is numpy/scipy work which releases the GIL, and the rest is mostly waiting on the database.
+_engine_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, 'RECOMMENDATION_ENGINE_THREADS', 4), thread_name_prefix='recommendations',
+)
+
+def _run_engine(get_recommendations, product):
+    """Runs one engine on a pool thread, which opens its own database connection and closes it afterwards."""
+    close_old_connections()
+    try:
+        return get_recommendations(product)
+    finally:
+        close_old_connections()
+
+def _serialize_recommendations(recommendations):
+    """Converts recommended products to a JSON-serializable format."""
+    return [
+        {
+            'product_id': rec.product_id,
+            'name': rec.name,
+            'price': str(rec.price),
+            'image_url': rec.image_url,
+        }
+        for rec in recommendations
+    ]
+
 def _get_product_summary(product):
     """Fetches the positive and negative sentiment summary for a product."""
+    if not product.has_summary:
+        return "No summary available", "No summary available"
     try:
         summary = Summary.objects.filter(product_id=product).first()
         if summary:
@@ -200,41 +277,31 @@ def api_recommendations_both(request, product_id):
     try:
         product = get_object_or_404(Product, product_id=product_id)
         
-        # Get both recommendation types
-        summary_recs, summary_time_str = _get_recommendations_from_summary(product)
-        reviews_recs, reviews_time_str = _get_recommendations_from_reviews(product)
+        # Get both recommendation types at the same time - each engine still times itself
+        start_time = time.time()
+        summary_future = _engine_executor.submit(_run_engine, _get_recommendations_from_summary, product)
+        reviews_future = _engine_executor.submit(_run_engine, _get_recommendations_from_reviews, product)
+        summary_recs, summary_time_str = summary_future.result()
+        reviews_recs, reviews_time_str = reviews_future.result()
+        total_time = time.time() - start_time
         
         # Parse times
         summary_time = float(summary_time_str.split(' ')[0])
         reviews_time = float(reviews_time_str.split(' ')[0])
         
         # Save performance data
-        num_reviews = product.review_set.count()
+        num_reviews = product.review_count
         RecommendationPerformance.objects.create(
             product_id=product,
             summary_time=summary_time,
             reviews_time=reviews_time,
-            num_reviews=num_reviews
+            num_reviews=num_reviews,
+            total_time=total_time,
         )
         
         # Convert recommendations to JSON-serializable format
-        summary_data = []
-        for rec in summary_recs:
-            summary_data.append({
-                'product_id': rec.product_id,
-                'name': rec.name,
-                'price': str(rec.price),
-                'image_url': rec.image_url,
-            })
-        
-        reviews_data = []
-        for rec in reviews_recs:
-            reviews_data.append({
-                'product_id': rec.product_id,
-                'name': rec.name,
-                'price': str(rec.price),
-                'image_url': rec.image_url,
-            })
+        summary_data = _serialize_recommendations(summary_recs)
+        reviews_data = _serialize_recommendations(reviews_recs)
         
         return JsonResponse({
             'summary_recommendations': summary_data,
@@ -242,6 +309,7 @@ def api_recommendations_both(request, product_id):
             'summary_time': summary_time_str,
             'reviews_time': reviews_time_str,
             'time_saved': "{:.4f} seconds".format(reviews_time - summary_time),
+            'total_time': "{:.4f} seconds".format(total_time),
             'num_reviews': num_reviews,
         })
         
@@ -250,6 +318,259 @@ def api_recommendations_both(request, product_id):
         return JsonResponse({'error': 'Failed to load recommendations'}, status=500)
 
 
+def api_recommendations_engine(request, engine, product_id):
+    """API endpoint for loading the recommendations of a single engine: summary, reviews or lsa."""
+    if engine not in RECOMMENDATION_ENGINES:
+        return JsonResponse({'error': f"Unknown recommendation engine '{engine}'"}, status=404)
+    try:
+        product = get_object_or_404(Product, product_id=product_id)
+        recommendations, time_str = RECOMMENDATION_ENGINES[engine](product)
+
+        return JsonResponse({
+            'engine': engine,
+            'recommendations': _serialize_recommendations(recommendations),
+            'time': time_str,
+        })
+
+    except Exception as e:
+        print(f"Error in api_recommendations_engine: {e}")
+        return JsonResponse({'error': 'Failed to load recommendations'}, status=500)
+
+
+# --- Streamed recommendations ---
+# The streaming endpoint sends each engine's results as a server-sent event as soon as that engine finishes,
+# so the page can show the fast summary engine's results without waiting for the reviews engine.
+# Events: one 'recommendations' event per engine, then a 'done' event with the timings (or an 'error' event).
+
+STREAMED_ENGINES = {
+    'summary': _get_recommendations_from_summary,
+    'reviews': _get_recommendations_from_reviews,
+}
+
+def _sse_event(event, data):
+    """Formats one server-sent event."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+def _engine_event(engine, recommendations, time_str, start_time):
+    return _sse_event('recommendations', {
+        'engine': engine,
+        'recommendations': _serialize_recommendations(recommendations),
+        'time': time_str,
+        'elapsed': "{:.4f} seconds".format(time.time() - start_time),
+    })
+
+def _done_event(times, time_to_first, total_time, num_reviews):
+    summary_time = float(times['summary'].split(' ')[0])
+    reviews_time = float(times['reviews'].split(' ')[0])
+    return _sse_event('done', {
+        'summary_time': times['summary'],
+        'reviews_time': times['reviews'],
+        'time_saved': "{:.4f} seconds".format(reviews_time - summary_time),
+        'time_to_first': "{:.4f} seconds".format(time_to_first),
+        'total_time': "{:.4f} seconds".format(total_time),
+        'num_reviews': num_reviews,
+    })
+
+def _streaming_response(events):
+    response = StreamingHttpResponse(events, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # stop reverse proxies (e.g. nginx) from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+def api_recommendations_stream(request, product_id):
+    """API endpoint streaming each engine's recommendations as server-sent events, fastest engine first."""
+    product = get_object_or_404(Product, product_id=product_id)
+
+    def events():
+        try:
+            start_time = time.time()
+            futures = {
+                _engine_executor.submit(_run_engine, get_recommendations, product): engine
+                for engine, get_recommendations in STREAMED_ENGINES.items()
+            }
+            times = {}
+            time_to_first = None
+            for future in as_completed(futures):
+                engine = futures[future]
+                recommendations, times[engine] = future.result()
+                # taken before the yield, so it measures the engines rather than the write to the client
+                if time_to_first is None:
+                    time_to_first = time.time() - start_time
+                yield _engine_event(engine, recommendations, times[engine], start_time)
+            total_time = time.time() - start_time
+
+            # Save performance data
+            num_reviews = product.review_count
+            RecommendationPerformance.objects.create(
+                product_id=product,
+                summary_time=float(times['summary'].split(' ')[0]),
+                reviews_time=float(times['reviews'].split(' ')[0]),
+                num_reviews=num_reviews,
+                time_to_first=time_to_first,
+                total_time=total_time,
+            )
+            yield _done_event(times, time_to_first, total_time, num_reviews)
+
+        except Exception as e:
+            print(f"Error in api_recommendations_stream: {e}")
+            yield _sse_event('error', {'error': 'Failed to load recommendations'})
+
+    return _streaming_response(events())
+
+
+# --- Async views ---
+# Served in place of search_results, api_reviews and api_recommendations_both when the project runs under
+# ASGI (see ASYNC_VIEWS in settings.py). Database access uses the async ORM, and the engines run on the same
+# thread pool as the sync view, so one ASGI worker can keep many product-page requests in flight.
+
+async def search_results_async(request):
+    """
+    Handles product search queries and displays the results.
+    """
+    query = request.GET.get('q')
+    if query:
+        products = [
+            product async for product in
+            Product.objects.filter(Q(name__icontains=query) | Q(product_id__icontains=query))
+        ]
+
+        # Unescape product names for display
+        for product in products:
+            product.name = _unescape_product_name(product.name)
+
+        context = {'products': products, 'query': query}
+        return render(request, 'search_results.html', context)
+    else:
+        return render(request, 'search_results.html') # Or redirect to homepage with a message
+
+
+async def api_reviews_async(request, product_id, reviews_per_page=5):
+    """API endpoint for loading paginated reviews."""
+    try:
+        product = await aget_object_or_404(Product, product_id=product_id)
+        reviews = product.review_set.all()
+
+        # Pagination - the same page rules as Paginator, which can't be used with the async ORM
+        num_pages = max(1, math.ceil(product.review_count / reviews_per_page))
+        try:
+            page = int(request.GET.get('page', 1))
+        except (TypeError, ValueError):
+            page = 1
+        if page < 1 or page > num_pages:
+            page = num_pages if page > num_pages else 1
+        offset = (page - 1) * reviews_per_page
+
+        # Convert reviews to JSON-serializable format
+        reviews_data = []
+        async for review in reviews[offset:offset + reviews_per_page]:
+            reviews_data.append({
+                'review_text': review.review_text or "No review text",
+            })
+
+        return JsonResponse({
+            'reviews': reviews_data,
+            'has_previous': page > 1,
+            'has_next': page < num_pages,
+            'previous_page_number': page - 1 if page > 1 else None,
+            'next_page_number': page + 1 if page < num_pages else None,
+            'current_page': page,
+            'total_pages': num_pages,
+        })
+    except Exception as e:
+        print(f"Error in api_reviews_async: {e}")
+        return JsonResponse({'error': 'Failed to load reviews'}, status=500)
+
+
+async def api_recommendations_both_async(request, product_id):
+    """API endpoint for loading both types of recommendations and saving performance data."""
+    try:
+        product = await aget_object_or_404(Product, product_id=product_id)
+
+        # Score both engines on the thread pool - the event loop is free to serve other requests meanwhile
+        loop = asyncio.get_running_loop()
+        start_time = time.time()
+        (summary_recs, summary_time_str), (reviews_recs, reviews_time_str) = await asyncio.gather(
+            loop.run_in_executor(_engine_executor, _run_engine, _get_recommendations_from_summary, product),
+            loop.run_in_executor(_engine_executor, _run_engine, _get_recommendations_from_reviews, product),
+        )
+        total_time = time.time() - start_time
+
+        # Parse times
+        summary_time = float(summary_time_str.split(' ')[0])
+        reviews_time = float(reviews_time_str.split(' ')[0])
+
+        # Save performance data
+        num_reviews = product.review_count
+        await RecommendationPerformance.objects.acreate(
+            product_id=product,
+            summary_time=summary_time,
+            reviews_time=reviews_time,
+            num_reviews=num_reviews,
+            total_time=total_time,
+        )
+
+        return JsonResponse({
+            'summary_recommendations': _serialize_recommendations(summary_recs),
+            'reviews_recommendations': _serialize_recommendations(reviews_recs),
+            'summary_time': summary_time_str,
+            'reviews_time': reviews_time_str,
+            'time_saved': "{:.4f} seconds".format(reviews_time - summary_time),
+            'total_time': "{:.4f} seconds".format(total_time),
+            'num_reviews': num_reviews,
+        })
+
+    except Exception as e:
+        print(f"Error in api_recommendations_both_async: {e}")
+        return JsonResponse({'error': 'Failed to load recommendations'}, status=500)
+
+
+async def api_recommendations_stream_async(request, product_id):
+    """API endpoint streaming each engine's recommendations as server-sent events, fastest engine first."""
+    product = await aget_object_or_404(Product, product_id=product_id)
+
+    async def events():
+        try:
+            loop = asyncio.get_running_loop()
+            start_time = time.time()
+
+            async def run(engine, get_recommendations):
+                return engine, await loop.run_in_executor(_engine_executor, _run_engine, get_recommendations, product)
+
+            times = {}
+            time_to_first = None
+            for next_done in asyncio.as_completed([run(*item) for item in STREAMED_ENGINES.items()]):
+                engine, (recommendations, times[engine]) = await next_done
+                # taken before the yield, so it measures the engines rather than the write to the client
+                if time_to_first is None:
+                    time_to_first = time.time() - start_time
+                yield _engine_event(engine, recommendations, times[engine], start_time)
+            total_time = time.time() - start_time
+
+            # Save performance data
+            num_reviews = product.review_count
+            await RecommendationPerformance.objects.acreate(
+                product_id=product,
+                summary_time=float(times['summary'].split(' ')[0]),
+                reviews_time=float(times['reviews'].split(' ')[0]),
+                num_reviews=num_reviews,
+                time_to_first=time_to_first,
+                total_time=total_time,
+            )
+            yield _done_event(times, time_to_first, total_time, num_reviews)
+
+        except Exception as e:
+            print(f"Error in api_recommendations_stream_async: {e}")
+            yield _sse_event('error', {'error': 'Failed to load recommendations'})
+
+    return _streaming_response(events())
+
+
+def api_cache_stats(request):
+    """API endpoint reporting the recommendation cache counters seen by this worker, for monitoring."""
+    return JsonResponse(recommendation_cache.stats())
+
+
 def recommendation_analytics(request):
     """
     Displays analytics on recommendation performance with bar graphs.
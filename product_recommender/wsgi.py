@@ -14,3 +14,8 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'product_recommender.settings')
 
 application = get_wsgi_application()
+
+# Load the offline recommendation models once per worker instead of on the first request
+from product_recommender.recommendation_engine.model_store import preload_models  # noqa: E402
+
+preload_models()